@@ -1,3 +1,72 @@
-from django.test import TestCase
+# accounts/tests.py
 
-# Create your tests here.
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts import views
+from accounts.models import Answer, Question
+from accounts.views import SCORE_FIELDS
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(username="ana", password="senha-segura")
+
+
+@pytest.fixture
+def questions(db):
+    return Question.objects.bulk_create([
+        Question(
+            description=f'Questão {index}', attribute=attribute,
+            first_alternative='Sim', first_alternative_value=1,
+            second_alternative='Não', second_alternative_value=-1,
+            third_alternative='Talvez', third_alternative_value=0,
+        )
+        for index, attribute in enumerate(SCORE_FIELDS * 2)
+    ])
+
+
+def _submit(user, questions, values):
+    client = APIClient()
+    client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(reverse('submit-answers'), {
+            'answers': [
+                {'question_id': str(question.id), 'selected_value': value}
+                for question, value in zip(questions, values)
+            ]
+        }, format='json')
+    inserts = [query['sql'] for query in context.captured_queries if query['sql'].startswith('INSERT INTO "accounts_answer"')]
+    return response, inserts
+
+
+def test_resubmission_updates_answers_in_a_single_upsert(user, questions, monkeypatch):
+    monkeypatch.setattr(views, 'schedule_prewarm', lambda user: None)
+
+    response, inserts = _submit(user, questions, [1] * len(questions))
+    assert response.status_code == 200
+    assert len(inserts) == 1
+
+    # Reenvio: as mesmas linhas são atualizadas, sem duplicar respostas
+    response, inserts = _submit(user, questions, [-1] * len(questions))
+    assert response.status_code == 200
+    assert len(inserts) == 1
+    assert Answer.objects.filter(profile__user=user).count() == len(questions)
+    assert set(Answer.objects.values_list('selected_value', flat=True)) == {-1}
+
+    user.profile.refresh_from_db()
+    assert response.json()['scores'] == dict.fromkeys(SCORE_FIELDS, -2.0)
+    assert [getattr(user.profile, field) for field in SCORE_FIELDS] == [-2.0] * len(SCORE_FIELDS)
+
+
+def test_unknown_question_rejects_whole_submission(user, questions, monkeypatch):
+    monkeypatch.setattr(views, 'schedule_prewarm', lambda user: None)
+    questions[0].delete()
+
+    response, inserts = _submit(user, questions, [1] * len(questions))
+    assert response.status_code == 400
+    assert inserts == []
+    assert not Answer.objects.exists()
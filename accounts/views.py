@@ -1,13 +1,20 @@
 # accounts/views.py
 
+import logging
+
 from django.contrib.auth.models import User
 from django.db import transaction
 from rest_framework import generics, permissions, views, status
 from rest_framework.response import Response
 
+from recommendations.http_cache import CachedCatalogMixin
+from recommendations.services import schedule_prewarm
+
 from .models import Question, Answer, Profile
 from .serializers import UserSerializer, QuestionSerializer, AnswerSubmissionSerializer
 
+logger = logging.getLogger(__name__)
+
 class UserCreateView(generics.CreateAPIView):
     """
     Endpoint para registrar um novo usuário no sistema.
@@ -16,10 +23,11 @@ class UserCreateView(generics.CreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
 
-class QuestionListView(generics.ListAPIView):
+class QuestionListView(CachedCatalogMixin, generics.ListAPIView):
     """
     Endpoint para listar todas as perguntas do questionário Big Five.
     """
+    catalog_name = 'questions'
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -35,10 +43,13 @@ class CheckAnswersView(views.APIView):
         Retorna {"has_submitted": true} se o usuário já enviou respostas,
         e {"has_submitted": false} caso contrário.
         """
-        profile = request.user.profile
-        has_submitted = Answer.objects.filter(profile=profile).exists()
+        has_submitted = Answer.objects.filter(profile__user=request.user).exists()
         return Response({"has_submitted": has_submitted}, status=status.HTTP_200_OK)
 
+# Campos do perfil com os scores do Big Five (os mesmos valores de `Question.PersonalityAttribute`)
+SCORE_FIELDS = [attribute.value for attribute in Question.PersonalityAttribute]
+
+
 class SubmitAnswersView(views.APIView):
     """
     Recebe e processa as respostas do questionário de personalidade de um usuário.
@@ -54,50 +65,49 @@ class SubmitAnswersView(views.APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         answers_data = serializer.validated_data['answers']
-        
-        # --- CORREÇÃO 1 ---
-        # Acessa o ID da questão através do dicionário aninhado
         question_ids = [answer['question']['id'] for answer in answers_data]
-        
-        questions_map = {q.id: q for q in Question.objects.filter(id__in=question_ids)}
 
-        if len(questions_map) != len(answers_data):
-            return Response({"error": "Uma ou mais questões enviadas são inválidas."}, status=status.HTTP_400_BAD_REQUEST)
+        # Só o traço avaliado por cada questão é necessário para os scores
+        attributes = dict(Question.objects.filter(id__in=question_ids).values_list('id', 'attribute'))
 
-        scores = {
-            'openness': 0.0, 'conscientiousness': 0.0, 'extraversion': 0.0,
-            'agreeableness': 0.0, 'neuroticism': 0.0,
-        }
+        if len(attributes) != len(answers_data):
+            return Response({"error": "Uma ou mais questões enviadas são inválidas."}, status=status.HTTP_400_BAD_REQUEST)
 
-        for answer in answers_data:
-            # --- CORREÇÃO 2 ---
-            question = questions_map[answer['question']['id']]
-            scores[question.attribute] += answer['selected_value']
+        # Scores e respostas em uma única passada
+        scores = dict.fromkeys(SCORE_FIELDS, 0.0)
+        answers = []
+        for answer_data in answers_data:
+            question_id = answer_data['question']['id']
+            scores[attributes[question_id]] += answer_data['selected_value']
+            answers.append(Answer(profile=profile, question_id=question_id, selected_value=answer_data['selected_value']))
 
         try:
             with transaction.atomic():
-                for answer_data in answers_data:
-                    Answer.objects.update_or_create(
-                        profile=profile,
-                        # --- CORREÇÃO 3 ---
-                        question_id=answer_data['question']['id'],
-                        defaults={'selected_value': answer_data['selected_value']}
-                    )
-
-                profile.openness = scores['openness']
-                profile.conscientiousness = scores['conscientiousness']
-                profile.extraversion = scores['extraversion']
-                profile.agreeableness = scores['agreeableness']
-                profile.neuroticism = scores['neuroticism']
-                profile.save()
+                # Um único INSERT ... ON CONFLICT para todas as respostas, qualquer que seja o tamanho do questionário
+                Answer.objects.bulk_create(
+                    answers,
+                    update_conflicts=True,
+                    unique_fields=['profile', 'question'],
+                    update_fields=['selected_value'],
+                )
+
+                for field, score in scores.items():
+                    setattr(profile, field, score)
+                profile.save(update_fields=[*SCORE_FIELDS, 'updated_at'])
 
         except Exception as e:
-            print(f"Erro ao salvar respostas e perfil: {e}")
+            logger.exception("Erro ao salvar respostas e perfil: %s", e)
             return Response(
                 {"error": "Ocorreu um erro ao processar suas respostas."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        try:
+            schedule_prewarm(request.user)
+        except Exception as e:
+            # A pré-geração é só uma otimização: a falha não afeta a resposta
+            logger.warning("Erro ao agendar a pré-geração de recomendações: %s", e)
+
         return Response({
             "message": "Respostas computadas com sucesso!",
             "scores": scores
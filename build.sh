@@ -9,6 +9,8 @@ pipenv install --system --deploy
 # Executa os comandos de build do Django
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Cria a tabela do cache compartilhado (CACHE_BACKEND=db)
+python manage.py createcachetable
 # Popula as perguntas do questionário
 python manage.py populate_questions
 
@@ -11,6 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cinemind.settings')
+# Aponta explicitamente para as configurações de produção (assim como o wsgi.py).
+# Em produção, sirva com: uvicorn cinemind.asgi:application --host 0.0.0.0 --port $PORT --workers 4
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cinemind.settings.production')
 
 application = get_asgi_application()
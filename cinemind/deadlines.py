@@ -0,0 +1,48 @@
+# cinemind/deadlines.py
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from integrations.deadline import deadline
+
+
+def request_deadline(request) -> float:
+    """
+    Prazo da requisição, em segundos: `REQUEST_DEADLINE`, ou o valor menor pedido pelo
+    cliente no cabeçalho `X-Request-Timeout` (pedidos maiores ou inválidos são ignorados).
+    """
+    limit = settings.REQUEST_DEADLINE
+    try:
+        asked = float(request.headers.get("X-Request-Timeout", ""))
+    except ValueError:
+        return limit
+    if asked > 0 and (limit <= 0 or asked < limit):
+        return asked
+    return limit
+
+
+class RequestDeadlineMiddleware:
+    """
+    Define o prazo da requisição (`integrations.deadline`): as chamadas ao Gemini e ao TMDb
+    feitas durante a view usam só o tempo que ainda resta dele. O corpo de respostas com
+    streaming é gerado depois que a view retorna e fica fora do prazo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with deadline(request_deadline(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with deadline(request_deadline(request)):
+            return await self.get_response(request)
@@ -0,0 +1,88 @@
+# cinemind/observability.py
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from integrations.metrics import (
+    HTTP_REQUEST_SECONDS, REGISTRY, get_metrics_exporter, server_timing_header, start_request_timings, stop_request_timings,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """
+    Mede cada requisição (`cinemind_http_request_duration_seconds`, por rota) e devolve os
+    spans medidos durante ela no cabeçalho `Server-Timing`. Em respostas com streaming, o
+    cabeçalho sai antes do corpo e só traz as etapas concluídas até ali.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Com METRICS_MULTIPROCESS_DIR, começa a gravar o retrato das métricas deste worker
+        get_metrics_exporter()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = start_request_timings()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = stop_request_timings(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        token = start_request_timings()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = stop_request_timings(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    @staticmethod
+    def _finish(request, response, timings, elapsed):
+        # A rota (ex.: "api/recommendations/sets/<uuid:set_id>/generate-for-mood/") mantém a cardinalidade baixa
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=response.status_code)
+
+        if settings.SERVER_TIMING_ENABLED:
+            response["Server-Timing"] = server_timing_header(timings, total=elapsed)
+        if timings:
+            logger.debug("%s %s %s em %.1f ms (%s)", request.method, route, response.status_code,
+                         elapsed * 1000, server_timing_header(timings))
+        return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Métricas no formato de texto do Prometheus: as do processo ou, com METRICS_MULTIPROCESS_DIR,
+    a soma de todos os processos. Exige `Authorization: Bearer <METRICS_TOKEN>`; sem token
+    configurado, só responde com DEBUG ligado.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+
+    exporter = get_metrics_exporter()
+    body = exporter.render() if exporter is not None else REGISTRY.render()
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
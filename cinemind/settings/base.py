@@ -50,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista: mede a requisição inteira e devolve o cabeçalho Server-Timing
+    "cinemind.observability.ServerTimingMiddleware",
+    # Prazo da requisição, propagado para as chamadas ao Gemini e ao TMDb (REQUEST_DEADLINE)
+    "cinemind.deadlines.RequestDeadlineMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware", # Adicione esta linha
@@ -154,3 +158,92 @@ SIMPLE_JWT = {
 # ATENÇÃO: Isto permitirá que QUALQUER domínio acesse sua API.
 # Use com cuidado e garanta que suas rotas estão devidamente protegidas.
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Cache compartilhado entre os processos (catálogos, blacklist, locks e, com os backends `django`, o
+# governador e o cache de respostas do Gemini). CACHE_BACKEND:
+# - "db": tabela no banco padrão (padrão; criada por `python manage.py createcachetable`)
+# - "redis": servidor em REDIS_URL (requer o pacote `redis`)
+# - "locmem": memória do processo, só para desenvolvimento com um único processo
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "db")
+_CACHE_BACKENDS = {
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": os.getenv("CACHE_TABLE", "cinemind_cache"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "10000"))},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    },
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+CACHES = {"default": _CACHE_BACKENDS[CACHE_BACKEND]}
+
+# Catálogos quase estáticos (gêneros, humores, perguntas): validade da resposta em cache no servidor
+# (invalidada por versão quando os modelos mudam) e `max-age` enviado aos clientes, em segundos
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "86400"))
+CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "300"))
+
+# Blacklist por usuário: validade (em segundos) do filtro em cache (invalidado quando a blacklist muda)
+# e quantos títulos, no máximo, vão no prompt do Gemini (o restante é garantido pelo pós-filtro)
+BLACKLIST_CACHE_TIMEOUT = int(os.getenv("BLACKLIST_CACHE_TIMEOUT", "3600"))
+BLACKLIST_PROMPT_LIMIT = int(os.getenv("BLACKLIST_PROMPT_LIMIT", "20"))
+
+# Histórico de exibição (ShownHistory): filmes exibidos nos últimos SHOWN_HISTORY_DAYS dias (no máximo
+# SHOWN_HISTORY_LIMIT) não são recomendados de novo; os SHOWN_HISTORY_PROMPT_LIMIT mais recentes vão no prompt
+SHOWN_HISTORY_DAYS = int(os.getenv("SHOWN_HISTORY_DAYS", "30"))
+SHOWN_HISTORY_LIMIT = int(os.getenv("SHOWN_HISTORY_LIMIT", "200"))
+SHOWN_HISTORY_PROMPT_LIMIT = int(os.getenv("SHOWN_HISTORY_PROMPT_LIMIT", "20"))
+# Janela recente em cache LRU por processo: quantos usuários e por quantos segundos
+SHOWN_HISTORY_CACHE_SIZE = int(os.getenv("SHOWN_HISTORY_CACHE_SIZE", "1024"))
+SHOWN_HISTORY_CACHE_TTL = float(os.getenv("SHOWN_HISTORY_CACHE_TTL", "60"))
+# Gravação em lote: tamanho do lote e espera máxima (em segundos) antes de gravar; 0 grava a cada resposta
+SHOWN_HISTORY_BATCH_SIZE = int(os.getenv("SHOWN_HISTORY_BATCH_SIZE", "200"))
+SHOWN_HISTORY_FLUSH_INTERVAL = float(os.getenv("SHOWN_HISTORY_FLUSH_INTERVAL", "2"))
+
+# Catálogo local de filmes: idade máxima (em dias) dos dados do TMDb antes de buscá-los novamente
+TMDB_CATALOG_REFRESH_DAYS = int(os.getenv("TMDB_CATALOG_REFRESH_DAYS", "30"))
+# Idade máxima (em dias) de um registro de filme que o TMDb não encontrou antes de buscá-lo novamente
+TMDB_CATALOG_NOT_FOUND_REFRESH_DAYS = int(os.getenv("TMDB_CATALOG_NOT_FOUND_REFRESH_DAYS", "1"))
+
+# Ranqueamento local (NumPy) sobre o catálogo de filmes:
+# - "off": o Gemini escolhe os filmes livremente (padrão)
+# - "shortlist": os melhores candidatos do catálogo são enviados ao Gemini, que apenas os reordena e justifica
+# - "fast": os filmes saem direto do catálogo, sem chamar o Gemini (se houver candidatos suficientes)
+LOCAL_RANKING_MODE = os.getenv("LOCAL_RANKING_MODE", "off")
+LOCAL_RANKING_SHORTLIST_SIZE = int(os.getenv("LOCAL_RANKING_SHORTLIST_SIZE", "12"))
+
+# Pré-geração (opt-in): após o questionário e os gêneros favoritos, gera em segundo plano um set
+# inativo com todos os humores, promovido na próxima criação de set. Requer o `run_generation_worker`.
+PREWARM_RECOMMENDATIONS = os.getenv("PREWARM_RECOMMENDATIONS", "false").lower() in ["1", "true", "yes"]
+# Máximo de jobs de pré-geração em execução ao mesmo tempo, somando todos os workers
+PREWARM_MAX_CONCURRENCY = int(os.getenv("PREWARM_MAX_CONCURRENCY", "2"))
+
+# Observabilidade: `/metrics` (formato do Prometheus) e cabeçalho `Server-Timing` com a duração de
+# cada etapa da requisição. `/metrics` exige `Authorization: Bearer <METRICS_TOKEN>`; sem o token, só
+# responde com DEBUG ligado. Os valores são por processo; com METRICS_MULTIPROCESS_DIR (lido em
+# integrations/metrics.py), cada processo grava neles um retrato e `/metrics` devolve a soma.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ["1", "true", "yes"]
+
+# Prazo de cada requisição, em segundos (0 desativa): as chamadas ao Gemini e ao TMDb usam como timeout
+# só o tempo que ainda resta dele. O cliente pode pedir um prazo menor com o cabeçalho X-Request-Timeout.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "45"))
+
+# Logs da aplicação (erros das integrações, gerações, jobs) no console, com nível ajustável por LOG_LEVEL
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "default"},
+    },
+    "loggers": {
+        name: {"handlers": ["console"], "level": os.getenv("LOG_LEVEL", "INFO"), "propagate": False}
+        for name in ("accounts", "recommendations", "integrations", "cinemind")
+    },
+}
@@ -1,3 +1,6 @@
 from cinemind.settings.base import *
 
 ALLOWED_HOSTS = ["*"]
+
+# Ferramentas de desenvolvimento (benchmarks e serviços simulados); fora das configurações de produção
+INSTALLED_APPS += ['devtools']
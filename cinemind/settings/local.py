@@ -21,4 +21,7 @@ DATABASES = {
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
     }
-}
\ No newline at end of file
+}
+
+# Ferramentas de desenvolvimento (benchmarks e serviços simulados); fora das configurações de produção
+INSTALLED_APPS += ['devtools']
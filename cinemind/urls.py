@@ -21,6 +21,8 @@ from django.urls import path, include # Adicione 'include'
 # --- NOVAS IMPORTAÇÕES ---
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from cinemind.observability import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -34,4 +36,7 @@ urlpatterns = [
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     # Opção 2: Documentação visual com ReDoc (alternativa)
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+
+    # Métricas do processo para o Prometheus
+    path('metrics', metrics_view, name='metrics'),
 ]#
\ No newline at end of file
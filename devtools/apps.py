@@ -0,0 +1,12 @@
+# devtools/apps.py
+
+from django.apps import AppConfig
+
+
+class DevtoolsConfig(AppConfig):
+    """
+    Ferramentas de desenvolvimento (benchmarks e serviços externos simulados). Só entra no
+    INSTALLED_APPS das configurações `local` e `development`; nada aqui é importado pela aplicação.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'devtools'
@@ -0,0 +1,410 @@
+# devtools/fake_servers.py
+
+"""
+Servidores HTTP locais que imitam o Gemini e o TMDb, para testes de carga sem rede, cota ou custo.
+Cada um tem um perfil de latência e de erros configurável. Aponte a aplicação para eles com
+`GEMINI_BASE_URL` e `TMDB_BASE_URL` (ver `FakeServices.env`).
+
+O Gemini simulado também imita o cache de contexto (`cachedContents`) e o custo do prefill:
+os tokens de entrada são estimados (~4 caracteres por token) e cada 1k tokens fora do cache
+atrasa o primeiro byte da resposta em `prefill_ms_per_1k` ms.
+"""
+
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+_GEMINI_PATH = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$")
+_CACHE_PATH = re.compile(r"^/v1beta/(?P<name>cachedContents(?:/[^/]+)?)$")
+_SINGLE_MOOD = re.compile(r"humor específico: \*\*'(?P<mood>.+?)'\*\*")
+_MOOD_LIST = re.compile(r"humores a seguir.*?\*\*: \*\*(?P<moods>'.+?')\*\*")
+
+# Gêneros do TMDb atribuídos aos filmes simulados
+_TMDB_GENRE_IDS = [12, 14, 16, 18, 27, 28, 35, 53, 80, 99, 878, 9648, 10749, 10751]
+
+
+class LatencyProfile(NamedTuple):
+    """
+    Latência (média e variação, em ms) e fração de respostas com erro de um serviço simulado.
+    Uma fração `slow_rate` das respostas demora `slow_ms` a mais (cauda de latência).
+    """
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_ms: float = 0.0
+
+    def delay_ms(self) -> float:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if random.random() < self.slow_rate:
+            delay += self.slow_ms
+        return max(delay, 0.0)
+
+    def sleep(self, fraction: float = 1.0, delay_ms: Optional[float] = None) -> None:
+        time.sleep((self.delay_ms() if delay_ms is None else delay_ms) * fraction / 1000)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, profile: LatencyProfile, title_prefix: str):
+        super().__init__(address, handler)
+        self.profile = profile
+        self.title_prefix = title_prefix
+        self.titles = itertools.count(1)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # O cliente desistiu da resposta (ex.: estourou o prazo): não é uma falha do servidor simulado
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, error: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class GeminiCall(NamedTuple):
+    """
+    Uma chamada atendida pelo Gemini simulado: modelo, tokens de entrada (total e vindos do
+    cache) e tempo, em segundos, entre a chegada da requisição e o primeiro byte da resposta.
+    """
+    model: str
+    prompt_tokens: int
+    cached_tokens: int
+    ttft: float
+
+
+class _FakeGeminiServer(_FakeServer):
+    def __init__(self, address, handler, profile: LatencyProfile, title_prefix: str,
+                 prefill_ms_per_1k: float = 0.0, min_cache_tokens: int = 0,
+                 model_profiles: Optional[Dict[str, LatencyProfile]] = None,
+                 low_quality_rates: Optional[Dict[str, float]] = None):
+        super().__init__(address, handler, profile, title_prefix)
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.min_cache_tokens = min_cache_tokens
+        # Perfis de latência e fração de respostas fracas (2 filmes por humor) por modelo
+        self.model_profiles = model_profiles or {}
+        self.low_quality_rates = low_quality_rates or {}
+        # Caches de contexto criados: nome -> tokens do conteúdo
+        self.cached_contents: Dict[str, int] = {}
+        self.calls: List[GeminiCall] = []
+
+    def profile_for(self, model: str) -> LatencyProfile:
+        return self.model_profiles.get(model, self.profile)
+
+    def record_call(self, call: GeminiCall) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def prefill(self, uncached_tokens: int) -> None:
+        time.sleep(self.prefill_ms_per_1k * uncached_tokens / 1000 / 1000)
+
+
+class _BaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Sem uma linha de log por requisição durante a carga
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _estimate_tokens(value: Any) -> int:
+    """
+    Estimativa grosseira de tokens (~4 caracteres cada) de um texto ou trecho da requisição.
+    """
+    if value is None:
+        return 0
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return len(text) // 4
+
+
+def _requested_moods(prompt: str) -> List[str]:
+    """
+    Humores pedidos no prompt montado por `GeminiService._build_user_prompt`.
+    """
+    single = _SINGLE_MOOD.search(prompt)
+    if single:
+        return [single.group("mood")]
+    batch = _MOOD_LIST.search(prompt)
+    if batch:
+        return re.findall(r"'([^']+)'", batch.group("moods")) or ["Humor"]
+    return ["Humor"]
+
+
+class FakeGeminiHandler(_BaseHandler):
+    """
+    `generateContent` e `streamGenerateContent` (SSE) da API REST do Gemini: 3 filmes com
+    títulos sempre novos para cada humor pedido no prompt. Também atende `cachedContents`
+    (criar, consultar, renovar e apagar).
+    """
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_error(self, code: int, status: str, message: str) -> None:
+        self._send_json(code, {"error": {"code": code, "message": message, "status": status}})
+
+    def _cached_content(self, name: str) -> dict:
+        return {
+            "name": name,
+            "model": "models/fake",
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600)),
+            "usageMetadata": {"totalTokenCount": self.server.cached_contents[name]},
+        }
+
+    def _handle_cache(self, method: str, name: str, request: Optional[dict] = None) -> None:
+        cached_contents = self.server.cached_contents
+        if name == "cachedContents":
+            if method != "POST":
+                self._send_error(405, "INVALID_ARGUMENT", "Método não suportado.")
+                return
+            tokens = _estimate_tokens(request.get("systemInstruction")) + _estimate_tokens(request.get("contents"))
+            if tokens < self.server.min_cache_tokens:
+                self._send_error(400, "INVALID_ARGUMENT", f"Cached content is too small. total_token_count={tokens}, "
+                                                          f"min_total_token_count={self.server.min_cache_tokens}")
+                return
+            name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+            cached_contents[name] = tokens
+            self._send_json(200, self._cached_content(name))
+        elif name not in cached_contents:
+            self._send_error(404, "NOT_FOUND", f"CachedContent not found: {name}")
+        elif method == "DELETE":
+            del cached_contents[name]
+            self._send_json(200, {})
+        else:
+            self._send_json(200, self._cached_content(name))
+
+    def do_GET(self):
+        match = _CACHE_PATH.match(urlparse(self.path).path)
+        if not match:
+            self._send_error(404, "NOT_FOUND", "Rota desconhecida.")
+            return
+        self._handle_cache("GET", match.group("name"))
+
+    def do_PATCH(self):
+        request = self._read_json()
+        match = _CACHE_PATH.match(urlparse(self.path).path)
+        if not match:
+            self._send_error(404, "NOT_FOUND", "Rota desconhecida.")
+            return
+        self._handle_cache("PATCH", match.group("name"), request)
+
+    def do_DELETE(self):
+        match = _CACHE_PATH.match(urlparse(self.path).path)
+        if not match:
+            self._send_error(404, "NOT_FOUND", "Rota desconhecida.")
+            return
+        self._handle_cache("DELETE", match.group("name"))
+
+    def do_POST(self):
+        received_at = time.perf_counter()
+        path = urlparse(self.path).path
+        request = self._read_json()
+        cache_match = _CACHE_PATH.match(path)
+        if cache_match:
+            self._handle_cache("POST", cache_match.group("name"), request)
+            return
+        match = _GEMINI_PATH.match(path)
+        if not match:
+            self._send_error(404, "NOT_FOUND", "Rota desconhecida.")
+            return
+
+        cached_content = request.get("cachedContent")
+        if cached_content and cached_content not in self.server.cached_contents:
+            self._send_error(404, "NOT_FOUND", f"CachedContent not found: {cached_content}")
+            return
+
+        model = match.group("model")
+        profile = self.server.profile_for(model)
+        if profile.fails():
+            profile.sleep()
+            self.server.count(error=True)
+            self._send_json(503, {"error": {"code": 503, "message": "Gemini simulado indisponível.", "status": "UNAVAILABLE"}})
+            return
+
+        prompt = " ".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        movies = 2 if random.random() < self.server.low_quality_rates.get(model, 0.0) else 3
+        text = json.dumps({"recommendations": [self._mood_block(mood, movies) for mood in _requested_moods(prompt)]}, ensure_ascii=False)
+        self.server.count(error=False)
+
+        cached_tokens = self.server.cached_contents.get(cached_content, 0)
+        uncached_tokens = (_estimate_tokens(request.get("systemInstruction")) + _estimate_tokens(request.get("contents"))
+                           + _estimate_tokens(request.get("generationConfig", {}).get("responseSchema")))
+        usage = {"promptTokenCount": cached_tokens + uncached_tokens, "cachedContentTokenCount": cached_tokens}
+        self.server.prefill(uncached_tokens)
+
+        if match.group("method") == "generateContent":
+            profile.sleep()
+            self.server.record_call(GeminiCall(model, usage["promptTokenCount"], cached_tokens, time.perf_counter() - received_at))
+            self._send_json(200, self._response(model, text, usage))
+        else:
+            self._stream(model, text, usage, received_at, profile)
+
+    def _mood_block(self, mood: str, movies: int = 3) -> dict:
+        return {
+            "mood": mood,
+            "movies": [
+                {
+                    "rank": rank,
+                    "title": f"{self.server.title_prefix} {next(self.server.titles)}",
+                    "year": random.randint(1970, 2024),
+                    "synopsis": "Sinopse gerada pelo Gemini simulado.",
+                    "reason_for_recommendation": "Recomendação gerada pelo Gemini simulado.",
+                    "tags": ["Drama"],
+                }
+                for rank in range(1, movies + 1)
+            ],
+        }
+
+    @staticmethod
+    def _response(model: str, text: str, usage: Dict[str, int]) -> dict:
+        candidates_tokens = _estimate_tokens(text)
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {**usage, "candidatesTokenCount": candidates_tokens,
+                              "totalTokenCount": usage["promptTokenCount"] + candidates_tokens},
+            "modelVersion": model,
+        }
+
+    def _stream(self, model: str, text: str, usage: Dict[str, int], received_at: float,
+                profile: LatencyProfile, chunks: int = 4) -> None:
+        # Metade da latência até o primeiro pedaço e o restante distribuído entre os demais
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        size = -(-len(text) // chunks)
+        delay_ms = profile.delay_ms()
+        profile.sleep(0.5, delay_ms)
+        for index in range(chunks):
+            if index:
+                profile.sleep(0.5 / (chunks - 1), delay_ms)
+            payload = json.dumps(self._response(model, text[index * size:(index + 1) * size], usage), ensure_ascii=False)
+            self.wfile.write(f"data: {payload}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            if not index:
+                self.server.record_call(GeminiCall(model, usage["promptTokenCount"], usage["cachedContentTokenCount"],
+                                                   time.perf_counter() - received_at))
+
+
+class FakeTMDbHandler(_BaseHandler):
+    """
+    `GET /3/search/movie` do TMDb: sempre encontra o filme buscado, com o ano pedido.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/3/search/movie":
+            self._send_json(404, {"status_code": 34, "status_message": "Rota desconhecida."})
+            return
+
+        profile = self.server.profile
+        profile.sleep()
+        if profile.fails():
+            self.server.count(error=True)
+            self._send_json(503, {"status_code": 43, "status_message": "TMDb simulado indisponível."})
+            return
+
+        params = parse_qs(url.query)
+        title = params.get("query", [""])[0]
+        year = params.get("year", ["2000"])[0]
+        self.server.count(error=False)
+        self._send_json(200, {"page": 1, "total_results": 1, "results": [{
+            "id": abs(hash((title, year))) % 10_000_000,
+            "title": title,
+            "original_title": title,
+            "release_date": f"{year}-01-01",
+            "poster_path": "/fake-poster.jpg",
+            "overview": "Sinopse do TMDb simulado.",
+            "genre_ids": random.sample(_TMDB_GENRE_IDS, 2),
+            "vote_average": round(random.uniform(5, 9), 1),
+            "vote_count": random.randint(50, 5000),
+            "popularity": round(random.uniform(1, 100), 1),
+        }]})
+
+
+class FakeServices:
+    """
+    Sobe o Gemini e o TMDb simulados em threads (portas livres de `host`) enquanto o contexto estiver aberto.
+    Os filmes gerados têm títulos começando com `title_prefix`, para que possam ser removidos depois.
+    `gemini_models` troca o perfil de latência de modelos específicos e `gemini_low_quality` dá,
+    por modelo, a fração de respostas com só 2 filmes por humor.
+    """
+
+    def __init__(self, gemini: LatencyProfile, tmdb: LatencyProfile, title_prefix: str, host: str = "127.0.0.1",
+                 gemini_prefill_ms_per_1k: float = 0.0, gemini_min_cache_tokens: int = 0,
+                 gemini_models: Optional[Dict[str, LatencyProfile]] = None,
+                 gemini_low_quality: Optional[Dict[str, float]] = None):
+        self.gemini = _FakeGeminiServer((host, 0), FakeGeminiHandler, gemini, title_prefix,
+                                        prefill_ms_per_1k=gemini_prefill_ms_per_1k, min_cache_tokens=gemini_min_cache_tokens,
+                                        model_profiles=gemini_models, low_quality_rates=gemini_low_quality)
+        self.tmdb = _FakeServer((host, 0), FakeTMDbHandler, tmdb, title_prefix)
+        self._threads: List[threading.Thread] = []
+
+    def __enter__(self) -> "FakeServices":
+        for server in (self.gemini, self.tmdb):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for server in (self.gemini, self.tmdb):
+            server.shutdown()
+            server.server_close()
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """
+        Variáveis de ambiente que apontam a aplicação para os serviços simulados.
+        """
+        return {
+            "GEMINI_BASE_URL": self.gemini.url,
+            "TMDB_BASE_URL": f"{self.tmdb.url}/3",
+            "GEMINI_API_KEY": "fake-gemini-key",
+            "TMDB_API_KEY": "fake-tmdb-key",
+        }
+
+    @property
+    def gemini_calls(self) -> List[GeminiCall]:
+        return list(self.gemini.calls)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {
+            "gemini_requests": self.gemini.requests, "gemini_errors": self.gemini.errors,
+            "tmdb_requests": self.tmdb.requests, "tmdb_errors": self.tmdb.errors,
+        }
@@ -0,0 +1,472 @@
+# devtools/management/commands/benchmark_flow.py
+
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+import httpx
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+import integrations.gemini.client as gemini_client
+from accounts.models import Question
+from devtools.fake_servers import FakeServices, GeminiCall, LatencyProfile
+from integrations.gemini.routing import FAST_MODEL
+from integrations.tmdb.client import TMDbClient
+from recommendations.models import Movie
+
+PASSWORD = 'benchmark-flow-password'
+
+# Raiz do projeto (onde fica o manage.py), de onde os servidores importam `cinemind`
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+# Modos de implantação: comando do servidor (recebe porta e workers) e sufixo do endpoint de geração
+DEPLOYMENT_MODES = {
+    'wsgi': (
+        lambda port, workers: [
+            sys.executable, '-m', 'gunicorn', 'cinemind.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '120',
+        ],
+        '',
+    ),
+    'asgi': (
+        lambda port, workers: [
+            sys.executable, '-m', 'uvicorn', 'cinemind.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log',
+        ],
+        'async/',
+    ),
+}
+
+
+class FlowError(Exception):
+    pass
+
+
+def run_flow(send: Callable, username: str, generate_suffix: str) -> None:
+    """
+    Fluxo completo de um usuário novo: cadastro → login → questionário → gêneros favoritos →
+    novo set → geração para um humor. `send(step, method, path, data, token)` executa cada
+    requisição e retorna o JSON da resposta (lança `FlowError` se ela falhar).
+    """
+    send('register', 'post', '/api/accounts/register/',
+         {'username': username, 'email': f'{username}@example.com', 'password': PASSWORD})
+    token = send('token', 'post', '/api/accounts/token/', {'username': username, 'password': PASSWORD})['access']
+
+    questions = send('questions', 'get', '/api/accounts/questions/', token=token)
+    send('submit-answers', 'post', '/api/accounts/answers/submit/', {'answers': [
+        {'question_id': question['id'], 'selected_value': random.choice(
+            [question['first_alternative_value'], question['second_alternative_value'], question['third_alternative_value']]
+        )}
+        for question in questions
+    ]}, token)
+
+    genres = send('genres', 'get', '/api/recommendations/genres/', token=token)
+    send('set-favorite-genres', 'post', '/api/recommendations/genres/set-favorites/',
+         {'genre_ids': [genre['id'] for genre in random.sample(genres, min(3, len(genres)))]}, token)
+
+    recommendation_set = send('create-set', 'post', '/api/recommendations/sets/', {}, token)
+    moods = send('moods', 'get', '/api/recommendations/moods/', token=token)
+    send('generate-for-mood', 'post', f"/api/recommendations/sets/{recommendation_set['id']}/generate-for-mood/{generate_suffix}",
+         {'mood_id': random.choice(moods)['id']}, token)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """
+    p50/p95/p99 (nearest-rank), média e máximo, em ms.
+    """
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)], 1)
+
+    return {
+        'count': len(ordered), 'p50': rank(50), 'p95': rank(95), 'p99': rank(99),
+        'mean': round(sum(ordered) / len(ordered), 1), 'max': round(ordered[-1], 1),
+    }
+
+
+class RssSampler:
+    """
+    Amostra o RSS (via /proc, só Linux) do servidor e de todos os seus processos filhos
+    enquanto a carga roda. Registra o pico da soma e o pico de um único processo.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_total_kb = 0
+        self.peak_process_kb = 0
+        self.supported = Path('/proc/self/status').exists()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.supported:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self.supported:
+            self._thread.join()
+
+    def _tree(self, pid: int) -> List[int]:
+        pids = [pid]
+        for task in Path(f'/proc/{pid}/task').glob('*/children'):
+            with contextlib.suppress(OSError):
+                for child in task.read_text().split():
+                    pids += self._tree(int(child))
+        return pids
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        with contextlib.suppress(OSError):
+            for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            sizes = [self._rss_kb(pid) for pid in self._tree(self.pid)]
+            self.peak_total_kb = max(self.peak_total_kb, sum(sizes))
+            self.peak_process_kb = max([self.peak_process_kb, *sizes])
+            self._stop.wait(self.interval)
+
+    def result(self) -> Optional[Dict[str, float]]:
+        if not self.supported:
+            return None
+        return {'total': round(self.peak_total_kb / 1024, 1), 'max_process': round(self.peak_process_kb / 1024, 1)}
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do fluxo cadastro → questionário → gêneros → set → geração para um humor, '
+        'contra um Gemini e um TMDb simulados (latência e erros configuráveis), com o app servido '
+        'por gunicorn (wsgi) e/ou uvicorn (asgi). Reporta latência p50/p95/p99 por etapa, requisições '
+        'por segundo por worker, consultas SQL por requisição, pico de RSS e, por chamada ao Gemini, '
+        'tokens de entrada cobrados, tempo até o primeiro token e chamadas por modelo, em JSON. '
+        'Use um banco descartável: os usuários e filmes criados são removidos no fim, mas a carga é real.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(DEPLOYMENT_MODES), default=list(DEPLOYMENT_MODES),
+                            help='Modos de implantação comparados (padrão: wsgi asgi).')
+        parser.add_argument('--workers', type=int, default=2, help='Workers do servidor (padrão 2).')
+        parser.add_argument('--concurrency', type=int, default=8, help='Usuários simultâneos (padrão 8).')
+        parser.add_argument('--flows', type=int, default=40, help='Fluxos completos por modo (padrão 40).')
+        parser.add_argument('--warmup', type=int, default=2, help='Fluxos de aquecimento, fora das estatísticas (padrão 2).')
+        parser.add_argument('--port', type=int, default=0, help='Porta do servidor (padrão: uma porta livre).')
+        parser.add_argument('--gemini-latency', type=float, default=800, help='Latência média do Gemini simulado, em ms (padrão 800).')
+        parser.add_argument('--gemini-jitter', type=float, default=200, help='Variação da latência do Gemini, em ms (padrão 200).')
+        parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='Fração de respostas 503 do Gemini (padrão 0).')
+        parser.add_argument('--gemini-slow-rate', type=float, default=0.0,
+                            help='Fração de respostas lentas do Gemini, a cauda de latência (padrão 0).')
+        parser.add_argument('--gemini-slow-ms', type=float, default=5000, help='Atraso extra das respostas lentas do Gemini, em ms (padrão 5000).')
+        parser.add_argument('--gemini-prefill-ms', type=float, default=100,
+                            help='Atraso do Gemini simulado por 1k tokens de entrada fora do cache de contexto, em ms (padrão 100).')
+        parser.add_argument('--gemini-min-cache-tokens', type=int, default=0,
+                            help='Mínimo de tokens aceito pelo cache de contexto simulado (padrão 0; o Gemini real exige 1024 ou mais).')
+        parser.add_argument('--context-cache', choices=['on', 'off'], default='on',
+                            help='Cache de contexto do system instruction nos servidores medidos (GEMINI_CONTEXT_CACHE; padrão on).')
+        parser.add_argument('--routing', choices=['on', 'off'], default='on',
+                            help=f'Roteamento que tenta primeiro o modelo rápido ({FAST_MODEL or "GEMINI_FAST_MODEL"}; padrão on).')
+        parser.add_argument('--gemini-fast-latency', type=float, default=300,
+                            help='Latência média do modelo rápido no Gemini simulado, em ms (padrão 300).')
+        parser.add_argument('--gemini-fast-jitter', type=float, default=80, help='Variação da latência do modelo rápido, em ms (padrão 80).')
+        parser.add_argument('--gemini-fast-low-quality-rate', type=float, default=0.1,
+                            help='Fração de respostas fracas (2 filmes por humor) do modelo rápido, que forçam a escalada (padrão 0.1).')
+        parser.add_argument('--tmdb-latency', type=float, default=40, help='Latência média do TMDb simulado, em ms (padrão 40).')
+        parser.add_argument('--tmdb-jitter', type=float, default=10, help='Variação da latência do TMDb, em ms (padrão 10).')
+        parser.add_argument('--tmdb-error-rate', type=float, default=0.0, help='Fração de respostas 503 do TMDb (padrão 0).')
+        parser.add_argument('--tmdb-slow-rate', type=float, default=0.0,
+                            help='Fração de respostas lentas do TMDb, a cauda de latência (padrão 0).')
+        parser.add_argument('--tmdb-slow-ms', type=float, default=2000, help='Atraso extra das respostas lentas do TMDb, em ms (padrão 2000).')
+        parser.add_argument('--hedging', choices=['off', 'tmdb', 'all'], default='tmdb',
+                            help='Hedging das chamadas externas: desligado, só no TMDb (padrão, como em produção) ou também no Gemini.')
+        parser.add_argument('--deadline', type=float, default=None,
+                            help='Prazo de cada requisição, em segundos (padrão: REQUEST_DEADLINE das configurações).')
+        parser.add_argument('--output', help='Arquivo JSON com o resultado (padrão: só o resumo no terminal; "-" imprime o JSON).')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        prefix = f'bench-{run_id}'
+        gemini = LatencyProfile(options['gemini_latency'], options['gemini_jitter'], options['gemini_error_rate'],
+                                options['gemini_slow_rate'], options['gemini_slow_ms'])
+        fast_gemini = LatencyProfile(options['gemini_fast_latency'], options['gemini_fast_jitter'], options['gemini_error_rate'],
+                                     options['gemini_slow_rate'], options['gemini_slow_ms'])
+        tmdb = LatencyProfile(options['tmdb_latency'], options['tmdb_jitter'], options['tmdb_error_rate'],
+                              options['tmdb_slow_rate'], options['tmdb_slow_ms'])
+
+        # O fluxo responde o questionário inteiro: sem perguntas, essa etapa não mediria nada
+        if not Question.objects.exists():
+            call_command('populate_questions', stdout=io.StringIO())
+
+        result = {
+            'version': 1,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'git_commit': self._git_commit(),
+            'python': platform.python_version(),
+            'settings_module': os.environ.get('DJANGO_SETTINGS_MODULE'),
+            'database': connection.vendor,
+            'config': {key: options[key] for key in (
+                'modes', 'workers', 'concurrency', 'flows', 'warmup', 'gemini_latency', 'gemini_jitter',
+                'gemini_error_rate', 'gemini_prefill_ms', 'gemini_min_cache_tokens', 'context_cache',
+                'routing', 'gemini_fast_latency', 'gemini_fast_jitter', 'gemini_fast_low_quality_rate', 'tmdb_latency', 'tmdb_jitter', 'tmdb_error_rate',
+                'gemini_slow_rate', 'gemini_slow_ms', 'tmdb_slow_rate', 'tmdb_slow_ms', 'hedging', 'deadline',
+            )},
+            'modes': {},
+        }
+
+        try:
+            with FakeServices(gemini, tmdb, title_prefix=f'Filme {prefix}',
+                              gemini_prefill_ms_per_1k=options['gemini_prefill_ms'],
+                              gemini_min_cache_tokens=options['gemini_min_cache_tokens'],
+                              gemini_models={FAST_MODEL: fast_gemini} if FAST_MODEL else None,
+                              gemini_low_quality={FAST_MODEL: options['gemini_fast_low_quality_rate']} if FAST_MODEL else None) as fakes:
+                result['queries_per_request'] = self._count_queries(fakes, prefix)
+                for mode in options['modes']:
+                    self.stdout.write(f'Modo {mode}: {options["flows"]} fluxos, {options["concurrency"]} usuários simultâneos...')
+                    result['modes'][mode] = self._run_mode(mode, fakes, prefix, options)
+                result['fake_services'] = fakes.stats()
+        finally:
+            # Remove os dados da carga (os usuários levam junto sets, itens, respostas e histórico)
+            User.objects.filter(username__startswith=prefix).delete()
+            Movie.objects.filter(title__startswith=f'Filme {prefix}').delete()
+
+        self._print_summary(result)
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+        elif options['output']:
+            Path(options['output']).write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Resultado salvo em {options["output"]}'))
+
+    @staticmethod
+    def _git_commit() -> Optional[str]:
+        with contextlib.suppress(OSError, subprocess.SubprocessError):
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=PROJECT_ROOT, check=True
+            ).stdout.strip()
+        return None
+
+    def _count_queries(self, fakes: FakeServices, prefix: str) -> Dict[str, int]:
+        """
+        Consultas SQL de cada etapa, medidas uma vez no próprio processo (APIClient) contra os
+        serviços simulados, em uma transação desfeita no fim. Não dependem do modo de implantação.
+        """
+        counts = {}
+
+        def send(step, method, path, data=None, token=None):
+            client = APIClient()
+            if token:
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            with CaptureQueriesContext(connection) as context:
+                response = getattr(client, method)(path, data, format='json')
+            if response.status_code >= 400:
+                raise CommandError(f'{step} respondeu {response.status_code}: {response.content[:500]!r}')
+            counts[step] = len(context.captured_queries)
+            return response.json()
+
+        with contextlib.ExitStack() as stack, transaction.atomic():
+            stack.enter_context(mock.patch.dict(os.environ, {**fakes.env, 'GEMINI_CACHE_BACKEND': 'none'}))
+            stack.enter_context(mock.patch.object(gemini_client, 'BASE_URL', fakes.env['GEMINI_BASE_URL']))
+            stack.enter_context(mock.patch.object(TMDbClient, 'BASE_URL', fakes.env['TMDB_BASE_URL']))
+            stack.enter_context(override_settings(ALLOWED_HOSTS=['testserver'], PREWARM_RECOMMENDATIONS=False))
+            run_flow(send, f'{prefix}-queries', '')
+            transaction.set_rollback(True)
+        return counts
+
+    def _run_mode(self, mode: str, fakes: FakeServices, prefix: str, options) -> dict:
+        command, generate_suffix = DEPLOYMENT_MODES[mode]
+        port = options['port'] or self._free_port()
+        workers = max(options['workers'], 1)
+        env = {
+            **os.environ, **fakes.env,
+            # Toda geração passa pelo Gemini simulado e nada roda em segundo plano durante a medição
+            'GEMINI_CACHE_BACKEND': 'none', 'PREWARM_RECOMMENDATIONS': 'false', 'PYTHONUNBUFFERED': '1',
+            'GEMINI_CONTEXT_CACHE': 'true' if options['context_cache'] == 'on' else 'false',
+            'GEMINI_FAST_MODEL': FAST_MODEL if options['routing'] == 'on' else '',
+            'TMDB_HEDGE': 'false' if options['hedging'] == 'off' else 'true',
+            'GEMINI_HEDGE': 'true' if options['hedging'] == 'all' else 'false',
+        }
+        if options['deadline'] is not None:
+            env['REQUEST_DEADLINE'] = str(options['deadline'])
+        base_url = f'http://127.0.0.1:{port}'
+
+        try:
+            server = subprocess.Popen(command(port, workers), env=env, cwd=PROJECT_ROOT,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+        except OSError as e:
+            raise CommandError(f'Não foi possível iniciar o servidor {mode}: {e}')
+
+        try:
+            self._wait_ready(server, base_url)
+            latencies: Dict[str, List[float]] = defaultdict(list)
+            errors: Dict[str, int] = defaultdict(int)
+            lock = threading.Lock()
+
+            def one_flow(index, record=True):
+                with httpx.Client(base_url=base_url, timeout=120) as http:
+                    def send(step, method, path, data=None, token=None):
+                        headers = {'Authorization': f'Bearer {token}'} if token else {}
+                        started = time.perf_counter()
+                        try:
+                            response = http.request(method.upper(), path, json=data if method != 'get' else None, headers=headers)
+                        except httpx.HTTPError as e:
+                            response = None
+                            failure = str(e)
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if record:
+                            with lock:
+                                latencies[step].append(elapsed)
+                                if response is None or response.status_code >= 400:
+                                    errors[step] += 1
+                        if response is None:
+                            raise FlowError(f'{step}: {failure}')
+                        if response.status_code >= 400:
+                            raise FlowError(f'{step}: HTTP {response.status_code}')
+                        return response.json()
+
+                    try:
+                        run_flow(send, f'{prefix}-{mode}-{index}', generate_suffix)
+                        return True
+                    except FlowError:
+                        return False
+
+            for index in range(options['warmup']):
+                one_flow(f'warmup-{index}', record=False)
+
+            # Só as chamadas ao Gemini feitas durante a medição
+            first_call = len(fakes.gemini_calls)
+            with RssSampler(server.pid) as rss, ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as pool:
+                started = time.perf_counter()
+                outcomes = list(pool.map(one_flow, range(options['flows'])))
+                duration = time.perf_counter() - started
+            gemini_calls = fakes.gemini_calls[first_call:]
+        finally:
+            self._stop(server)
+
+        requests_made = sum(len(values) for values in latencies.values())
+        return {
+            'workers': workers,
+            'duration_s': round(duration, 2),
+            'flows': len(outcomes),
+            'failed_flows': outcomes.count(False),
+            'requests': requests_made,
+            'requests_per_second': round(requests_made / duration, 2),
+            'requests_per_second_per_worker': round(requests_made / duration / workers, 2),
+            'flows_per_second': round(len(outcomes) / duration, 2),
+            'latency_ms': {
+                'all': percentiles([value for values in latencies.values() for value in values]),
+                **{step: percentiles(values) for step, values in latencies.items()},
+            },
+            'errors': dict(errors),
+            'peak_rss_mb': rss.result(),
+            'gemini': self._gemini_usage(gemini_calls),
+        }
+
+    @staticmethod
+    def _gemini_usage(calls: List[GeminiCall]) -> dict:
+        """
+        Média de tokens de entrada por chamada (total, vindos do cache de contexto e cobrados
+        integralmente), tempo até o primeiro token e, por modelo, chamadas e latência,
+        medidos pelo Gemini simulado.
+        """
+        count = len(calls)
+        by_model: Dict[str, List[GeminiCall]] = defaultdict(list)
+        for call in calls:
+            by_model[call.model].append(call)
+
+        def mean(values):
+            return round(sum(values) / count, 1) if count else None
+
+        return {
+            'calls': count,
+            'prompt_tokens': mean([call.prompt_tokens for call in calls]),
+            'cached_tokens': mean([call.cached_tokens for call in calls]),
+            'billed_input_tokens': mean([call.prompt_tokens - call.cached_tokens for call in calls]),
+            'ttft_ms': percentiles([call.ttft * 1000 for call in calls]),
+            'models': {model: {'calls': len(model_calls), 'ttft_ms': percentiles([call.ttft * 1000 for call in model_calls])}
+                       for model, model_calls in by_model.items()},
+        }
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def _wait_ready(server: subprocess.Popen, base_url: str, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'O servidor terminou ao iniciar:\n{server.stderr.read().decode(errors="replace")[-2000:]}')
+            with contextlib.suppress(httpx.HTTPError):
+                # Qualquer resposta (mesmo 401) indica que o servidor está atendendo
+                httpx.get(f'{base_url}/api/recommendations/genres/', timeout=2)
+                return
+            time.sleep(0.3)
+        raise CommandError(f'O servidor não respondeu em {timeout:.0f}s.')
+
+    @staticmethod
+    def _stop(server: subprocess.Popen) -> None:
+        if server.poll() is None:
+            os.killpg(server.pid, signal.SIGTERM)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(server.pid, signal.SIGKILL)
+                server.wait()
+
+    def _print_summary(self, result: dict) -> None:
+        self.stdout.write('Consultas SQL por requisição: ' + ', '.join(
+            f'{step}={count}' for step, count in result['queries_per_request'].items()
+        ))
+        for mode, data in result['modes'].items():
+            latency = data['latency_ms']['all']
+            rss = data['peak_rss_mb']
+            self.stdout.write(
+                f'[{mode}] {data["requests_per_second"]} req/s ({data["requests_per_second_per_worker"]} por worker), '
+                f'p50={latency["p50"]} p95={latency["p95"]} p99={latency["p99"]} ms, '
+                f'fluxos com erro={data["failed_flows"]}/{data["flows"]}, '
+                f'pico de RSS={rss["total"] if rss else "n/d"} MB'
+            )
+            generate = data['latency_ms'].get('generate-for-mood')
+            if generate:
+                self.stdout.write(f'       generate-for-mood: p50={generate["p50"]} p95={generate["p95"]} p99={generate["p99"]} ms')
+            gemini = data['gemini']
+            if gemini['calls']:
+                self.stdout.write(
+                    f'       gemini (cache de contexto {result["config"]["context_cache"]}): {gemini["calls"]} chamadas, '
+                    f'entrada cobrada={gemini["billed_input_tokens"]} de {gemini["prompt_tokens"]} tokens/chamada, '
+                    f'TTFT p50={gemini["ttft_ms"]["p50"]} p95={gemini["ttft_ms"]["p95"]} ms'
+                )
+                self.stdout.write(f'       roteamento {result["config"]["routing"]}: ' + ', '.join(
+                    f'{model}={model_data["calls"]} chamadas (p50={model_data["ttft_ms"]["p50"]} ms)'
+                    for model, model_data in gemini['models'].items()
+                ))
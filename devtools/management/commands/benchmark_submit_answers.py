@@ -0,0 +1,118 @@
+# devtools/management/commands/benchmark_submit_answers.py
+
+import itertools
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import Answer, Question
+from accounts.views import SCORE_FIELDS, SubmitAnswersView
+
+
+class LegacySubmitAnswersView(SubmitAnswersView):
+    """
+    Implementação anterior (um `update_or_create` por resposta e `profile.save()` completo),
+    mantida só como referência para a comparação.
+    """
+
+    def post(self, request, *args, **kwargs):
+        profile = request.user.profile
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        answers_data = serializer.validated_data['answers']
+
+        questions_map = {q.id: q for q in Question.objects.filter(id__in=[a['question']['id'] for a in answers_data])}
+        scores = dict.fromkeys(SCORE_FIELDS, 0.0)
+        for answer in answers_data:
+            scores[questions_map[answer['question']['id']].attribute] += answer['selected_value']
+
+        with transaction.atomic():
+            for answer_data in answers_data:
+                Answer.objects.update_or_create(
+                    profile=profile,
+                    question_id=answer_data['question']['id'],
+                    defaults={'selected_value': answer_data['selected_value']}
+                )
+            for field, score in scores.items():
+                setattr(profile, field, score)
+            profile.save()
+
+        return Response({"scores": scores}, status=status.HTTP_200_OK)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara as consultas SQL (idas e voltas ao banco) e o tempo de POST /api/accounts/answers/submit/ '
+        'entre a implementação anterior (uma consulta por resposta) e a atual (upsert em lote), para '
+        'questionários de vários tamanhos. Os dados criados ficam em uma transação desfeita no fim.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200], help='Tamanhos de questionário (padrão 10 50 200).')
+        parser.add_argument('--repeat', type=int, default=5, help='Execuções de cada cenário para a mediana do tempo (padrão 5).')
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        implementations = [('antes', LegacySubmitAnswersView.as_view()), ('depois', SubmitAnswersView.as_view())]
+
+        self.stdout.write(f'{"questões":>8}  {"versão":<7} {"1º envio":>18} {"reenvio":>18}')
+        # A pré-geração não faz parte do que está sendo medido
+        with override_settings(PREWARM_RECOMMENDATIONS=False), transaction.atomic():
+            user = User.objects.create_user(username='submit-answers-benchmark', password=None)
+            for size in options['sizes']:
+                payload = {'answers': [
+                    {'question_id': str(question.id), 'selected_value': value}
+                    for question, value in zip(self._questions(size), itertools.cycle((1, 0, -1)))
+                ]}
+                for label, view in implementations:
+                    # 1º envio: só INSERTs; reenvio: todas as respostas já existem
+                    first = self._measure(view, user, payload, repeat, clear=True)
+                    again = self._measure(view, user, payload, repeat, clear=False)
+                    self.stdout.write(f'{size:>8}  {label:<7} {first:>18} {again:>18}')
+
+            # Nada do que foi criado para o benchmark é mantido
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _questions(size):
+        attributes = itertools.cycle(SCORE_FIELDS)
+        return Question.objects.bulk_create([
+            Question(
+                description=f'Questão de benchmark {index}', attribute=next(attributes),
+                first_alternative='Sim', first_alternative_value=1,
+                second_alternative='Não', second_alternative_value=-1,
+                third_alternative='Talvez', third_alternative_value=0,
+            )
+            for index in range(size)
+        ])
+
+    @staticmethod
+    def _measure(view, user, payload, repeat, clear):
+        """
+        Retorna "<consultas> q / <mediana> ms" de `repeat` envios.
+        """
+        factory = APIRequestFactory()
+        counts, timings = [], []
+        for _ in range(repeat):
+            if clear:
+                Answer.objects.filter(profile__user=user).delete()
+            request = factory.post('/api/accounts/answers/submit/', payload, format='json')
+            # Usuário novo a cada envio, para que o cache do perfil não esconda consultas
+            force_authenticate(request, user=User.objects.get(pk=user.pk))
+
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = view(request)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != status.HTTP_200_OK:
+                raise RuntimeError(f'Envio falhou ({response.status_code}): {response.data}')
+            counts.append(len(context.captured_queries))
+
+        return f'{max(counts)} q / {statistics.median(timings):.1f} ms'
@@ -0,0 +1,132 @@
+# integrations/circuit_breaker.py
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """
+    O circuito do serviço externo está aberto: a chamada foi recusada sem tentar a rede.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito '{name}' aberto; nova tentativa em {retry_after:.0f}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Disjuntor por processo para um serviço externo.
+
+    - Fechado: as chamadas passam; `failure_threshold` falhas seguidas abrem o circuito.
+    - Aberto: as chamadas falham na hora com `CircuitOpenError` por `recovery_timeout` segundos.
+    - Meio-aberto: passado esse tempo, até `half_open_max_calls` chamadas de teste são liberadas;
+      um sucesso fecha o circuito e uma falha o abre de novo.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    @property
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(self._opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def _refresh(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+    def _open(self) -> None:
+        if self._state != self.OPEN:
+            logger.warning("Circuito '%s' aberto após %s falha(s).", self.name, self._failures)
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def before_call(self) -> None:
+        """
+        Lança `CircuitOpenError` se a chamada não pode ser feita agora.
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == self.OPEN:
+                raise CircuitOpenError(self.name, self._opened_at + self.recovery_timeout - time.monotonic())
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self._probes += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info("Circuito '%s' fechado: o serviço voltou a responder.", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def release(self) -> None:
+        """
+        Encerra uma chamada cujo resultado não diz nada sobre a saúde do serviço (ex.: erro 4xx).
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    @contextlib.contextmanager
+    def guard(self, is_failure: Callable[[BaseException], bool]):
+        """
+        Protege uma chamada: exceções para as quais `is_failure` retorna True contam como
+        falha do serviço; as demais apenas liberam a vaga de teste, sem mudar o estado.
+        """
+        self.before_call()
+        try:
+            yield
+        except BaseException as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.release()
+            raise
+        else:
+            self.record_success()
+
+
+def breaker_from_env(name: str, prefix: str) -> CircuitBreaker:
+    """
+    Cria um disjuntor configurado por `<PREFIX>_BREAKER_FAILURES` (padrão 5) e
+    `<PREFIX>_BREAKER_RESET` (segundos até o teste meio-aberto, padrão 30).
+    """
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        recovery_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", "30")),
+    )
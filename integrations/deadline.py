@@ -0,0 +1,66 @@
+# integrations/deadline.py
+
+"""
+Prazo (deadline) da requisição atual, propagado até as chamadas externas. Cada chamada ao
+Gemini ou ao TMDb usa como timeout só o tempo que ainda resta, em vez de um valor fixo.
+
+O prazo fica numa ContextVar: vale para a thread ou task atual e para o que rodar em uma
+cópia do contexto (`contextvars.copy_context()`, tasks do asyncio, `sync_to_async`).
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Abaixo disso não vale a pena começar uma chamada externa
+MIN_CALL_TIMEOUT = 0.1
+
+# Instante (time.monotonic) em que o prazo da requisição atual acaba. None: sem prazo.
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    O prazo da requisição acabou antes de uma chamada externa poder ser feita.
+    """
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Define um prazo de `seconds` a partir de agora para o bloco. Um prazo mais curto já em
+    vigor prevalece; `None` ou zero não muda nada.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Segundos até o fim do prazo (negativo se já passou), ou None se não há prazo.
+    """
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def call_timeout(default: float, share: float = 1.0) -> float:
+    """
+    Timeout de uma chamada externa: `default`, limitado a uma fração `share` do que resta do
+    prazo. Lança `DeadlineExceeded` se sobra menos que `MIN_CALL_TIMEOUT`.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_CALL_TIMEOUT:
+        raise DeadlineExceeded(f"Prazo da requisição esgotado ({left:.2f}s restantes).")
+    return max(min(default, left * share), MIN_CALL_TIMEOUT)
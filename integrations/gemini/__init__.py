@@ -1,5 +1,16 @@
+from .cache import (
+    ResponseCache,
+    get_response_cache,
+)
 from .client import (
     GeminiClient,
+    GeminiStreamError,
+    get_gemini_client,
+)
+from .governor import (
+    GeminiOverloadedError,
+    RateGovernor,
+    get_governor,
 )
 from .service import (
     GeminiService,
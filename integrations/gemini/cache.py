@@ -0,0 +1,208 @@
+# integrations/gemini/cache.py
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from integrations.gemini.types import Input
+from integrations.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_score(score: float) -> int:
+    """
+    Leva um score do Big Five (soma de respostas -1/0/1) para a escala de -2 a +2 enviada
+    ao Gemini. A `tanh` satura os extremos, como no ranqueamento local.
+    """
+    return round(2 * math.tanh(score / 2))
+
+
+def format_scores(scores: Dict[str, float]) -> str:
+    """
+    Scores no formato compacto do prompt, ex.: `O=+1 C=0 E=-2 A=+2 N=-1`.
+    """
+    return " ".join(f"{trait[:1].upper()}={quantize_score(score):+d}".replace("+0", "0") for trait, score in scores.items())
+
+
+@lru_cache(maxsize=8)
+def _instruction_digest(system_instruction: str) -> str:
+    return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+
+
+def build_cache_key(user_data: Input, system_instruction: str, model: str) -> str:
+    """
+    Gera uma chave determinística (SHA-256) para uma chamada ao Gemini.
+
+    A entrada é canonizada antes do hash: gêneros e blacklist são ordenados e os
+    scores de personalidade são quantizados como no prompt, para que perfis que geram
+    o mesmo prompt compartilhem a mesma entrada no cache.
+    """
+    payload = {
+        "model": model,
+        "system_instruction": _instruction_digest(system_instruction),
+        "preferences": sorted(user_data.preferences),
+        "score": {trait: quantize_score(score) for trait, score in sorted(user_data.score.items())},
+        "blacklist": sorted(movie.title.strip().lower() for movie in user_data.blacklist),
+        "recently_shown": sorted(title.strip().lower() for title in user_data.recently_shown),
+        "target_moods": user_data.moods,
+        "candidates": user_data.candidates,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return "gemini:rec:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class InMemoryCacheBackend:
+    """
+    Cache LRU em memória do processo, com TTL e tamanho máximo.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Usa o framework de cache do Django (ex.: Redis ou banco), compartilhado entre os workers
+    se CACHES também for. A política de despejo fica a cargo do backend configurado.
+    """
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        # Importação tardia: o módulo de integração também roda fora do Django.
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._cache.set(key, value, timeout=ttl)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class ResponseCache:
+    """
+    Cache de respostas do Gemini com contadores de acertos e falhas.
+    """
+
+    def __init__(self, backend, ttl: int = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Erro ao ler o cache do Gemini: %s", e)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache("gemini_response", hit=value is not None)
+        return value
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Lê uma entrada sem contabilizar acerto ou falha (usado ao aguardar outro worker).
+        """
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning("Erro ao ler o cache do Gemini: %s", e)
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning("Erro ao gravar no cache do Gemini: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Retorna o cache de respostas do processo, configurado pelas variáveis de ambiente:
+
+    - GEMINI_CACHE_BACKEND: "memory" (padrão), "django" ou "none".
+    - GEMINI_CACHE_TTL: validade das entradas em segundos (padrão 3600).
+    - GEMINI_CACHE_MAX_SIZE: número máximo de entradas no backend em memória (padrão 512).
+    - GEMINI_CACHE_ALIAS: alias do cache do Django (padrão "default").
+    """
+    global _response_cache
+
+    backend_name = os.getenv("GEMINI_CACHE_BACKEND", "memory").lower()
+    if backend_name == "none":
+        return None
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            if backend_name == "django":
+                backend = DjangoCacheBackend(alias=os.getenv("GEMINI_CACHE_ALIAS", "default"))
+            else:
+                backend = InMemoryCacheBackend(max_size=int(os.getenv("GEMINI_CACHE_MAX_SIZE", "512")))
+            _response_cache = ResponseCache(backend, ttl=int(os.getenv("GEMINI_CACHE_TTL", "3600")))
+        return _response_cache
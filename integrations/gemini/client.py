@@ -1,12 +1,85 @@
 import os
+import itertools
 import json
-from google import genai
-from google.genai import types
-from google.genai.errors import APIError
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
+
+import httpx
+
+from integrations.circuit_breaker import CircuitOpenError, breaker_from_env
+from integrations.deadline import DeadlineExceeded, call_timeout
+from integrations.gemini.context_cache import ContextCache, get_context_cache
+from integrations.gemini.governor import GeminiOverloadedError, get_governor
+from integrations.hedging import hedger_from_env
+from integrations.metrics import (
+    GEMINI_QUEUE_WAIT_SECONDS, GEMINI_TTFT_SECONDS, record_gemini_usage, record_outbound, record_span, span,
+)
+
+if TYPE_CHECKING:
+    from google.genai import errors, types
+
+logger = logging.getLogger(__name__)
+
+# Disjuntor do processo: após falhas seguidas (5xx, timeouts, erros de conexão), as chamadas
+# falham na hora com `CircuitOpenError` até o teste meio-aberto (GEMINI_BREAKER_FAILURES/RESET).
+gemini_breaker = breaker_from_env("gemini", "GEMINI")
+
+# Tempo máximo de uma chamada ao Gemini, em segundos (limitado pelo que resta do prazo da requisição)
+REQUEST_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+# Endereço alternativo da API (ex.: o Gemini simulado de `devtools/fake_servers.py` nos testes de carga)
+BASE_URL = os.getenv("GEMINI_BASE_URL") or None
+
+# Tempo que a última chamada (da thread ou task atual) aguardou na fila do governador
+_last_queue_wait: ContextVar[float] = ContextVar("gemini_last_queue_wait", default=0.0)
+
+
+@lru_cache(maxsize=None)
+def _sdk():
+    """
+    Importa o SDK do Gemini (`google.genai`) só no primeiro uso. A importação é pesada e
+    não deve pesar no boot do gunicorn nem em comandos do `manage.py` que não chamam a IA.
+    """
+    from google import genai
+    from google.genai import errors, types  # noqa: F401 (carrega os submódulos usados via `genai.`)
+
+    return genai
+
+
+def _is_outage(error: BaseException) -> bool:
+    """
+    Erros que indicam indisponibilidade do serviço (e não um problema da requisição ou de cota).
+    """
+    return isinstance(error, (_sdk().errors.ServerError, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def _succeeded(response: dict) -> bool:
+    return response.get("status") != "error"
+
+
+def _deadline_error(error: DeadlineExceeded) -> dict:
+    return {"status": "error", "message": f"Sem tempo para chamar a API do Gemini: {error}", "timeout": True}
+
+
+class GeminiStreamError(Exception):
+    """
+    Falha durante uma resposta em streaming (o formato de dict com "status" não se aplica a geradores).
+    """
 
 
 class GeminiClient:
-    def __init__(self, model: str = "gemini-2.5-flash"):
+    # Novas tentativas após um 429 (cada uma aguarda o backoff do governador)
+    RATE_LIMIT_RETRIES = int(os.getenv("GEMINI_RATE_LIMIT_RETRIES", "2"))
+    # Códigos com que a API recusa um `cached_content` que expirou ou foi apagado
+    CONTEXT_CACHE_MISSING_CODES = (403, 404)
+
+    def __init__(self, model: str = "gemini-2.5-flash", timeout: Optional[float] = None, breaker=None,
+                 deadline_share: float = 1.0, governor=None):
 
         try:
             api_key = os.getenv("GEMINI_API_KEY")
@@ -14,54 +87,376 @@ class GeminiClient:
                 raise ValueError(
                     "GEMINI_API_KEY não encontrado nas variáveis de ambiente."
                 )
-            self.client = genai.Client(api_key=api_key)
+            self.api_key = api_key
             self.model = model
+            self.timeout = timeout or REQUEST_TIMEOUT
+            self.breaker = breaker or gemini_breaker
+            # Fração do tempo restante do prazo da requisição que cada chamada pode usar
+            self.deadline_share = deadline_share
+            # Hedging das chamadas assíncronas sem streaming (GEMINI_HEDGE=true ativa). Desligado
+            # por padrão: cada cópia consome cota e uma vaga do governador até ser cancelada.
+            self.hedger = hedger_from_env("gemini", "GEMINI", default_enabled=False)
+            self.governor = governor or get_governor()
+            self._client = None
+            self._client_lock = threading.Lock()
 
         except Exception as e:
 
-            print(f"Erro ao inicializar o Gemini Client: {e}")
-            self.client = None
+            logger.error("Erro ao inicializar o Gemini Client: %s", e)
             raise
 
-    def generate_json_response(
-        self, prompt: str, system_instruction: str, json_schema: dict
-    ) -> dict:
-        if not self.client:
-            return {"status": "error", "message": "Client não está inicializado."}
+    @property
+    def client(self):
+        """
+        `genai.Client` criado no primeiro uso e reaproveitado (com seu pool de conexões) daí em diante.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    genai = _sdk()
+                    self._client = genai.Client(
+                        api_key=self.api_key,
+                        http_options=genai.types.HttpOptions(base_url=BASE_URL, timeout=int(self.timeout * 1000)),
+                    )
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+
+    @property
+    def last_queue_wait(self) -> float:
+        """
+        Tempo (em segundos) que a última chamada desta thread/task aguardou na fila do governador.
+        """
+        return _last_queue_wait.get()
+
+    @last_queue_wait.setter
+    def last_queue_wait(self, value: float) -> None:
+        _last_queue_wait.set(value)
+
+    def _record_queue_wait(self, permit) -> None:
+        self.last_queue_wait = permit.waited
+        GEMINI_QUEUE_WAIT_SECONDS.observe(permit.waited)
+        record_span("gemini.queue", permit.waited)
+
+    @contextmanager
+    def _instrumented_call(self, stage: str = "gemini.request"):
+        """
+        Mede uma chamada à API (span e `cinemind_outbound_requests_total` pelo código HTTP).
+        """
+        started = time.perf_counter()
+        try:
+            with span(stage):
+                yield
+        except _sdk().errors.APIError as e:
+            record_outbound("gemini", e.code, time.perf_counter() - started)
+            raise
+        except Exception:
+            record_outbound("gemini", "error", time.perf_counter() - started)
+            raise
+        record_outbound("gemini", 200, time.perf_counter() - started)
 
-        config = types.GenerateContentConfig(
+    def _call_timeout(self) -> float:
+        """
+        Timeout da próxima chamada: `self.timeout` limitado ao prazo da requisição.
+        Lança `DeadlineExceeded` se o prazo já acabou.
+        """
+        return call_timeout(self.timeout, self.deadline_share)
+
+    def _build_config(
+        self, system_instruction: str, json_schema: dict, cached_content: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> "types.GenerateContentConfig":
+        types = _sdk().types
+        options = {}
+        # Timeout menor que o do `genai.Client` só quando o prazo da requisição está perto do fim
+        if timeout is not None and timeout < self.timeout:
+            options["http_options"] = types.HttpOptions(timeout=max(int(timeout * 1000), 1))
+        # Com cache de contexto, o system instruction já está no `CachedContent`
+        if cached_content:
+            return types.GenerateContentConfig(
+                cached_content=cached_content,
+                response_mime_type="application/json",
+                response_schema=json_schema,
+                **options,
+            )
+        return types.GenerateContentConfig(
             system_instruction=system_instruction,
             response_mime_type="application/json",
             response_schema=json_schema,
+            **options,
         )
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model, contents=prompt, config=config
-            )
-
-            if response.text:
-                return json.loads(response.text)
-            else:
-                return {
-                    "status": "error",
-                    "message": "Resposta vazia da API do Gemini.",
-                }
+    def _context_cache_missing(
+        self, error: "errors.APIError", context_cache: Optional[ContextCache], cached_content: Optional[str]
+    ) -> bool:
+        """
+        Se a API recusou o cache de contexto usado na chamada, descarta-o (o próximo uso cria
+        outro) e indica que a chamada deve ser refeita com o system instruction completo.
+        Um 403/404 que não fala do cache (ex.: chave sem permissão, modelo inexistente) não
+        é tratado aqui.
+        """
+        if cached_content is None or error.code not in self.CONTEXT_CACHE_MISSING_CODES:
+            return False
+        message = (error.message or "").lower()
+        if "cachedcontent" not in message.replace("_", "").replace(" ", "") and cached_content.lower() not in message:
+            return False
+        context_cache.invalidate(cached_content)
+        logger.warning("Cache de contexto do Gemini %s recusado (%s); refazendo sem cache.", cached_content, error.code)
+        return True
 
-        except APIError as e:
+    def _parse_response(self, response) -> dict:
+        if response.text:
+            return json.loads(response.text)
+        return {
+            "status": "error",
+            "message": "Resposta vazia da API do Gemini.",
+        }
 
-            return {"status": "error", "message": f"Erro na API do Gemini: {e}"}
+    @staticmethod
+    def _retry_after(error: "errors.APIError") -> Optional[float]:
+        """
+        Lê o `retryDelay` (ex.: "31s") que a API envia junto com o 429, se houver.
+        """
+        details = error.details.get("error", {}).get("details", []) if isinstance(error.details, dict) else []
+        for detail in details:
+            delay = str(detail.get("retryDelay", "")).rstrip("s")
+            try:
+                return float(delay)
+            except ValueError:
+                continue
+        return None
 
-        except json.JSONDecodeError:
+    def _handle_rate_limit(self, error: "errors.APIError", attempt: int) -> None:
+        """
+        Registra o 429 no governador (que suspende as próximas chamadas) e decide se
+        vale tentar de novo. Lança `GeminiOverloadedError` quando as tentativas acabam.
+        """
+        backoff = self.governor.report_rate_limited(self._retry_after(error))
+        if attempt >= self.RATE_LIMIT_RETRIES:
+            raise GeminiOverloadedError(
+                f"Cota da API do Gemini esgotada (429): {error.message}", retry_after=backoff
+            ) from error
 
+    def _failure(self, error: Exception, attempt: int, timeout: float, retry: bool = True) -> Optional[dict]:
+        """
+        Classifica o erro de uma tentativa (comum às chamadas síncrona, assíncrona e em
+        streaming). Retorna `None` se a chamada deve ser refeita (429 com tentativas
+        sobrando, após o backoff do governador) ou o dict de erro com "status". Relança
+        `CircuitOpenError` e `GeminiOverloadedError`.
+        """
+        if isinstance(error, CircuitOpenError):
+            record_outbound("gemini", "circuit_open")
+            raise error
+        if isinstance(error, GeminiOverloadedError):
+            raise error
+        if isinstance(error, DeadlineExceeded):
+            return _deadline_error(error)
+        if isinstance(error, _sdk().errors.APIError):
+            if error.code == 429 and retry:
+                self._handle_rate_limit(error, attempt)
+                return None
+            return {"status": "error", "message": f"Erro na API do Gemini: {error}"}
+        if isinstance(error, (httpx.TimeoutException, TimeoutError)):
             return {
                 "status": "error",
-                "message": "Falha ao processar o JSON retornado pela LLM.",
+                "message": f"Tempo limite da API do Gemini excedido ({timeout:.1f}s): {error}",
+                "timeout": True,
             }
-
-        except Exception as e:
-
+        if isinstance(error, json.JSONDecodeError):
             return {
                 "status": "error",
-                "message": f"Erro inesperado no cliente Gemini: {e}",
+                "message": "Falha ao processar o JSON retornado pela LLM.",
             }
+        return {
+            "status": "error",
+            "message": f"Erro inesperado no cliente Gemini: {error}",
+        }
+
+    def generate_json_response(
+        self, prompt: str, system_instruction: str, json_schema: dict
+    ) -> dict:
+        """
+        Lança `GeminiOverloadedError` se a fila do governador estourar o tempo de espera
+        ou se a cota continuar esgotada, e `CircuitOpenError` se o circuito estiver aberto;
+        os demais erros voltam no dict com "status". Sem hedging: a chamada síncrona do SDK não
+        pode ser interrompida, então a tentativa que perdesse seguiria ocupando a conexão e a
+        vaga do governador (o hedging vale só em `agenerate_json_response`).
+        """
+        return self._generate_json_response(prompt, system_instruction, json_schema)
+
+    def _generate_json_response(
+        self, prompt: str, system_instruction: str, json_schema: dict
+    ) -> dict:
+        if not self.client:
+            return {"status": "error", "message": "Client não está inicializado."}
+
+        context_cache = get_context_cache(self.model, system_instruction)
+
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            timeout = self.timeout
+            try:
+                cached_content = context_cache.name(self.client) if context_cache else None
+                with self.breaker.guard(_is_outage), self.governor.acquire() as permit:
+                    self._record_queue_wait(permit)
+                    # Depois da fila: o tempo de espera já saiu do prazo
+                    timeout = self._call_timeout()
+                    config = self._build_config(system_instruction, json_schema, cached_content, timeout)
+                    with self._instrumented_call():
+                        try:
+                            response = self.client.models.generate_content(
+                                model=self.model, contents=prompt, config=config
+                            )
+                        except _sdk().errors.ClientError as e:
+                            if not self._context_cache_missing(e, context_cache, cached_content):
+                                raise
+                            response = self.client.models.generate_content(
+                                model=self.model, contents=prompt,
+                                config=self._build_config(system_instruction, json_schema, timeout=self._call_timeout()),
+                            )
+                self.governor.report_success()
+                record_gemini_usage(self.model, response.usage_metadata)
+                return self._parse_response(response)
+
+            except Exception as e:
+                failure = self._failure(e, attempt, timeout)
+                if failure is None:
+                    continue
+                return failure
+
+    async def agenerate_json_response(
+        self, prompt: str, system_instruction: str, json_schema: dict
+    ) -> dict:
+        """
+        Versão assíncrona de `generate_json_response`, usando `client.aio`. Com o hedging
+        ligado, uma chamada mais lenta que o p95 recente ganha uma cópia e vale a primeira
+        resposta sem erro; a outra é cancelada.
+        """
+        return await self.hedger.acall(
+            lambda: self._agenerate_json_response(prompt, system_instruction, json_schema), accept=_succeeded
+        )
+
+    async def _agenerate_json_response(
+        self, prompt: str, system_instruction: str, json_schema: dict
+    ) -> dict:
+        if not self.client:
+            return {"status": "error", "message": "Client não está inicializado."}
+
+        context_cache = get_context_cache(self.model, system_instruction)
+
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            timeout = self.timeout
+            try:
+                cached_content = await context_cache.aname(self.client) if context_cache else None
+                with self.breaker.guard(_is_outage):
+                    async with self.governor.aacquire() as permit:
+                        self._record_queue_wait(permit)
+                        timeout = self._call_timeout()
+                        config = self._build_config(system_instruction, json_schema, cached_content, timeout)
+                        with self._instrumented_call():
+                            try:
+                                response = await self.client.aio.models.generate_content(
+                                    model=self.model, contents=prompt, config=config
+                                )
+                            except _sdk().errors.ClientError as e:
+                                if not self._context_cache_missing(e, context_cache, cached_content):
+                                    raise
+                                response = await self.client.aio.models.generate_content(
+                                    model=self.model, contents=prompt,
+                                    config=self._build_config(system_instruction, json_schema, timeout=self._call_timeout()),
+                                )
+                self.governor.report_success()
+                record_gemini_usage(self.model, response.usage_metadata)
+                return self._parse_response(response)
+
+            except Exception as e:
+                failure = self._failure(e, attempt, timeout)
+                if failure is None:
+                    continue
+                return failure
+
+    def stream_json_response(
+        self, prompt: str, system_instruction: str, json_schema: dict
+    ) -> Iterator[str]:
+        """
+        Gera o texto da resposta em pedaços, conforme chega (`generate_content_stream`).
+        Lança `GeminiStreamError` em caso de falha.
+        """
+        if not self.client:
+            raise GeminiStreamError("Client não está inicializado.")
+
+        context_cache = get_context_cache(self.model, system_instruction)
+
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            started = False
+            usage = None
+            timeout = self.timeout
+            try:
+                cached_content = context_cache.name(self.client) if context_cache else None
+                # A vaga fica ocupada durante todo o streaming
+                with self.breaker.guard(_is_outage), self.governor.acquire() as permit:
+                    self._record_queue_wait(permit)
+                    timeout = self._call_timeout()
+                    config = self._build_config(system_instruction, json_schema, cached_content, timeout)
+                    with self._instrumented_call("gemini.stream"):
+                        requested_at = time.perf_counter()
+                        try:
+                            chunks = iter(self.client.models.generate_content_stream(
+                                model=self.model, contents=prompt, config=config
+                            ))
+                            # Erros da requisição (ex.: cache recusado) surgem no primeiro pedaço
+                            first_chunk = next(chunks, None)
+                        except _sdk().errors.ClientError as e:
+                            if not self._context_cache_missing(e, context_cache, cached_content):
+                                raise
+                            chunks = iter(self.client.models.generate_content_stream(
+                                model=self.model, contents=prompt,
+                                config=self._build_config(system_instruction, json_schema, timeout=self._call_timeout()),
+                            ))
+                            first_chunk = next(chunks, None)
+
+                        for chunk in itertools.chain([first_chunk] if first_chunk is not None else [], chunks):
+                            # O uso de tokens completo vem no último pedaço
+                            usage = chunk.usage_metadata or usage
+                            if chunk.text:
+                                if not started:
+                                    ttft = time.perf_counter() - requested_at
+                                    GEMINI_TTFT_SECONDS.observe(ttft)
+                                    record_span("gemini.ttft", ttft)
+                                started = True
+                                yield chunk.text
+                self.governor.report_success()
+                record_gemini_usage(self.model, usage)
+                return
+
+            except Exception as e:
+                # Só é possível tentar de novo se nada foi entregue ainda
+                failure = self._failure(e, attempt, timeout, retry=not started)
+                if failure is None:
+                    continue
+                raise GeminiStreamError(failure["message"]) from e
+
+
+_clients: Dict[str, GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(model: str, timeout: Optional[float] = None, breaker=None,
+                      deadline_share: float = 1.0, governor=None) -> GeminiClient:
+    """
+    Retorna o `GeminiClient` do processo para o modelo, criado no primeiro uso e
+    compartilhado entre requisições e threads. `timeout`, `breaker`, `deadline_share` e
+    `governor` só valem na criação (padrão: `GEMINI_TIMEOUT`, o disjuntor `gemini_breaker`, o
+    prazo inteiro e o governador principal).
+    """
+    client = _clients.get(model)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(model)
+            if client is None:
+                client = _clients[model] = GeminiClient(
+                    model=model, timeout=timeout, breaker=breaker, deadline_share=deadline_share,
+                    governor=governor,
+                )
+    return client
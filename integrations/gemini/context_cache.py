@@ -0,0 +1,162 @@
+# integrations/gemini/context_cache.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cache explícito de contexto do Gemini para o system instruction fixo (GEMINI_CONTEXT_CACHE=false desativa):
+# validade de cada cache, antecedência da renovação e espera antes de tentar criar de novo após uma falha
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() in ["1", "true", "yes"]
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+CONTEXT_CACHE_RETRY_AFTER = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_AFTER", "300"))
+
+
+class ContextCache:
+    """
+    Mantém no Gemini um `CachedContent` com o system instruction de um modelo, para que ele
+    não seja reenviado (nem cobrado como entrada integral) a cada chamada.
+
+    O cache é criado no primeiro uso e renovado em segundo plano quando faltam menos de
+    `refresh_margin` segundos para expirar. Se a API recusar a criação com 400 (ex.: conteúdo
+    abaixo do mínimo de tokens do modelo), o cache fica desativado até o processo reiniciar;
+    outras falhas desativam só por `retry_after` segundos. Enquanto desativado, `name()`
+    retorna None e as chamadas enviam o system instruction normalmente.
+    """
+
+    def __init__(self, model: str, system_instruction: str, ttl: int = CONTEXT_CACHE_TTL,
+                 refresh_margin: int = CONTEXT_CACHE_REFRESH_MARGIN, retry_after: int = CONTEXT_CACHE_RETRY_AFTER):
+        self.model = model
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.retry_after = retry_after
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._disabled_until = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _fresh_name(self) -> Tuple[Optional[str], bool]:
+        """
+        (nome do cache ainda válido, se já é hora de renová-lo).
+        """
+        now = time.monotonic()
+        if self._name is not None and now < self._expires_at:
+            return self._name, now >= self._expires_at - self.refresh_margin
+        return None, False
+
+    def name(self, client) -> Optional[str]:
+        """
+        Nome do cache (`cachedContents/...`) para `GenerateContentConfig.cached_content`, ou None.
+        `client` é o `genai.Client` usado nas chamadas.
+        """
+        name, needs_refresh = self._fresh_name()
+        if name is not None:
+            if needs_refresh:
+                self._start_refresh(client)
+            return name
+        if time.monotonic() < self._disabled_until:
+            return None
+
+        with self._lock:
+            name, _ = self._fresh_name()
+            if name is None and time.monotonic() >= self._disabled_until:
+                self._create(client)
+            return self._name
+
+    async def aname(self, client) -> Optional[str]:
+        """
+        Versão assíncrona de `name`: só a criação (uma vez por validade) roda fora do event loop.
+        """
+        name, needs_refresh = self._fresh_name()
+        if name is not None:
+            if needs_refresh:
+                self._start_refresh(client)
+            return name
+        if time.monotonic() < self._disabled_until:
+            return None
+        return await asyncio.to_thread(self.name, client)
+
+    def invalidate(self, name: str) -> None:
+        """
+        Descarta o cache (ex.: a API não o reconheceu mais); o próximo uso cria outro.
+        """
+        with self._lock:
+            if self._name == name:
+                self._name = None
+
+    def _create(self, client) -> None:
+        from google.genai import types
+
+        try:
+            cached = client.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=self.system_instruction,
+                    display_name=f"cinemind-system-instruction-{hashlib.sha256(self.system_instruction.encode('utf-8')).hexdigest()[:12]}",
+                    ttl=f"{self.ttl}s",
+                ),
+            )
+        except Exception as e:
+            self._name = None
+            if getattr(e, "code", None) == 400:
+                self._disabled_until = float("inf")
+                logger.warning("Cache de contexto do Gemini recusado (%s); usando o system instruction sem cache.", e)
+            else:
+                self._disabled_until = time.monotonic() + self.retry_after
+                logger.warning("Erro ao criar o cache de contexto do Gemini (nova tentativa em %ss): %s", self.retry_after, e)
+            return
+
+        self._name = cached.name
+        self._expires_at = time.monotonic() + self.ttl
+        logger.info("Cache de contexto do Gemini criado: %s", cached.name)
+
+    def _start_refresh(self, client) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(client,), daemon=True).start()
+
+    def _refresh(self, client) -> None:
+        from google.genai import types
+
+        name = self._name
+        try:
+            if name is not None:
+                client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"))
+                with self._lock:
+                    if self._name == name:
+                        self._expires_at = time.monotonic() + self.ttl
+        except Exception as e:
+            # Sem renovação, o cache atual vale até expirar e o próximo uso cria outro
+            logger.warning("Erro ao renovar o cache de contexto do Gemini %s: %s", name, e)
+        finally:
+            self._refreshing = False
+
+
+_context_caches: Dict[Tuple[str, str], ContextCache] = {}
+_context_caches_lock = threading.Lock()
+
+
+def get_context_cache(model: str, system_instruction: str) -> Optional[ContextCache]:
+    """
+    Cache de contexto do processo para o par (modelo, system instruction), ou None se desativado.
+    """
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    key = (model, system_instruction)
+    context_cache = _context_caches.get(key)
+    if context_cache is None:
+        with _context_caches_lock:
+            context_cache = _context_caches.get(key)
+            if context_cache is None:
+                context_cache = _context_caches[key] = ContextCache(model, system_instruction)
+    return context_cache
@@ -0,0 +1,353 @@
+# integrations/gemini/governor.py
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from integrations.deadline import remaining as deadline_remaining
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiOverloadedError(Exception):
+    """
+    O Gemini não pôde ser chamado a tempo: a fila do governador excedeu o tempo de espera
+    ou a cota continuou esgotada (429) após as novas tentativas.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+# Vaga concedida sem passar pelo backend (usado quando ele falha)
+_UNLIMITED = object()
+
+
+class InMemoryGovernorBackend:
+    """
+    Limites válidos apenas para o processo atual: vagas de concorrência e um token bucket.
+
+    Após um 429, as chamadas ficam suspensas até o fim do backoff e a taxa efetiva cai pela
+    metade a cada 429 consecutivo; cada chamada bem-sucedida devolve parte da taxa.
+    """
+
+    def __init__(self, max_concurrency: int, qps: float, burst: int):
+        self.max_concurrency = max_concurrency
+        self.qps = qps
+        self.burst = burst
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._backoff_until = 0.0
+        self._penalty = 0
+        self._lock = threading.Lock()
+
+    def _effective_qps(self) -> float:
+        return max(self.qps / (2 ** self._penalty), 0.1)
+
+    def try_acquire(self) -> Tuple[Optional[Any], float]:
+        """
+        Tenta reservar uma vaga. Retorna (token, 0) em caso de sucesso ou (None, segundos sugeridos de espera).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._backoff_until:
+                return None, self._backoff_until - now
+
+            qps = self._effective_qps()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * qps)
+            self._refilled_at = now
+
+            if self._in_flight >= self.max_concurrency:
+                return None, 0.05
+            if self._tokens < 1:
+                return None, (1 - self._tokens) / qps
+
+            self._tokens -= 1
+            self._in_flight += 1
+            return True, 0.0
+
+    def release(self, token: Any) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def penalize(self, backoff: float) -> None:
+        with self._lock:
+            self._penalty = min(self._penalty + 1, 6)
+            self._backoff_until = max(self._backoff_until, time.monotonic() + backoff)
+            self._tokens = 0.0
+
+    def recover(self) -> None:
+        with self._lock:
+            if self._penalty:
+                self._penalty -= 1
+
+    @property
+    def penalty(self) -> int:
+        return self._penalty
+
+
+class DjangoGovernorBackend:
+    """
+    Limites compartilhados entre todos os workers, guardados no cache do Django (ex.: Redis).
+
+    - Concorrência: uma chave por vaga, reservada com `cache.add` (expira sozinha se o worker morrer).
+    - QPS: contador por janela de um segundo, incrementado com `cache.incr`.
+    - Backoff: instante de liberação e nível de penalidade compartilhados. A penalidade expira
+      sozinha após PENALTY_TTL segundos sem novos 429, mesmo que nenhuma chamada tenha sucesso.
+    """
+
+    # Validade das vagas, para que um worker que morreu não as prenda para sempre
+    SLOT_TTL = 120
+    # Validade do nível de penalidade, renovada a cada 429
+    PENALTY_TTL = 60
+
+    def __init__(self, max_concurrency: int, qps: float, alias: str = "default", prefix: str = "gemini:governor"):
+        self.max_concurrency = max_concurrency
+        self.qps = qps
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    @property
+    def penalty(self) -> int:
+        return self._cache.get(self._key("penalty"), 0)
+
+    def try_acquire(self) -> Tuple[Optional[Any], float]:
+        cache = self._cache
+        now = time.time()
+
+        backoff_until = cache.get(self._key("backoff_until"))
+        if backoff_until and now < backoff_until:
+            return None, backoff_until - now
+
+        slot = None
+        token = uuid.uuid4().hex
+        for index in range(self.max_concurrency):
+            if cache.add(self._key(f"slot:{index}"), token, timeout=self.SLOT_TTL):
+                slot = index
+                break
+        if slot is None:
+            return None, 0.05
+
+        window = self._key(f"qps:{int(now)}")
+        cache.add(window, 0, timeout=2)
+        try:
+            calls_in_window = cache.incr(window)
+        except ValueError:
+            # A janela expirou entre o `add` e o `incr`
+            calls_in_window = 1
+
+        # A janela é de um segundo: abaixo de uma chamada por janela, nenhuma passaria
+        if calls_in_window > max(self.qps / (2 ** self.penalty), 1):
+            cache.delete(self._key(f"slot:{slot}"))
+            return None, 1 - (now - int(now))
+
+        return (slot, token), 0.0
+
+    def release(self, token: Any) -> None:
+        slot, value = token
+        key = self._key(f"slot:{slot}")
+        # Só libera a vaga se ela ainda for desta chamada (pode ter expirado e sido reservada por outra)
+        if self._cache.get(key) == value:
+            self._cache.delete(key)
+
+    def penalize(self, backoff: float) -> None:
+        cache = self._cache
+        cache.set(self._key("backoff_until"), time.time() + backoff, timeout=int(backoff) + 1)
+        cache.set(self._key("penalty"), min(self.penalty + 1, 6), timeout=self.PENALTY_TTL)
+
+    def recover(self) -> None:
+        penalty = self.penalty
+        if penalty > 0:
+            self._cache.set(self._key("penalty"), penalty - 1, timeout=self.PENALTY_TTL)
+
+
+class Permit:
+    """
+    Vaga concedida pelo governador. `waited` é o tempo (em segundos) que a chamada passou na fila.
+    """
+
+    def __init__(self, waited: float):
+        self.waited = waited
+
+
+class RateGovernor:
+    """
+    Controla o acesso ao Gemini: limita concorrência e QPS, enfileira as chamadas até
+    `queue_timeout` segundos e recua de forma adaptativa quando a API responde 429.
+    """
+
+    # Backoff após um 429 sem Retry-After: BASE * 2^(penalidade), limitado a MAX
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+
+    def __init__(self, backend, queue_timeout: float = 30.0):
+        self.backend = backend
+        self.queue_timeout = queue_timeout
+        self.acquired = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def _timed_out(self, waited: float, retry_after: Optional[float] = None) -> GeminiOverloadedError:
+        with self._lock:
+            self.timeouts += 1
+        return GeminiOverloadedError(
+            f"Tempo de espera na fila do Gemini excedido ({waited:.1f}s).",
+            retry_after=retry_after or self.queue_timeout,
+        )
+
+    def _try_acquire(self) -> Tuple[Optional[Any], float]:
+        try:
+            return self.backend.try_acquire()
+        except Exception as e:
+            # Se o backend compartilhado estiver indisponível, não bloqueia as chamadas
+            logger.warning("Erro no governador do Gemini: %s", e)
+            return _UNLIMITED, 0.0
+
+    def _wait_time(self, started: float, retry_in: float) -> float:
+        """
+        Quanto esperar antes da próxima tentativa. Se a vaga só sairia depois do fim do
+        `queue_timeout` ou do prazo da requisição (ex.: backoff longo após um 429), desiste já
+        em vez de esperar à toa.
+        """
+        waited = time.monotonic() - started
+        remaining = self.queue_timeout - waited
+        request_remaining = deadline_remaining()
+        if request_remaining is not None:
+            remaining = min(remaining, request_remaining)
+        if remaining <= 0 or retry_in > remaining:
+            raise self._timed_out(waited, retry_after=retry_in)
+        return max(retry_in, 0.01)
+
+    def _release(self, token: Any) -> None:
+        if token is not _UNLIMITED:
+            self.backend.release(token)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        started = time.monotonic()
+        token, retry_in = self._try_acquire()
+        while token is None:
+            time.sleep(self._wait_time(started, retry_in))
+            token, retry_in = self._try_acquire()
+
+        permit = Permit(time.monotonic() - started)
+        self._record_wait(permit.waited)
+        try:
+            yield permit
+        finally:
+            self._release(token)
+
+    @contextlib.asynccontextmanager
+    async def aacquire(self):
+        """
+        Versão assíncrona de `acquire`: a espera na fila não bloqueia o event loop.
+        """
+        started = time.monotonic()
+        token, retry_in = self._try_acquire()
+        while token is None:
+            await asyncio.sleep(self._wait_time(started, retry_in))
+            token, retry_in = self._try_acquire()
+
+        permit = Permit(time.monotonic() - started)
+        self._record_wait(permit.waited)
+        try:
+            yield permit
+        finally:
+            self._release(token)
+
+    def report_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """
+        Registra um 429 e suspende as chamadas pelo tempo indicado (ou por um backoff exponencial).
+        Retorna o backoff aplicado, em segundos.
+        """
+        with self._lock:
+            self.rate_limited += 1
+        try:
+            backoff = retry_after or min(self.BACKOFF_BASE * (2 ** self.backend.penalty), self.BACKOFF_MAX)
+            self.backend.penalize(backoff)
+        except Exception as e:
+            logger.warning("Erro no governador do Gemini: %s", e)
+            backoff = self.BACKOFF_BASE
+        return backoff
+
+    def report_success(self) -> None:
+        try:
+            self.backend.recover()
+        except Exception as e:
+            logger.warning("Erro no governador do Gemini: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "rate_limited": self.rate_limited,
+                "avg_wait": (self.total_wait / self.acquired) if self.acquired else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governor_lock = threading.Lock()
+
+
+def _setting(prefix: str, name: str, default: str) -> str:
+    # `<PREFIX>_<NAME>`, ou o valor do governador principal (`GEMINI_<NAME>`) se não definido
+    return os.getenv(f"{prefix}_{name}") or os.getenv(f"GEMINI_{name}", default)
+
+
+def get_governor(name: str = "gemini", prefix: str = "GEMINI") -> RateGovernor:
+    """
+    Retorna o governador `name` do processo. Cada modelo com cota própria no Gemini (ex.: o
+    modelo rápido do roteamento, "gemini-fast") tem o seu, configurado pelas variáveis de
+    ambiente com o prefixo `prefix`; as que faltarem valem as do principal (GEMINI_*):
+
+    - <PREFIX>_MAX_CONCURRENCY: chamadas simultâneas ao modelo (padrão 8).
+    - <PREFIX>_QPS: chamadas por segundo (padrão 5); <PREFIX>_BURST: rajada do token bucket (padrão = QPS).
+    - <PREFIX>_QUEUE_TIMEOUT: espera máxima na fila, em segundos (padrão 30).
+    - <PREFIX>_GOVERNOR_BACKEND: "memory" (padrão, por processo) ou "django" (compartilhado entre workers).
+    - <PREFIX>_GOVERNOR_ALIAS: alias do cache do Django (padrão "default").
+    """
+    with _governor_lock:
+        governor = _governors.get(name)
+        if governor is None:
+            max_concurrency = int(_setting(prefix, "MAX_CONCURRENCY", "8"))
+            qps = float(_setting(prefix, "QPS", "5"))
+            if _setting(prefix, "GOVERNOR_BACKEND", "memory").lower() == "django":
+                backend = DjangoGovernorBackend(
+                    max_concurrency, qps, alias=_setting(prefix, "GOVERNOR_ALIAS", "default"), prefix=f"{name}:governor",
+                )
+            else:
+                backend = InMemoryGovernorBackend(
+                    max_concurrency, qps, burst=int(_setting(prefix, "BURST", str(max(int(qps), 1))))
+                )
+            governor = _governors[name] = RateGovernor(
+                backend, queue_timeout=float(_setting(prefix, "QUEUE_TIMEOUT", "30"))
+            )
+        return governor
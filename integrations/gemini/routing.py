@@ -0,0 +1,87 @@
+# integrations/gemini/routing.py
+
+import os
+import re
+import unicodedata
+from typing import Callable, List, Optional, Tuple
+
+from integrations.circuit_breaker import breaker_from_env
+from integrations.gemini.types import Input, Output
+
+# Roteamento em camadas: cada geração tenta primeiro um modelo mais rápido e barato, com prazo
+# curto, e só escala para o modelo principal (GEMINI_MODEL) se ele estourar o prazo, falhar ou
+# devolver uma resposta fraca. GEMINI_FAST_MODEL vazio (ou igual ao principal) desativa.
+RECOMMENDATION_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+FAST_TIMEOUT = float(os.getenv("GEMINI_FAST_TIMEOUT", "8"))
+# Fração do tempo restante do prazo da requisição que o modelo rápido pode usar: o resto fica
+# reservado para a escalada ao principal
+FAST_DEADLINE_SHARE = float(os.getenv("GEMINI_FAST_DEADLINE_SHARE", "0.5"))
+# Fração máxima de filmes problemáticos (bloqueados, repetidos, fora da pré-seleção ou sem
+# justificativa) aceita na resposta do modelo rápido
+FAST_MAX_BAD_SHARE = float(os.getenv("GEMINI_FAST_MAX_BAD_SHARE", "0.34"))
+ROUTING_ENABLED = bool(FAST_MODEL) and FAST_MODEL != RECOMMENDATION_MODEL
+
+# Disjuntor próprio do modelo rápido: estouros do prazo curto não devem abrir o circuito do
+# principal. Com ele aberto, as gerações vão direto para o modelo principal.
+fast_breaker = breaker_from_env("gemini-fast", "GEMINI_FAST")
+
+# Filmes pedidos por humor (o prompt pede exatamente 3)
+MOVIES_PER_MOOD = 3
+
+
+def _normalize(title: str) -> str:
+    without_accents = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return " ".join(without_accents.casefold().split())
+
+
+def quality_problem(output: Output, user_data: Input, blocks: Optional[Callable[[str], bool]] = None,
+                    max_bad_share: float = FAST_MAX_BAD_SHARE) -> Optional[str]:
+    """
+    Motivo para não aceitar uma resposta (válida pelo esquema) do modelo rápido, ou None.
+
+    Faltar humor ou filme é sempre motivo; filmes bloqueados (blacklist do prompt, exibidos
+    recentemente ou `blocks`), repetidos, fora da pré-seleção ou sem justificativa só contam
+    acima de `max_bad_share`, já que o pós-filtro repõe alguns filmes sem nova chamada à IA.
+    """
+    moods = user_data.moods
+    if len(output.recommendations) < len(moods):
+        return f"{len(output.recommendations)} de {len(moods)} humores"
+    if any(len(mood_rec.movies) < MOVIES_PER_MOOD for mood_rec in output.recommendations[:len(moods)]):
+        return f"humor com menos de {MOVIES_PER_MOOD} filmes"
+
+    avoided = {_normalize(movie.title) for movie in user_data.blacklist} | {_normalize(title) for title in user_data.recently_shown}
+    # Pré-seleção no formato "Título (Ano)": compara só o título (o ano do catálogo pode faltar)
+    candidates = {_normalize(re.sub(r"\s*\([^()]*\)$", "", candidate)) for candidate in user_data.candidates}
+    seen = set()
+    movies = [movie for mood_rec in output.recommendations for movie in mood_rec.movies]
+    bad: List[str] = []
+    for movie in movies:
+        title = _normalize(movie.title)
+        if (title in avoided or title in seen or (blocks is not None and blocks(movie.title))
+                or (candidates and title not in candidates)
+                or not movie.reason_for_recommendation.strip()):
+            bad.append(movie.title)
+        seen.add(title)
+
+    if len(bad) > max_bad_share * len(movies):
+        return f"{len(bad)} de {len(movies)} filmes inadequados"
+    return None
+
+
+def review(raw_response: Optional[dict], user_data: Input,
+           blocks: Optional[Callable[[str], bool]] = None) -> Tuple[str, Optional[Output]]:
+    """
+    Classifica a resposta bruta de uma tentativa: ("accepted", saída) ou o motivo da escalada
+    ("timeout", "error", "invalid" ou "low_quality"). Em "low_quality" a saída também volta,
+    para servir de reserva se o modelo principal falhar.
+    """
+    if raw_response is None or raw_response.get("status") == "error":
+        return ("timeout" if raw_response and raw_response.get("timeout") else "error"), None
+    try:
+        output = Output(**raw_response)
+    except Exception:
+        return "invalid", None
+    if quality_problem(output, user_data, blocks) is not None:
+        return "low_quality", output
+    return "accepted", output
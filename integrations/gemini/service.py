@@ -1,85 +1,420 @@
 # integrations/gemini/service.py
 
-from typing import Optional
-from integrations.gemini.client import GeminiClient
-from integrations.gemini.types import Input, Output
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, Iterator, Optional, Tuple
+
+import httpx
+
+from integrations.circuit_breaker import CircuitOpenError
+from integrations.deadline import DeadlineExceeded
+from integrations.gemini.cache import DjangoCacheBackend, ResponseCache, build_cache_key, format_scores, get_response_cache
+from integrations.gemini.client import GeminiStreamError, get_gemini_client
+from integrations.gemini.governor import get_governor
+from integrations.gemini.routing import (
+    FAST_DEADLINE_SHARE, FAST_MODEL, FAST_TIMEOUT, RECOMMENDATION_MODEL, ROUTING_ENABLED, fast_breaker, review,
+)
+from integrations.gemini.singleflight import CacheLock, SingleFlight, is_shared_cache
+from integrations.gemini.stream import IncrementalMovieParser
+from integrations.gemini.types import Input, Movie, Output
+from integrations.metrics import record_routing, span
+
+logger = logging.getLogger(__name__)
+
+# Partes fixas de toda chamada, montadas uma única vez na importação: o system instruction
+# (guia de personalidade, que também vai para o cache de contexto do Gemini) e o esquema de saída.
+SYSTEM_INSTRUCTION = (
+    "Você é um assistente de recomendação de filmes altamente especializado. "
+    "Sua função é analisar o perfil de um usuário e sugerir filmes que se alinhem perfeitamente "
+    "com seus gostos e o estado emocional desejado. Sua resposta deve estar EXCLUSIVAMENTE "
+    "no formato JSON, aderindo ao esquema fornecido.\n\n"
+    "**Guia de Interpretação dos Traços de Personalidade (Big Five/OCEAN):**\n"
+    "Para que suas recomendações sejam precisas, você DEVE usar o guia abaixo para entender como cada traço molda as preferências do usuário:\n\n"
+    "Os scores chegam no formato compacto `O=+1 C=0 E=-2 A=+2 N=-1` (Openness, Conscientiousness, Extraversion, "
+    "Agreeableness, Neuroticism), numa escala de -2 (muito baixo) a +2 (muito alto); 0 é neutro.\n\n"
+    "* **Openness (Abertura a Novas Experiências):**\n"
+    "  - **Score Alto**: Curiosidade intelectual, criatividade. Preferem filmes complexos, não convencionais, de arte, ficção científica com grandes conceitos ou documentários que desafiam o pensamento.\n"
+    "  - **Score Baixo**: Praticidade, preferência pelo familiar. Preferem filmes com narrativas diretas, gêneros clássicos (ação, comédia romântica) e histórias com as quais podem se identificar facilmente.\n\n"
+    "* **Conscientiousness (Conscienciosidade):**\n"
+    "  - **Score Alto**: Organização, disciplina. Apreciam filmes com roteiros bem estruturados, narrativas lógicas, dramas históricos precisos ou histórias sobre superação.\n"
+    "  - **Score Baixo**: Espontaneidade, flexibilidade. Podem gostar mais de comédias caóticas, filmes de aventura imprevisíveis ou thrillers com muitas reviravoltas.\n\n"
+    "* **Extraversion (Extroversão):**\n"
+    "  - **Score Alto**: Sociabilidade, busca por estímulos externos. Tendem a gostar de blockbusters, musicais e filmes de ação com alto valor de entretenimento.\n"
+    "  - **Score Baixo (Introversão)**: Preferência por introspecção. Costumam preferir dramas focados em personagens, thrillers psicológicos e histórias que convidam à reflexão.\n\n"
+    "* **Agreeableness (Amabilidade):**\n"
+    "  - **Score Alto**: Empatia, compaixão. Sentem-se atraídos por histórias inspiradoras, 'feel-good movies', dramas familiares e comédias românticas.\n"
+    "  - **Score Baixo**: Ceticismo, pensamento crítico. Podem preferir anti-heróis, humor ácido, comédia de humor negro ou dramas cínicos.\n\n"
+    "* **Neuroticism (Neuroticismo / Instabilidade Emocional):**\n"
+    "  - **Score Alto**: Sensibilidade a estresse. Podem usar filmes como catarse (gostando de dramas intensos ou terror) OU para evitar estresse (buscando filmes leves e reconfortantes).\n"
+    "  - **Score Baixo (Estabilidade Emocional)**: Calma, resiliência. Geralmente são flexíveis e apreciam uma vasta gama de tons emocionais sem se sentirem sobrecarregados.\n\n"
+    "**Regras para Recomendação:**\n"
+    "1. **Conexão Emocional**: Cada filme recomendado deve ser um excelente exemplo do sentimento alvo.\n"
+    "2. **Afinidade de Gênero**: A seleção deve priorizar os gêneros e temas favoritos do usuário.\n"
+    "3. **Coerência com a Personalidade**: A narrativa e o tom do filme devem ressoar com os traços de personalidade fornecidos, usando o guia acima.\n"
+    "4. **Evitar Blacklist**: JAMAIS recomende filmes que estão na lista de filmes a evitar.\n"
+)
+OUTPUT_SCHEMA = Output.model_json_schema()
+
+# Chamadas idênticas e simultâneas no mesmo processo compartilham uma única ida ao Gemini.
+_singleflight = SingleFlight()
 
 class GeminiService:
-    RECOMMENDATION_MODEL = "gemini-2.5-flash"
+    RECOMMENDATION_MODEL = RECOMMENDATION_MODEL
+    # Modelo rápido tentado antes do principal (ver `integrations/gemini/routing.py`); None desativa
+    FAST_MODEL = FAST_MODEL if ROUTING_ENABLED else None
+    # Intervalo de consulta ao cache compartilhado enquanto outro worker gera a mesma resposta
+    COALESCE_POLL_INTERVAL = 0.25
 
-    def __init__(self):
-        self.client = GeminiClient(model=self.RECOMMENDATION_MODEL)
+    def __init__(self, cache: Optional[ResponseCache] = None):
+        # Cliente compartilhado pelo processo (o SDK só é carregado na primeira chamada)
+        self.client = get_gemini_client(self.RECOMMENDATION_MODEL)
+        # O modelo rápido tem cota própria no Gemini, então também tem governador próprio
+        # (GEMINI_FAST_*): uma escalada não gasta duas vagas do limite do principal
+        self.fast_client = (
+            get_gemini_client(
+                self.FAST_MODEL, timeout=FAST_TIMEOUT, breaker=fast_breaker, deadline_share=FAST_DEADLINE_SHARE,
+                governor=get_governor("gemini-fast", "GEMINI_FAST"),
+            ) if self.FAST_MODEL else None
+        )
+        # Sem cache explícito, usa o cache compartilhado do processo (ou nenhum, se desativado).
+        self.cache = cache if cache is not None else get_response_cache()
 
     def _build_system_instruction(self) -> str:
-        # O system instruction (guia de personalidade) permanece o mesmo.
-        return (
-            "Você é um assistente de recomendação de filmes altamente especializado. "
-            "Sua função é analisar o perfil de um usuário e sugerir filmes que se alinhem perfeitamente "
-            "com seus gostos e o estado emocional desejado. Sua resposta deve estar EXCLUSIVAMENTE "
-            "no formato JSON, aderindo ao esquema fornecido.\n\n"
-            "**Guia de Interpretação dos Traços de Personalidade (Big Five/OCEAN):**\n"
-            "Para que suas recomendações sejam precisas, você DEVE usar o guia abaixo para entender como cada traço molda as preferências do usuário:\n\n"
-            "* **Openness (Abertura a Novas Experiências):**\n"
-            "  - **Score Alto**: Curiosidade intelectual, criatividade. Preferem filmes complexos, não convencionais, de arte, ficção científica com grandes conceitos ou documentários que desafiam o pensamento.\n"
-            "  - **Score Baixo**: Praticidade, preferência pelo familiar. Preferem filmes com narrativas diretas, gêneros clássicos (ação, comédia romântica) e histórias com as quais podem se identificar facilmente.\n\n"
-            "* **Conscientiousness (Conscienciosidade):**\n"
-            "  - **Score Alto**: Organização, disciplina. Apreciam filmes com roteiros bem estruturados, narrativas lógicas, dramas históricos precisos ou histórias sobre superação.\n"
-            "  - **Score Baixo**: Espontaneidade, flexibilidade. Podem gostar mais de comédias caóticas, filmes de aventura imprevisíveis ou thrillers com muitas reviravoltas.\n\n"
-            "* **Extraversion (Extroversão):**\n"
-            "  - **Score Alto**: Sociabilidade, busca por estímulos externos. Tendem a gostar de blockbusters, musicais e filmes de ação com alto valor de entretenimento.\n"
-            "  - **Score Baixo (Introversão)**: Preferência por introspecção. Costumam preferir dramas focados em personagens, thrillers psicológicos e histórias que convidam à reflexão.\n\n"
-            "* **Agreeableness (Amabilidade):**\n"
-            "  - **Score Alto**: Empatia, compaixão. Sentem-se atraídos por histórias inspiradoras, 'feel-good movies', dramas familiares e comédias românticas.\n"
-            "  - **Score Baixo**: Ceticismo, pensamento crítico. Podem preferir anti-heróis, humor ácido, comédia de humor negro ou dramas cínicos.\n\n"
-            "* **Neuroticism (Neuroticismo / Instabilidade Emocional):**\n"
-            "  - **Score Alto**: Sensibilidade a estresse. Podem usar filmes como catarse (gostando de dramas intensos ou terror) OU para evitar estresse (buscando filmes leves e reconfortantes).\n"
-            "  - **Score Baixo (Estabilidade Emocional)**: Calma, resiliência. Geralmente são flexíveis e apreciam uma vasta gama de tons emocionais sem se sentirem sobrecarregados.\n\n"
-            "**Regras para Recomendação:**\n"
-            "1. **Conexão Emocional**: Cada filme recomendado deve ser um excelente exemplo do sentimento alvo.\n"
-            "2. **Afinidade de Gênero**: A seleção deve priorizar os gêneros e temas favoritos do usuário.\n"
-            "3. **Coerência com a Personalidade**: A narrativa e o tom do filme devem ressoar com os traços de personalidade fornecidos, usando o guia acima.\n"
-            "4. **Evitar Blacklist**: JAMAIS recomende filmes que estão na lista de filmes a evitar.\n"
-        )
+        return SYSTEM_INSTRUCTION
 
     def _build_user_prompt(self, user_data: Input) -> str:
-        personality_scores = "\n".join([f"- {trait}: {score}" for trait, score in user_data.score.items()])
+        personality_scores = format_scores(user_data.score)
         blacklist_titles = ', '.join([movie.title for movie in user_data.blacklist]) if user_data.blacklist else "Nenhum"
+        recently_shown = ', '.join(user_data.recently_shown) if user_data.recently_shown else "Nenhum"
+
+        if len(user_data.moods) == 1:
+            # --- PROMPT TOTALMENTE REFEITO PARA FOCAR EM UM ÚNICO HUMOR ---
+            task = (
+                f"Gere uma lista curada contendo **exatamente 3 recomendações de filmes ranqueados (rank 1, 2, 3)** para o humor específico: **'{user_data.moods[0]}'**.\n\n"
+            )
+        else:
+            # Geração em lote: uma entrada em `recommendations` para cada humor, na mesma chamada
+            mood_list = ", ".join(f"'{mood}'" for mood in user_data.moods)
+            task = (
+                f"Para CADA um dos humores a seguir, gere uma lista curada contendo **exatamente 3 recomendações de filmes ranqueados (rank 1, 2, 3)**: **{mood_list}**.\n"
+                "Retorne um item em `recommendations` para cada humor, na mesma ordem, usando exatamente o nome do humor no campo `mood`. "
+                "Não repita filmes entre humores.\n\n"
+            )
+
+        if user_data.candidates:
+            # Com a pré-seleção do ranqueamento local, o modelo só reordena e justifica
+            candidate_list = "\n".join(f"- {candidate}" for candidate in user_data.candidates)
+            task += (
+                "Escolha os filmes EXCLUSIVAMENTE entre os candidatos abaixo (já filtrados pelo perfil), "
+                "mantendo título e ano exatamente como aparecem:\n"
+                f"{candidate_list}\n\n"
+            )
 
-        # --- PROMPT TOTALMENTE REFEITO PARA FOCAR EM UM ÚNICO HUMOR ---
         return (
             "Analise o perfil de usuário a seguir e gere as recomendações de acordo com as regras definidas.\n\n"
             "**Perfil do Usuário:**\n"
             f"- Gêneros/Temas Favoritos: {', '.join(user_data.preferences)}\n"
-            f"- Traços de Personalidade (Scores):\n{personality_scores}\n"
-            f"- Filmes a Evitar: {blacklist_titles}\n\n"
+            f"- Traços de Personalidade (Scores): {personality_scores}\n"
+            f"- Filmes a Evitar: {blacklist_titles}\n"
+            f"- Filmes Já Recomendados Recentemente (não repita): {recently_shown}\n\n"
             "**Sua Tarefa:**\n"
-            f"Gere uma lista curada contendo **exatamente 3 recomendações de filmes ranqueados (rank 1, 2, 3)** para o humor específico: **'{user_data.target_mood}'**.\n\n"
+            f"{task}"
             "Para cada filme, forneça uma justificativa clara (reason_for_recommendation) que conecte o filme diretamente ao perfil do usuário (gêneros e personalidade)."
         )
 
-    def get_recommendations(self, user_data: Input) -> Optional[Output]:
-        system_instruction = self._build_system_instruction()
-        user_prompt = self._build_user_prompt(user_data)
-
-        json_schema = Output.model_json_schema()
-
-        raw_response = self.client.generate_json_response(
-            prompt=user_prompt,
-            system_instruction=system_instruction,
-            json_schema=json_schema,
-        )
+    def _get_cached(self, cache_key: str) -> Optional[Output]:
+        if self.cache is None:
+            return None
+        cached_response = self.cache.get(cache_key)
+        if cached_response is not None:
+            logger.debug("Resposta do cache, gerada por %s.", cached_response.get("model", self.client.model))
+            return Output(**cached_response)
+        return None
 
+    def _handle_response(self, raw_response: Optional[dict], cache_key: str) -> Optional[Output]:
         if raw_response is None:
-            print("ERRO DE RECOMENDAÇÃO: A resposta da API foi nula.")
+            logger.error("ERRO DE RECOMENDAÇÃO: A resposta da API foi nula.")
             return None
         
         if raw_response.get("status") == "error":
-            print(f"ERRO DE RECOMENDAÇÃO: {raw_response.get('message', 'Erro desconhecido da API')}")
+            logger.error("ERRO DE RECOMENDAÇÃO: %s", raw_response.get('message', 'Erro desconhecido da API'))
             return None
 
         try:
-            return Output(**raw_response)
+            output = Output(**raw_response)
         except Exception as e:
-            print(f"ERRO DE VALIDAÇÃO DE SAÍDA: O JSON da LLM não se encaixa no modelo Output: {e}")
-            print(f"JSON Recebido: {raw_response}")
+            logger.error("ERRO DE VALIDAÇÃO DE SAÍDA: O JSON da LLM não se encaixa no modelo Output: %s", e)
+            logger.debug("JSON Recebido: %s", raw_response)
             return None
+
+        return self._store(output, cache_key, self.client.model)
+
+    def _store(self, output: Output, cache_key: str, model: str) -> Output:
+        """
+        Grava a saída sob a chave do pedido (que usa o modelo principal, para que as respostas
+        dos dois modelos do roteamento se reaproveitem), registrando em `model` quem a gerou.
+        """
+        if self.cache is not None:
+            self.cache.set(cache_key, {**output.model_dump(), "model": model})
+        return output
+
+    # --- ROTEAMENTO ENTRE MODELOS ---
+
+    def _review_fast(self, raw_response: Optional[dict], user_data: Input, blocks, seconds: float) -> Tuple[Optional[Output], Optional[Output]]:
+        """
+        Avalia a resposta do modelo rápido: (saída aceita, reserva de baixa qualidade).
+        Sem saída aceita, a geração escala para o modelo principal.
+        """
+        outcome, output = review(raw_response, user_data, blocks)
+        record_routing(self.fast_client.model, outcome, seconds)
+        if outcome == "accepted":
+            return output, None
+        logger.info("Roteamento do Gemini: %s → %s (%s).", self.fast_client.model, self.client.model, outcome)
+        return None, output
+
+    def _fast_circuit_open(self) -> Tuple[None, None]:
+        record_routing(self.fast_client.model, "circuit_open")
+        return None, None
+
+    def _try_fast(self, user_prompt: str, user_data: Input, blocks) -> Tuple[Optional[Output], Optional[Output]]:
+        started = time.perf_counter()
+        try:
+            with span("gemini.fast"):
+                raw_response = self.fast_client.generate_json_response(
+                    prompt=user_prompt, system_instruction=SYSTEM_INSTRUCTION, json_schema=OUTPUT_SCHEMA,
+                )
+        except CircuitOpenError:
+            return self._fast_circuit_open()
+        return self._review_fast(raw_response, user_data, blocks, time.perf_counter() - started)
+
+    async def _atry_fast(self, user_prompt: str, user_data: Input, blocks) -> Tuple[Optional[Output], Optional[Output]]:
+        started = time.perf_counter()
+        try:
+            with span("gemini.fast"):
+                raw_response = await self.fast_client.agenerate_json_response(
+                    prompt=user_prompt, system_instruction=SYSTEM_INSTRUCTION, json_schema=OUTPUT_SCHEMA,
+                )
+        except CircuitOpenError:
+            return self._fast_circuit_open()
+        return self._review_fast(raw_response, user_data, blocks, time.perf_counter() - started)
+
+    def _finish_strong(self, raw_response: Optional[dict], user_data: Input, cache_key: str,
+                       fallback: Optional[Output], seconds: float) -> Optional[Output]:
+        output = self._handle_response(raw_response, cache_key)
+        record_routing(self.client.model, "accepted" if output is not None else review(raw_response, user_data)[0], seconds)
+        # Se o modelo principal também falhar, a resposta fraca do rápido ainda serve (o pós-filtro a completa)
+        return output if output is not None else fallback
+
+    def _strong_circuit_open(self, error: CircuitOpenError, fallback: Optional[Output]) -> Output:
+        record_routing(self.client.model, "circuit_open")
+        if fallback is None:
+            raise error
+        return fallback
+
+    def _generate(self, user_prompt: str, user_data: Input, cache_key: str, blocks) -> Optional[Output]:
+        fallback = None
+        if self.fast_client is not None:
+            output, fallback = self._try_fast(user_prompt, user_data, blocks)
+            if output is not None:
+                return self._store(output, cache_key, self.fast_client.model)
+
+        started = time.perf_counter()
+        try:
+            raw_response = self.client.generate_json_response(
+                prompt=user_prompt, system_instruction=SYSTEM_INSTRUCTION, json_schema=OUTPUT_SCHEMA,
+            )
+        except CircuitOpenError as e:
+            return self._strong_circuit_open(e, fallback)
+        return self._finish_strong(raw_response, user_data, cache_key, fallback, time.perf_counter() - started)
+
+    async def _agenerate(self, user_prompt: str, user_data: Input, cache_key: str, blocks) -> Optional[Output]:
+        fallback = None
+        if self.fast_client is not None:
+            output, fallback = await self._atry_fast(user_prompt, user_data, blocks)
+            if output is not None:
+                return self._store(output, cache_key, self.fast_client.model)
+
+        started = time.perf_counter()
+        try:
+            raw_response = await self.client.agenerate_json_response(
+                prompt=user_prompt, system_instruction=SYSTEM_INSTRUCTION, json_schema=OUTPUT_SCHEMA,
+            )
+        except CircuitOpenError as e:
+            return self._strong_circuit_open(e, fallback)
+        return self._finish_strong(raw_response, user_data, cache_key, fallback, time.perf_counter() - started)
+
+    def _cache_lock(self) -> Optional[CacheLock]:
+        """
+        O agrupamento entre workers só é possível quando o cache de respostas usa o backend do
+        Django e esse cache é compartilhado entre os processos (CACHES): é por ele que os outros
+        workers recebem o resultado. Dentro do processo, o `SingleFlight` já agrupa as chamadas.
+        """
+        if (self.cache is not None and isinstance(self.cache.backend, DjangoCacheBackend)
+                and is_shared_cache(self.cache.backend.alias)):
+            return CacheLock(alias=self.cache.backend.alias)
+        return None
+
+    def _fetch_coalesced(self, cache_key: str, fetch) -> Optional[Output]:
+        lock = self._cache_lock()
+        if lock is None:
+            return fetch()
+
+        token = lock.acquire(cache_key)
+        if token is not None:
+            try:
+                return fetch()
+            finally:
+                lock.release(cache_key, token)
+
+        # Outro worker já está gerando esta resposta: aguarda ela aparecer no cache compartilhado.
+        deadline = time.monotonic() + lock.timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.COALESCE_POLL_INTERVAL)
+            cached_response = self.cache.peek(cache_key)
+            if cached_response is not None:
+                return Output(**cached_response)
+            if not lock.is_locked(cache_key):
+                break
+
+        # O outro worker falhou ou demorou demais: gera por conta própria.
+        return fetch()
+
+    async def _afetch_coalesced(self, cache_key: str, fetch) -> Optional[Output]:
+        lock = self._cache_lock()
+        if lock is None:
+            return await fetch()
+
+        token = await lock.aacquire(cache_key)
+        if token is not None:
+            try:
+                return await fetch()
+            finally:
+                await lock.arelease(cache_key, token)
+
+        deadline = time.monotonic() + lock.timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.COALESCE_POLL_INTERVAL)
+            cached_response = self.cache.peek(cache_key)
+            if cached_response is not None:
+                return Output(**cached_response)
+            if not await lock.ais_locked(cache_key):
+                break
+
+        return await fetch()
+
+    def get_recommendations(self, user_data: Input, blocks: Optional[Callable[[str], bool]] = None) -> Optional[Output]:
+        """
+        `blocks(título)` indica filmes que o usuário não pode receber (ex.: a blacklist completa);
+        o roteamento os usa para decidir se a resposta do modelo rápido é boa o bastante.
+        """
+        user_prompt = self._build_user_prompt(user_data)
+
+        cache_key = build_cache_key(user_data, SYSTEM_INSTRUCTION, self.client.model)
+        cached_output = self._get_cached(cache_key)
+        if cached_output is not None:
+            return cached_output
+
+        def fetch():
+            return self._generate(user_prompt, user_data, cache_key, blocks)
+
+        return _singleflight.do(cache_key, lambda: self._fetch_coalesced(cache_key, fetch))
+
+    async def aget_recommendations(self, user_data: Input, blocks: Optional[Callable[[str], bool]] = None) -> Optional[Output]:
+        """
+        Versão assíncrona de `get_recommendations`, para as views servidas via ASGI.
+        """
+        user_prompt = self._build_user_prompt(user_data)
+
+        cache_key = build_cache_key(user_data, SYSTEM_INSTRUCTION, self.client.model)
+        cached_output = self._get_cached(cache_key)
+        if cached_output is not None:
+            return cached_output
+
+        async def fetch():
+            return await self._agenerate(user_prompt, user_data, cache_key, blocks)
+
+        return await _singleflight.ado(cache_key, lambda: self._afetch_coalesced(cache_key, fetch))
+
+    def _stream_movies(self, client, user_prompt: str, parser: IncrementalMovieParser) -> Iterator[Tuple[Optional[str], Movie]]:
+        for chunk in client.stream_json_response(
+            prompt=user_prompt,
+            system_instruction=SYSTEM_INSTRUCTION,
+            json_schema=OUTPUT_SCHEMA,
+        ):
+            for mood_name, movie_data in parser.feed(chunk):
+                try:
+                    yield mood_name, Movie(**movie_data)
+                except ValueError as e:
+                    logger.warning("ERRO DE VALIDAÇÃO DE SAÍDA: filme ignorado no streaming: %s", e)
+
+    def _stream_fast(self, user_prompt: str, user_data: Input, cache_key: str, blocks):
+        """
+        Streaming pelo modelo rápido. Retorna False (para escalar ao principal) só se ele falhar
+        antes do primeiro filme; depois disso, os filmes entregues valem e o pós-filtro completa o resto.
+        """
+        started = time.perf_counter()
+        parser = IncrementalMovieParser()
+        delivered = False
+        try:
+            for item in self._stream_movies(self.fast_client, user_prompt, parser):
+                delivered = True
+                yield item
+        except CircuitOpenError:
+            self._fast_circuit_open()
+            return False
+        except GeminiStreamError as e:
+            if delivered:
+                raise
+            outcome = "timeout" if isinstance(e.__cause__, (httpx.TimeoutException, TimeoutError, DeadlineExceeded)) else "error"
+            record_routing(self.fast_client.model, outcome, time.perf_counter() - started)
+            logger.info("Roteamento do Gemini: %s → %s (%s).", self.fast_client.model, self.client.model, e)
+            return False
+
+        try:
+            raw_response = json.loads(parser.text)
+        except json.JSONDecodeError:
+            raw_response = None
+        outcome, output = review(raw_response, user_data, blocks)
+        if outcome == "accepted" and not delivered:
+            outcome = "invalid"
+        record_routing(self.fast_client.model, outcome, time.perf_counter() - started)
+        # Só respostas aceitas vão para o cache
+        if outcome == "accepted":
+            self._store(output, cache_key, self.fast_client.model)
+        elif not delivered:
+            logger.info("Roteamento do Gemini: %s → %s (%s).", self.fast_client.model, self.client.model, outcome)
+        return delivered
+
+    def stream_recommendations(self, user_data: Input, blocks: Optional[Callable[[str], bool]] = None) -> Iterator[Tuple[Optional[str], Movie]]:
+        """
+        Gera (humor, filme) assim que cada filme termina de chegar pelo streaming do Gemini,
+        em vez de esperar a resposta completa. Lança `GeminiStreamError` em caso de falha
+        (ou `GeminiOverloadedError`, se o governador não liberar a chamada a tempo).
+        """
+        user_prompt = self._build_user_prompt(user_data)
+
+        cache_key = build_cache_key(user_data, SYSTEM_INSTRUCTION, self.client.model)
+        cached_output = self._get_cached(cache_key)
+        if cached_output is not None:
+            for mood_rec in cached_output.recommendations:
+                for movie in mood_rec.movies:
+                    yield mood_rec.mood, movie
+            return
+
+        # O modelo rápido responde sozinho, a não ser que falhe antes do primeiro filme
+        if self.fast_client is not None and (yield from self._stream_fast(user_prompt, user_data, cache_key, blocks)):
+            return
+
+        started = time.perf_counter()
+        parser = IncrementalMovieParser()
+        yield from self._stream_movies(self.client, user_prompt, parser)
+
+        # Com a resposta completa, grava no cache como nas chamadas sem streaming
+        try:
+            output = self._handle_response(json.loads(parser.text), cache_key)
+        except json.JSONDecodeError:
+            output = None
+            logger.error("ERRO DE RECOMENDAÇÃO: Falha ao processar o JSON completo do streaming.")
+        record_routing(self.client.model, "accepted" if output is not None else "invalid", time.perf_counter() - started)
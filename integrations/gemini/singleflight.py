@@ -0,0 +1,136 @@
+# integrations/gemini/singleflight.py
+
+import asyncio
+import threading
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas simultâneas com a mesma chave: só a primeira (a "líder") executa,
+    e as demais aguardam e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self, wait_timeout: float = 120.0):
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            if not call.done.wait(self.wait_timeout):
+                # A líder está demorando demais: segue sozinho em vez de bloquear indefinidamente.
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versão assíncrona de `do`. As chamadas só são agrupadas dentro do mesmo event loop.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._async_calls.get(loop_key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._async_calls[loop_key] = task
+                task.add_done_callback(lambda _: self._forget(loop_key, task))
+
+        # `shield` evita que o cancelamento de uma requisição cancele a chamada compartilhada.
+        return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+
+    def _forget(self, loop_key: Tuple[int, str], task: asyncio.Task) -> None:
+        with self._lock:
+            if self._async_calls.get(loop_key) is task:
+                del self._async_calls[loop_key]
+
+
+# Backends de cache cujo conteúdo não é visto pelos outros processos
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def is_shared_cache(alias: str = "default") -> bool:
+    """
+    Indica se o cache `alias` do Django é visto por todos os processos (ex.: banco ou Redis).
+    """
+    from django.conf import settings
+
+    return settings.CACHES.get(alias, {}).get("BACKEND") not in PROCESS_LOCAL_CACHES
+
+
+class CacheLock:
+    """
+    Trava baseada no `cache.add` do Django, que só grava a chave se ela ainda não existir.
+    Só vale entre processos (workers do gunicorn) se o cache for compartilhado (`is_shared_cache`);
+    com um cache local, trava apenas o próprio processo.
+
+    `acquire` devolve um token (ou None), e `release` só apaga a chave se ela ainda for desse
+    token: uma trava que expirou e foi tomada por outro processo não é liberada por engano.
+    """
+
+    def __init__(self, alias: str = "default", timeout: int = 120):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"{key}:lock"
+
+    def acquire(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        return token if self._cache.add(self._lock_key(key), token, timeout=self.timeout) else None
+
+    def is_locked(self, key: str) -> bool:
+        return self._cache.get(self._lock_key(key)) is not None
+
+    def release(self, key: str, token: str) -> None:
+        if self._cache.get(self._lock_key(key)) == token:
+            self._cache.delete(self._lock_key(key))
+
+    async def aacquire(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        return token if await self._cache.aadd(self._lock_key(key), token, timeout=self.timeout) else None
+
+    async def ais_locked(self, key: str) -> bool:
+        return await self._cache.aget(self._lock_key(key)) is not None
+
+    async def arelease(self, key: str, token: str) -> None:
+        if await self._cache.aget(self._lock_key(key)) == token:
+            await self._cache.adelete(self._lock_key(key))
@@ -0,0 +1,79 @@
+# integrations/gemini/stream.py
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalMovieParser:
+    """
+    Extrai os filmes de uma resposta JSON (no formato de `Output`) à medida que ela chega
+    em pedaços pelo streaming, sem esperar o documento completo.
+
+    Cada chamada a `feed` devolve os filmes cujo objeto acabou de ser fechado, junto
+    com o nome do humor ao qual pertencem.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # Pilha de contêineres abertos: (caractere de abertura, chave, posição inicial)
+        self._stack: List[Tuple[str, Optional[str], int]] = []
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._current_mood: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        self._text += chunk
+        completed = []
+
+        while self._pos < len(self._text):
+            char = self._text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._on_string(json.loads(self._text[self._string_start:self._pos + 1]))
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char == ":":
+                self._pending_key = self._last_string
+            elif char in "{[":
+                key = self._pending_key
+                if key is None and self._stack and self._stack[-1][0] == "[":
+                    # Elementos de um array herdam a chave do array (ex.: itens de "movies")
+                    key = self._stack[-1][1]
+                self._stack.append((char, key, self._pos))
+                self._pending_key = None
+            elif char in "}]" and self._stack:
+                opening, key, start = self._stack.pop()
+                if opening == "{" and key == "movies" and self._stack and self._stack[-1][0] == "[":
+                    completed.append((self._current_mood, json.loads(self._text[start:self._pos + 1])))
+                self._pending_key = None
+            elif char == ",":
+                self._pending_key = None
+
+            self._pos += 1
+
+        return completed
+
+    def _on_string(self, value: str) -> None:
+        if self._pending_key is None:
+            # String em posição de chave
+            self._last_string = value
+            return
+
+        if self._pending_key == "mood":
+            self._current_mood = value
+        self._pending_key = None
@@ -1,7 +1,7 @@
 # integrations/gemini/types.py
 
-from pydantic import BaseModel, Field
-from typing import List, Dict
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Dict, Optional
 from typing_extensions import Annotated
 
 class BlacklistedMovieInput(BaseModel):
@@ -11,7 +11,20 @@ class Input(BaseModel):
     preferences: List[str] = Field(..., description="Lista de gêneros e temas favoritos do usuário.")
     score: Dict[str, float] = Field(..., description="Dicionário com os scores de personalidade do Big Five.")
     blacklist: List[BlacklistedMovieInput] = Field(default_factory=list, description="Lista de filmes a serem evitados.")
-    target_mood: str = Field(..., description="O humor específico para o qual as recomendações devem ser geradas.")
+    target_mood: Optional[str] = Field(None, description="O humor específico para o qual as recomendações devem ser geradas.")
+    target_moods: List[str] = Field(default_factory=list, description="Humores para geração em lote (uma única chamada). Quando informado, substitui `target_mood`.")
+    recently_shown: List[str] = Field(default_factory=list, description="Filmes já exibidos recentemente ao usuário, que não devem ser repetidos.")
+    candidates: List[str] = Field(default_factory=list, description="Pré-seleção de filmes (\"Título (Ano)\") do ranqueamento local. Quando informada, o modelo escolhe apenas entre eles.")
+
+    @model_validator(mode="after")
+    def _require_mood(self):
+        if not self.target_mood and not self.target_moods:
+            raise ValueError("Informe `target_mood` ou `target_moods`.")
+        return self
+
+    @property
+    def moods(self) -> List[str]:
+        return self.target_moods or [self.target_mood]
 
 class Movie(BaseModel):
     rank: Annotated[int, Field(description="Rank do filme dentro de seu humor (1, 2, ou 3)")]
@@ -0,0 +1,382 @@
+# integrations/hedging.py
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from typing import Awaitable, Callable, Deque, List, Optional, TypeVar
+
+from integrations.deadline import remaining
+from integrations.metrics import HEDGED_REQUESTS
+
+T = TypeVar("T")
+
+# Hedging: se uma chamada passa do quantil HEDGE_QUANTILE das latências recentes do serviço,
+# uma cópia é disparada e vale a primeira resposta aceitável. Só começa depois de
+# HEDGE_MIN_SAMPLES chamadas (janela de HEDGE_WINDOW) e nunca espera menos que HEDGE_MIN_DELAY.
+# HEDGE_MAX_IN_FLIGHT limita as chamadas com cópia simultâneas por serviço; acima disso elas
+# seguem sem cópia, para o hedging não dobrar a carga justo quando o serviço está lento.
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MAX_IN_FLIGHT = int(os.getenv("HEDGE_MAX_IN_FLIGHT", "16"))
+
+
+def _always(result) -> bool:
+    return True
+
+
+class Attempt:
+    """
+    Uma tentativa (a original ou a cópia) de uma chamada síncrona com hedging. O código da
+    chamada registra em `on_cancel` como interromper o que está fazendo (ex.: fechar o socket
+    da requisição); `cancel` faz isso quando a outra tentativa vence.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def finish(self) -> None:
+        # Terminada, a tentativa não interrompe mais nada (as conexões voltaram ao pool)
+        with self._lock:
+            self._callbacks = []
+
+
+_current_attempt: ContextVar[Optional[Attempt]] = ContextVar("hedge_attempt", default=None)
+
+
+def current_attempt() -> Optional[Attempt]:
+    """
+    Tentativa síncrona com hedging em andamento nesta thread, ou None.
+    """
+    return _current_attempt.get()
+
+
+class _Timers:
+    """
+    Uma única thread por processo para os disparos agendados das cópias, em vez de uma
+    thread (ou uma tarefa no pool) por chamada.
+    """
+
+    def __init__(self):
+        self._heap: list = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._pid: Optional[int] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> list:
+        entry = [time.monotonic() + delay, next(self._sequence), callback]
+        with self._condition:
+            if self._pid != os.getpid():
+                # Primeiro uso (ou processo criado por fork, que não herda a thread)
+                self._pid = os.getpid()
+                self._heap = []
+                threading.Thread(target=self._run, name="hedge-timers", daemon=True).start()
+            heapq.heappush(self._heap, entry)
+            self._condition.notify()
+        return entry
+
+    def cancel(self, entry: list) -> None:
+        with self._condition:
+            entry[2] = None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, callback = heapq.heappop(self._heap)
+            if callback is not None:
+                callback()
+
+
+_timers = _Timers()
+
+
+class LatencyTracker:
+    """
+    Janela das latências mais recentes das chamadas bem-sucedidas de um serviço.
+    """
+
+    def __init__(self, window: int = HEDGE_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Quantil `q` da janela, ou None enquanto houver menos de `min_samples` amostras.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class _Race:
+    """
+    Estado de uma chamada síncrona com hedging: a original roda na thread de quem chamou e a
+    cópia, se disparada, no pool do `Hedger`. A primeira resposta aceita vence e cancela a outra.
+    """
+
+    def __init__(self, hedger: "Hedger", call: Callable[[], T], accept: Callable[[T], bool]):
+        self.hedger = hedger
+        self.call = call
+        self.accept = accept
+        # A cópia herda o contexto da original: o prazo e os spans da requisição
+        self.context = copy_context()
+        self.original = Attempt()
+        self.hedge: Optional[Attempt] = None
+        self.hedge_future: Optional[Future] = None
+        # A tentativa vencedora: "original" ou o Future da cópia
+        self.winner = None
+        self.original_done = False
+        # Tentativas em andamento; a última a terminar devolve a vaga do `Hedger`
+        self.running = 1
+        self.lock = threading.Lock()
+
+    def fire(self) -> None:
+        """
+        Dispara a cópia (chamado pelo temporizador), se a original ainda não terminou.
+        """
+        with self.lock:
+            if self.original_done:
+                return
+            self.hedge = Attempt()
+            self.hedge_future = Future()
+            self.running += 1
+        HEDGED_REQUESTS.inc(service=self.hedger.service, result="fired")
+        self.hedger._get_executor().submit(self.context.run, self._run_hedge)
+
+    def _run_hedge(self) -> None:
+        try:
+            result = self.hedger._attempt(self.hedge, self.call, self.accept)
+        except BaseException as e:
+            self.hedge_future.set_exception(e)
+        else:
+            self.hedge_future.set_result(result)
+            with self.lock:
+                won = self.winner is None and not self.original_done and self.accept(result)
+                if won:
+                    self.winner = self.hedge_future
+            if won:
+                HEDGED_REQUESTS.inc(service=self.hedger.service, result="won")
+                self.original.cancel()
+        self.finished()
+
+    def finished(self) -> None:
+        with self.lock:
+            self.running -= 1
+            release = self.running == 0
+        if release:
+            self.hedger._slots.release()
+
+
+class Hedger:
+    """
+    Hedging das chamadas a um serviço externo: se a original não responde até o quantil
+    `quantile` das latências recentes, uma cópia idêntica é disparada e vale a primeira
+    resposta aceita por `accept`; a outra tentativa é cancelada. A cópia só sai se ainda
+    couber no prazo da requisição (`integrations.deadline`).
+
+    Na versão síncrona, a original roda na própria thread de quem chama e só a cópia usa o
+    pool de threads. Para a cópia poder vencer, a chamada precisa se interromper quando a sua
+    tentativa for cancelada (`current_attempt().on_cancel`); sem isso, o hedging síncrono não
+    adianta e a chamada deve ir direto ao serviço.
+
+    Cada cópia passa pelos mesmos disjuntores, filas e limites de taxa da chamada original,
+    então só vale a pena em chamadas idempotentes e baratas.
+    """
+
+    def __init__(self, service: str, enabled: bool = True, quantile: float = HEDGE_QUANTILE,
+                 min_delay: float = HEDGE_MIN_DELAY, max_in_flight: int = HEDGE_MAX_IN_FLIGHT,
+                 tracker: Optional[LatencyTracker] = None):
+        self.service = service
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.tracker = tracker or LatencyTracker()
+        self._max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def delay(self) -> Optional[float]:
+        """
+        Espera antes de disparar a cópia, ou None se não deve haver cópia agora.
+        """
+        if not self.enabled:
+            return None
+        slow = self.tracker.quantile(self.quantile)
+        if slow is None:
+            return None
+        delay = max(slow, self.min_delay)
+        left = remaining()
+        if left is not None and left <= delay:
+            return None
+        return delay
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_in_flight,
+                                                         thread_name_prefix=f"hedge-{self.service}")
+        return self._executor
+
+    def _timed(self, call: Callable[[], T], accept: Callable[[T], bool]) -> T:
+        started = time.perf_counter()
+        result = call()
+        if accept(result):
+            self.tracker.record(time.perf_counter() - started)
+        return result
+
+    def _attempt(self, attempt: Attempt, call: Callable[[], T], accept: Callable[[T], bool]) -> T:
+        token = _current_attempt.set(attempt)
+        try:
+            return self._timed(call, accept)
+        finally:
+            attempt.finish()
+            _current_attempt.reset(token)
+
+    async def _atimed(self, factory: Callable[[], Awaitable[T]], accept: Callable[[T], bool]) -> T:
+        started = time.perf_counter()
+        result = await factory()
+        if accept(result):
+            self.tracker.record(time.perf_counter() - started)
+        return result
+
+    def _first_accepted(self, results, accept: Callable, hedge):
+        """
+        Entre as tentativas terminadas, a primeira com resultado aceito (ou None).
+        """
+        for attempt in results:
+            if attempt.exception() is None and accept(attempt.result()):
+                if attempt is hedge:
+                    HEDGED_REQUESTS.inc(service=self.service, result="won")
+                return attempt
+        return None
+
+    def call(self, call: Callable[[], T], accept: Callable[[T], bool] = _always) -> T:
+        """
+        Executa `call()` com hedging. Exceções e resultados recusados por `accept` antes do
+        disparo da cópia voltam direto (as novas tentativas ficam com quem chamou); depois dele,
+        só voltam se as duas tentativas falharem.
+        """
+        if not self.enabled:
+            return call()
+        delay = self.delay()
+        if delay is None or not self._slots.acquire(blocking=False):
+            return self._timed(call, accept)
+
+        race = _Race(self, call, accept)
+        timer = _timers.schedule(delay, race.fire)
+        result = error = None
+        try:
+            result = self._attempt(race.original, call, accept)
+        except BaseException as e:
+            error = e
+
+        with race.lock:
+            race.original_done = True
+            _timers.cancel(timer)
+            if race.winner is None and error is None and accept(result):
+                race.winner = "original"
+            hedge, hedge_future, winner = race.hedge, race.hedge_future, race.winner
+        race.finished()
+
+        if winner == "original":
+            if hedge is not None:
+                hedge.cancel()
+            return result
+        if winner is not None:
+            return winner.result()
+        if hedge_future is not None:
+            # A original falhou: vale a cópia, se ela der certo
+            try:
+                hedge_result = hedge_future.result()
+            except Exception:
+                hedge_result = None
+            else:
+                if accept(hedge_result):
+                    HEDGED_REQUESTS.inc(service=self.service, result="won")
+                    return hedge_result
+        if error is not None:
+            raise error
+        return result
+
+    async def acall(self, factory: Callable[[], Awaitable[T]], accept: Callable[[T], bool] = _always) -> T:
+        """
+        Versão assíncrona de `call`: `factory()` cria a corrotina de cada tentativa, e a que
+        perde é cancelada (liberando a conexão e, no Gemini, a vaga do governador).
+        """
+        if not self.enabled:
+            return await factory()
+        delay = self.delay()
+        if delay is None:
+            return await self._atimed(factory, accept)
+
+        tasks = [asyncio.ensure_future(self._atimed(factory, accept))]
+        hedging = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._slots.acquire(blocking=False):
+                return await tasks[0]
+            hedging = True
+
+            tasks.append(asyncio.ensure_future(self._atimed(factory, accept)))
+            HEDGED_REQUESTS.inc(service=self.service, result="fired")
+            pending, failed = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = self._first_accepted(done, accept, tasks[1])
+                if winner is not None:
+                    return winner.result()
+                failed = failed or next(iter(done))
+            return failed.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            if hedging:
+                self._slots.release()
+
+
+def hedger_from_env(service: str, prefix: str, default_enabled: bool) -> Hedger:
+    """
+    Cria um `Hedger` ligado ou desligado por `<PREFIX>_HEDGE`.
+    """
+    default = "true" if default_enabled else "false"
+    return Hedger(service, enabled=os.getenv(f"{prefix}_HEDGE", default).lower() in ["1", "true", "yes"])
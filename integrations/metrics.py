@@ -0,0 +1,499 @@
+# integrations/metrics.py
+
+"""
+Métricas do processo no formato de texto do Prometheus (contadores, histogramas e medidores)
+e spans de tempo por etapa do caminho de geração. Não depende do Django: as integrações
+(Gemini, TMDb) registram suas métricas aqui e `cinemind/observability.py` expõe tudo em `/metrics`
+e no cabeçalho `Server-Timing`.
+
+Cada processo (worker do gunicorn/uvicorn) tem os próprios valores. Com METRICS_MULTIPROCESS_DIR,
+cada um grava periodicamente um retrato deles nesse diretório e `/metrics` devolve a soma de todos.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos histogramas de latência: do acerto de cache ao Gemini lento
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Métrica '{self.name}' espera os rótulos {self.label_names}, recebeu {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def empty_copy(self) -> "_Metric":
+        """
+        Métrica igual a esta, sem valores (usada para somar os retratos de vários processos).
+        """
+        raise NotImplementedError
+
+    def dump(self) -> list:
+        """
+        Valores atuais em formato JSON, para `load` em outro processo.
+        """
+        raise NotImplementedError
+
+    def load(self, state: list) -> None:
+        """
+        Soma aos valores atuais os de um retrato gerado por `dump`.
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines += list(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Valor que só cresce (ex.: requisições, tokens), por combinação de rótulos.
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def empty_copy(self) -> "Counter":
+        return Counter(self.name, self.documentation, self.label_names)
+
+    def dump(self) -> list:
+        return [[list(key), value] for key, value in self.values().items()]
+
+    def load(self, state: list) -> None:
+        with self._lock:
+            for key, value in state:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """
+    Distribuição de durações (em segundos) em buckets cumulativos, com soma e contagem.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Por combinação de rótulos: [contagens por bucket (não cumulativas), soma, total]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def empty_copy(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.label_names, self.buckets[:-1])
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._values.items()]
+
+    def load(self, state: list) -> None:
+        with self._lock:
+            for key, counts, total, count in state:
+                if len(counts) != len(self.buckets):
+                    continue  # retrato de uma versão com outros buckets
+                entry = self._values.setdefault(tuple(key), [[0] * len(self.buckets), 0.0, 0])
+                entry[0] = [current + added for current, added in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names + ("le",), key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Gauge(_Metric):
+    """
+    Valor derivado de um contador (`source`), calculado na hora da coleta por `collect`, que
+    recebe os valores do contador e retorna {valores dos rótulos: valor}. Por ser derivado, não
+    tem retrato próprio: na soma entre processos, é recalculado a partir do contador somado.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], source: Counter,
+                 collect: Callable[[Dict[LabelValues, float]], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labels)
+        self.source = source
+        self.collect = collect
+
+    def with_source(self, source: Counter) -> "Gauge":
+        return Gauge(self.name, self.documentation, self.label_names, source, self.collect)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in sorted(self.collect(self.source.values()).items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Todas as métricas no formato de texto do Prometheus (versão 0.0.4).
+        """
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+    def snapshot(self) -> Dict[str, list]:
+        """
+        Retrato dos valores do processo (sem os medidores, que são derivados).
+        """
+        return {metric.name: metric.dump() for metric in self._metrics if not isinstance(metric, Gauge)}
+
+    def render_merged(self, snapshots: Iterable[Dict[str, list]]) -> str:
+        """
+        Como `render`, mas com a soma dos retratos de vários processos.
+        """
+        merged = {metric.name: metric.empty_copy() for metric in self._metrics if not isinstance(metric, Gauge)}
+        for snapshot in snapshots:
+            for name, state in snapshot.items():
+                if name in merged:
+                    merged[name].load(state)
+        metrics = [
+            metric.with_source(merged[metric.source.name]) if isinstance(metric, Gauge) else merged[metric.name]
+            for metric in self._metrics
+        ]
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_http_request_duration_seconds", "Duração das requisições HTTP atendidas pela API.",
+    ("method", "route", "status"),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_stage_duration_seconds", "Duração de cada etapa instrumentada (spans).", ("stage",),
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "cinemind_stage_errors_total", "Etapas instrumentadas que terminaram com exceção.", ("stage",),
+))
+OUTBOUND_REQUESTS = REGISTRY.register(Counter(
+    "cinemind_outbound_requests_total",
+    "Chamadas HTTP a serviços externos, por resultado (código HTTP, 'error' para falhas de rede, 'circuit_open' ou 'cancelled' para a tentativa do hedging que perdeu).",
+    ("service", "status"),
+))
+OUTBOUND_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_outbound_request_duration_seconds", "Duração das chamadas HTTP a serviços externos.", ("service",),
+))
+GEMINI_TOKENS = REGISTRY.register(Counter(
+    "cinemind_gemini_tokens_total", "Tokens informados no usage metadata do Gemini, por tipo.", ("model", "kind"),
+))
+GEMINI_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_gemini_queue_wait_seconds", "Espera na fila do governador antes de cada chamada ao Gemini.",
+))
+GEMINI_TTFT_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_gemini_time_to_first_token_seconds", "Tempo até o primeiro pedaço de texto das respostas em streaming do Gemini.",
+))
+GEMINI_ROUTING = REGISTRY.register(Counter(
+    "cinemind_gemini_routing_total",
+    "Resultado de cada tentativa do roteamento entre modelos ('accepted', 'timeout', 'error', 'invalid', "
+    "'low_quality', 'circuit_open'); no modelo rápido, os demais resultados escalam para o principal "
+    "(no streaming, só se nenhum filme tiver sido entregue).",
+    ("model", "outcome"),
+))
+GEMINI_MODEL_SECONDS = REGISTRY.register(Histogram(
+    "cinemind_gemini_model_duration_seconds", "Duração de cada tentativa do roteamento, por modelo (incluindo a fila).", ("model",),
+))
+HEDGED_REQUESTS = REGISTRY.register(Counter(
+    "cinemind_hedged_requests_total",
+    "Cópias disparadas por hedging ('fired') e quantas delas responderam antes da original ('won').",
+    ("service", "result"),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cinemind_cache_requests_total", "Consultas aos caches da aplicação, por resultado ('hit' ou 'miss').", ("cache", "result"),
+))
+
+
+def _cache_hit_ratios(requests: Dict[LabelValues, float]) -> Dict[LabelValues, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in requests.items():
+        hits_and_total = totals.setdefault(cache, [0, 0])
+        hits_and_total[0] += value if result == "hit" else 0
+        hits_and_total[1] += value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    "cinemind_cache_hit_ratio", "Fração de acertos de cada cache desde o início do processo.", ("cache",),
+    CACHE_REQUESTS, _cache_hit_ratios,
+))
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+
+
+def record_outbound(service: str, status, seconds: Optional[float] = None) -> None:
+    OUTBOUND_REQUESTS.inc(service=service, status=status)
+    if seconds is not None:
+        OUTBOUND_SECONDS.observe(seconds, service=service)
+
+
+def record_routing(model: str, outcome: str, seconds: Optional[float] = None) -> None:
+    GEMINI_ROUTING.inc(model=model, outcome=outcome)
+    if seconds is not None:
+        GEMINI_MODEL_SECONDS.observe(seconds, model=model)
+
+
+def record_gemini_usage(model: str, usage) -> None:
+    """
+    Soma os tokens do `usage_metadata` de uma resposta do Gemini (campos ausentes contam zero).
+    `billed_input` é a entrada cobrada integralmente: o prompt menos a parte vinda do cache de contexto.
+    """
+    if usage is None:
+        return
+    counts = {}
+    for kind, field in (("prompt", "prompt_token_count"), ("candidates", "candidates_token_count"),
+                        ("cached", "cached_content_token_count"), ("thoughts", "thoughts_token_count")):
+        count = getattr(usage, field, None)
+        counts[kind] = count if isinstance(count, int) else 0
+    counts["billed_input"] = max(counts["prompt"] - counts["cached"], 0)
+    for kind, count in counts.items():
+        if count > 0:
+            GEMINI_TOKENS.inc(count, model=model, kind=kind)
+
+
+# --- AGREGAÇÃO ENTRE PROCESSOS ---
+
+# Diretório compartilhado pelos processos do serviço (vazio: cada processo expõe só os próprios
+# valores) e intervalo, em segundos, entre os retratos gravados por cada um
+METRICS_MULTIPROCESS_DIR = os.getenv("METRICS_MULTIPROCESS_DIR", "")
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "5"))
+
+
+class MultiprocessExporter:
+    """
+    Grava, a cada `interval` segundos (e ao sair), o retrato das métricas do processo em
+    `<directory>/metrics-<pid>-<id>.json`, e soma os retratos de todos os processos na coleta.
+
+    Os arquivos de processos que já terminaram continuam sendo somados, para que os contadores
+    não voltem atrás quando um worker é reciclado; limpe o diretório ao reiniciar o serviço.
+    """
+
+    def __init__(self, directory: str, interval: float = METRICS_EXPORT_INTERVAL, registry: Registry = REGISTRY):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._path: Optional[Path] = None
+        self._stop = threading.Event()
+        # Um processo criado por fork (ex.: gunicorn --preload) não herda a thread: começa de novo
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._path = self.directory / f"metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json"
+            self.directory.mkdir(parents=True, exist_ok=True)
+            threading.Thread(target=self._run, args=(self._stop,), name="metrics-export", daemon=True).start()
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        if self._path is None:
+            return
+        temporary = self._path.with_suffix(".tmp")
+        try:
+            temporary.write_text(json.dumps(self.registry.snapshot()))
+            os.replace(temporary, self._path)
+        except OSError as e:
+            logger.warning("Erro ao gravar as métricas em %s: %s", self._path, e)
+
+    def render(self) -> str:
+        """
+        Soma dos retratos de todos os processos; o do processo atual é lido da memória.
+        """
+        snapshots = [self.registry.snapshot()]
+        for path in self.directory.glob("metrics-*.json"):
+            if path == self._path:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError) as e:
+                logger.warning("Retrato de métricas ignorado (%s): %s", path, e)
+        return self.registry.render_merged(snapshots)
+
+
+_exporter: Optional[MultiprocessExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_metrics_exporter() -> Optional[MultiprocessExporter]:
+    """
+    Exportador do processo, já iniciado, ou None se METRICS_MULTIPROCESS_DIR não estiver definido.
+    """
+    global _exporter
+
+    if not METRICS_MULTIPROCESS_DIR:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = MultiprocessExporter(METRICS_MULTIPROCESS_DIR)
+            atexit.register(lambda: _exporter.write())
+    _exporter.start()
+    return _exporter
+
+
+# --- SPANS E SERVER-TIMING ---
+
+# Etapas medidas na requisição atual, em ordem: (nome, segundos). None fora de uma requisição.
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings():
+    """
+    Começa a coletar os spans da requisição atual. Retorna o token para `stop_request_timings`.
+    """
+    return _request_timings.set([])
+
+
+def stop_request_timings(token) -> List[Tuple[str, float]]:
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Mede uma etapa: alimenta `cinemind_stage_duration_seconds` (e `cinemind_stage_errors_total`,
+    se ela lançar um erro) e, dentro de uma requisição, o cabeçalho `Server-Timing`.
+    Funciona também em código assíncrono (`with span(...)` em volta de `await`).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def record_span(stage: str, seconds: float) -> None:
+    """
+    Registra uma etapa já medida (ex.: a espera na fila do governador).
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """
+    Valor do cabeçalho `Server-Timing` (durações em ms). Etapas repetidas (ex.: uma busca no
+    TMDb por filme) são somadas, com o número de ocorrências na descrição.
+    """
+    merged: Dict[str, List[float]] = {}
+    for stage, seconds in timings:
+        entry = merged.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    parts = [
+        f'{stage};dur={seconds * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else "")
+        for stage, (seconds, count) in merged.items()
+    ]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,625 @@
+# integrations/tests.py
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import pytest
+
+from integrations import circuit_breaker
+from integrations.circuit_breaker import CircuitBreaker, CircuitOpenError
+from integrations.deadline import DeadlineExceeded, call_timeout, deadline
+from integrations.gemini import GeminiService
+from integrations.gemini import client as gemini_client
+from integrations.gemini.cache import DjangoCacheBackend, InMemoryCacheBackend, ResponseCache
+from integrations.gemini.context_cache import ContextCache
+from integrations.gemini.stream import IncrementalMovieParser
+from integrations.gemini.governor import (
+    DjangoGovernorBackend, GeminiOverloadedError, InMemoryGovernorBackend, RateGovernor, get_governor,
+)
+from integrations.gemini.types import Input
+from integrations.gemini.singleflight import CacheLock
+from integrations.hedging import Hedger, LatencyTracker
+from integrations.metrics import CACHE_REQUESTS, GEMINI_ROUTING, HEDGED_REQUESTS, REGISTRY, MultiprocessExporter
+from integrations.tmdb import TMDbService, client as tmdb_client
+
+OUTPUT = {"recommendations": [{"mood": "Feliz", "movies": []}]}
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@pytest.fixture
+def gemini_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+
+
+@pytest.fixture
+def local_cache(settings):
+    """
+    Cache em memória do processo, limpo ao fim do teste.
+    """
+    from django.core.cache import cache
+
+    settings.CACHES = LOCMEM
+    yield cache
+    cache.clear()
+
+
+def test_cache_lock_needs_shared_cache(gemini_key, local_cache):
+    service = GeminiService(cache=ResponseCache(DjangoCacheBackend(), 60))
+    assert service._cache_lock() is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_coalesced_fetch_waits_for_other_worker(gemini_key):
+    service = GeminiService(cache=ResponseCache(DjangoCacheBackend(), 60))
+    service.COALESCE_POLL_INTERVAL = 0.05
+    lock, key = CacheLock(), "gemini:test-coalesce"
+    token = lock.acquire(key)
+    assert token is not None and lock.acquire(key) is None
+
+    def other_worker():
+        time.sleep(0.2)
+        service.cache.set(key, OUTPUT)
+        lock.release(key, token)
+
+    threading.Thread(target=other_worker).start()
+    fetch = mock.Mock()
+    assert service._fetch_coalesced(key, fetch) is not None
+    assert not fetch.called
+
+
+@pytest.mark.django_db
+def test_cache_lock_release_keeps_other_holder():
+    lock, key = CacheLock(timeout=1), "gemini:test-release"
+    stale = lock.acquire(key)
+    lock._cache.delete(lock._lock_key(key))  # expirou
+    current = lock.acquire(key)
+    lock.release(key, stale)
+    assert current is not None and lock.is_locked(key)
+    lock.release(key, current)
+    assert not lock.is_locked(key)
+
+
+def test_django_governor_allows_one_call_per_window_at_max_penalty(local_cache):
+    backend = DjangoGovernorBackend(max_concurrency=2, qps=5)
+    for _ in range(8):
+        backend.penalize(0)
+    assert backend.penalty == 6
+
+    token, wait = backend.try_acquire()
+    assert token is not None and wait == 0
+    backend.release(token)
+
+
+def test_django_governor_penalty_expires(local_cache, monkeypatch):
+    monkeypatch.setattr(DjangoGovernorBackend, "PENALTY_TTL", 1)
+    backend = DjangoGovernorBackend(max_concurrency=2, qps=5)
+    backend.penalize(0)
+    assert backend.penalty == 1
+    time.sleep(1.1)
+    assert backend.penalty == 0
+
+
+
+def _recommendations(prefix, movies=3):
+    return {"recommendations": [{"mood": "Alegria", "movies": [
+        {"rank": rank, "title": f"{prefix} {rank}", "year": 2000, "synopsis": "s",
+         "reason_for_recommendation": "r", "tags": []}
+        for rank in range(1, movies + 1)
+    ]}]}
+
+
+@pytest.fixture
+def routed_service(gemini_key):
+    """
+    Serviço com roteamento entre um modelo rápido e o principal, ambos simulados.
+    """
+    service = GeminiService(cache=ResponseCache(InMemoryCacheBackend()))
+    service.client = mock.Mock(model="main-model")
+    service.fast_client = mock.Mock(model="fast-model")
+    return service
+
+
+def _route(service, fast, main):
+    """
+    Gera com as respostas simuladas e devolve (saída, chamadas ao principal, decisões do rápido).
+    """
+    if isinstance(fast, Exception):
+        service.fast_client.generate_json_response.side_effect = fast
+    else:
+        service.fast_client.generate_json_response.return_value = fast
+    service.client.generate_json_response.return_value = main
+    before = GEMINI_ROUTING.values()
+    output = service.get_recommendations(Input(preferences=["Drama"], score={"openness": 0.5}, target_mood="Alegria"))
+    outcomes = {
+        outcome: value - before.get((model, outcome), 0)
+        for (model, outcome), value in GEMINI_ROUTING.values().items()
+        if model == "fast-model" and value != before.get((model, outcome), 0)
+    }
+    return output, service.client.generate_json_response.call_count, outcomes
+
+
+def _cached_model(service):
+    entries = [entry for _, entry in service.cache.backend._data.values()]
+    return [entry["model"] for entry in entries]
+
+
+def test_routing_accepts_fast_answer(routed_service):
+    output, main_calls, outcomes = _route(routed_service, _recommendations("Rápido"), _recommendations("Principal"))
+    assert output.recommendations[0].movies[0].title == "Rápido 1"
+    assert main_calls == 0
+    assert outcomes == {"accepted": 1}
+    assert _cached_model(routed_service) == ["fast-model"]
+
+
+def test_routing_falls_back_to_low_quality_answer(routed_service):
+    output, main_calls, outcomes = _route(
+        routed_service, _recommendations("Rápido", movies=2), {"status": "error", "message": "falhou"},
+    )
+    # O principal falhou: vale a resposta fraca do rápido, que não vai para o cache
+    assert output.recommendations[0].movies[0].title == "Rápido 1"
+    assert main_calls == 1
+    assert outcomes == {"low_quality": 1}
+    assert _cached_model(routed_service) == []
+
+
+def test_routing_escalates_on_fast_timeout(routed_service):
+    output, main_calls, outcomes = _route(
+        routed_service, {"status": "error", "message": "timeout", "timeout": True}, _recommendations("Principal"),
+    )
+    assert output.recommendations[0].movies[0].title == "Principal 1"
+    assert main_calls == 1
+    assert outcomes == {"timeout": 1}
+    assert _cached_model(routed_service) == ["main-model"]
+
+
+def test_routing_skips_fast_model_with_open_circuit(routed_service):
+    output, main_calls, outcomes = _route(
+        routed_service, CircuitOpenError("gemini-fast", 30), _recommendations("Principal"),
+    )
+    assert output.recommendations[0].movies[0].title == "Principal 1"
+    assert main_calls == 1
+    assert outcomes == {"circuit_open": 1}
+
+
+def test_fast_model_has_own_governor(gemini_key):
+    service = GeminiService(cache=None)
+    if service.fast_client is None:
+        pytest.skip("roteamento desativado (GEMINI_FAST_MODEL)")
+    assert service.fast_client.governor is get_governor("gemini-fast", "GEMINI_FAST")
+    assert service.fast_client.governor is not service.client.governor
+
+
+def _sample(text, prefix):
+    return next(float(line.split()[-1]) for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_metrics_exporter_sums_processes(tmp_path):
+    exporter = MultiprocessExporter(str(tmp_path), interval=3600)
+    exporter.start()
+    exporter.write()
+    own = REGISTRY.snapshot()
+
+    # Outro processo com 3 acertos e 1 falha no cache "test"
+    other = {name: [] for name in own}
+    other[CACHE_REQUESTS.name] = [[["test", "hit"], 3], [["test", "miss"], 1]]
+    (tmp_path / "metrics-1-other.json").write_text(json.dumps(other))
+
+    hits = CACHE_REQUESTS.values().get(("test", "hit"), 0)
+    misses = CACHE_REQUESTS.values().get(("test", "miss"), 0)
+    text = exporter.render()
+    assert _sample(text, 'cinemind_cache_requests_total{cache="test",result="hit"}') == hits + 3
+    assert _sample(text, 'cinemind_cache_hit_ratio{cache="test"}') == pytest.approx((hits + 3) / (hits + misses + 4))
+
+
+@pytest.mark.django_db
+def test_metrics_requires_token_outside_debug(client, settings):
+    settings.DEBUG = False
+    settings.METRICS_TOKEN = ""
+    assert client.get("/metrics").status_code == 403
+
+    settings.METRICS_TOKEN = "secret"
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code == 200
+
+
+def test_call_timeout_raises_after_deadline():
+    with deadline(0.3):
+        assert call_timeout(5) <= 0.3
+        time.sleep(0.25)
+        with pytest.raises(DeadlineExceeded):
+            call_timeout(5)
+
+
+def test_governor_queue_gives_up_at_deadline():
+    governor = RateGovernor(InMemoryGovernorBackend(max_concurrency=1, qps=100, burst=100), queue_timeout=30)
+    with governor.acquire():
+        started = time.monotonic()
+        with deadline(0.2), pytest.raises(GeminiOverloadedError):
+            with governor.acquire():
+                pass
+    assert time.monotonic() - started < 1
+
+
+def test_tmdb_search_without_time_left_returns_none(monkeypatch):
+    monkeypatch.setenv("TMDB_API_KEY", "test")
+    get = mock.Mock()
+    monkeypatch.setattr(tmdb_client, "get_http_session", lambda: mock.Mock(get=get))
+    with deadline(0.01):
+        time.sleep(0.02)
+        assert tmdb_client.TMDbClient().search_movie("Filme", 2000) is None
+    get.assert_not_called()
+
+
+def test_tmdb_search_tells_not_found_from_failure(monkeypatch):
+    monkeypatch.setenv("TMDB_API_KEY", "test")
+    client = tmdb_client.TMDbClient()
+    monkeypatch.setattr(client, "_get", lambda url, params: mock.Mock(json=lambda: {"results": []}))
+    assert TMDbService._first_result(client.search_movie("Filme", 2000)) == {}
+
+    monkeypatch.setattr(client, "_get", mock.Mock(side_effect=tmdb_client.requests.ConnectionError("fora do ar")))
+    assert TMDbService._first_result(client.search_movie("Filme", 2000)) is None
+
+
+def _warm_hedger(service):
+    # Uma amostra de 0,1s basta para a cópia sair 0,1s depois da original
+    hedger = Hedger(service, tracker=LatencyTracker(min_samples=1))
+    hedger.tracker.record(0.1)
+    return hedger
+
+
+def test_sync_hedge_runs_original_inline():
+    hedger = _warm_hedger("test-inline")
+    caller = threading.get_ident()
+    assert hedger.call(threading.get_ident) == caller
+    assert hedger._executor is None
+
+
+@pytest.fixture
+def slow_first_tmdb(monkeypatch):
+    """
+    TMDb local em que a primeira busca leva 2s e as demais respondem na hora.
+    """
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            requests_seen.append(self.path)
+            if len(requests_seen) == 1:
+                time.sleep(2)
+            body = json.dumps({"results": [{"id": len(requests_seen), "release_date": "2000-01-01"}]}).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass  # conexão fechada pela tentativa que perdeu
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("TMDB_API_KEY", "test")
+    monkeypatch.setattr(tmdb_client.TMDbClient, "BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(tmdb_client, "tmdb_hedger", _warm_hedger("tmdb-test"))
+    yield requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_hedge_wins_and_cancels_original(slow_first_tmdb):
+    started = time.monotonic()
+    data = tmdb_client.TMDbClient().search_movie("Filme", 2000)
+    elapsed = time.monotonic() - started
+
+    assert data["results"][0]["id"] == 2
+    assert elapsed < 1
+    # A original foi interrompida e não voltou a ser tentada
+    assert len(slow_first_tmdb) == 2
+    assert HEDGED_REQUESTS.values()[("tmdb-test", "won")] == 1
+
+
+def test_async_hedge_wins_and_cancels_original():
+    hedger = _warm_hedger("test-async")
+    calls = []
+
+    async def attempt():
+        calls.append(time.monotonic())
+        try:
+            await asyncio.sleep(2 if len(calls) == 1 else 0.1)
+        except asyncio.CancelledError:
+            calls.append("cancelled")
+            raise
+        return len(calls)
+
+    started = time.monotonic()
+    result = asyncio.run(hedger.acall(attempt))
+    assert result == 2
+    assert time.monotonic() - started < 1
+    assert "cancelled" in calls
+
+
+STREAMED_OUTPUT = json.dumps({"recommendations": [
+    {"mood": "Alegre", "movies": [
+        {"rank": 1, "title": 'O "Grande" Dia', "year": 2001, "genres": [["Comédia", "Drama"], []],
+         "reason_for_recommendation": "Tem \\ barra e { chaves }", "tags": ["mood", "movies"]},
+        {"rank": 2, "title": "Segundo", "year": 2002, "genres": [], "reason_for_recommendation": "r", "tags": []},
+    ]},
+    {"mood": "Triste", "movies": [
+        {"rank": 1, "title": "Terceiro", "year": 2003, "genres": [["Drama"]], "reason_for_recommendation": "r", "tags": []},
+    ]},
+]}, ensure_ascii=False)
+
+
+def _parse_in_chunks(text, size):
+    parser = IncrementalMovieParser()
+    movies = []
+    for start in range(0, len(text), size):
+        movies.extend(parser.feed(text[start:start + size]))
+    return parser, movies
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(STREAMED_OUTPUT)])
+def test_incremental_parser_handles_any_chunk_boundary(size):
+    # Tamanho 1 corta dentro de strings, entre a barra e as aspas escapadas e no meio das chaves
+    parser, movies = _parse_in_chunks(STREAMED_OUTPUT, size)
+
+    expected = [
+        (mood_rec["mood"], movie)
+        for mood_rec in json.loads(STREAMED_OUTPUT)["recommendations"] for movie in mood_rec["movies"]
+    ]
+    assert movies == expected
+    assert movies[0][1]["title"] == 'O "Grande" Dia'
+    assert [mood for mood, _ in movies] == ["Alegre", "Alegre", "Triste"]
+    assert parser.text == STREAMED_OUTPUT
+
+
+def test_incremental_parser_emits_each_movie_when_it_closes():
+    parser = IncrementalMovieParser()
+    first_movie_end = STREAMED_OUTPUT.index('"tags": ["mood", "movies"]}') + len('"tags": ["mood", "movies"]}')
+
+    assert parser.feed(STREAMED_OUTPUT[:first_movie_end - 1]) == []
+    [(mood, movie)] = parser.feed(STREAMED_OUTPUT[first_movie_end - 1:first_movie_end])
+    assert (mood, movie["rank"]) == ("Alegre", 1)
+    assert len(parser.feed(STREAMED_OUTPUT[first_movie_end:])) == 2
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Relógio manual do disjuntor: avance com `clock.now += segundos`.
+    """
+    fake = SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    return fake
+
+
+def _fail(breaker):
+    with pytest.raises(ConnectionError), breaker.guard(lambda e: True):
+        raise ConnectionError("fora do ar")
+
+
+def test_breaker_opens_at_failure_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+    _fail(breaker)
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(20)
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    _fail(breaker)
+    with breaker.guard(lambda e: True):
+        pass
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_after_recovery_timeout(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30, half_open_max_calls=2)
+    _fail(breaker)
+    clock.now += 29.9
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 0.1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # Só `half_open_max_calls` chamadas de teste ao mesmo tempo
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=5, recovery_timeout=30)
+    for _ in range(5):
+        _fail(breaker)
+    clock.now += 30
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_release_frees_probe_on_client_errors(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30)
+    _fail(breaker)
+    clock.now += 30
+
+    # Um erro que não indica indisponibilidade (ex.: 4xx) devolve a vaga de teste sem mudar o estado
+    with pytest.raises(ValueError), breaker.guard(lambda e: isinstance(e, ConnectionError)):
+        raise ValueError("requisição inválida")
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with breaker.guard(lambda e: True):
+        pass
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# --- CLIENTE GEMINI ---
+
+def test_gemini_client_is_shared_per_model(gemini_key, monkeypatch):
+    monkeypatch.setattr(gemini_client, "_clients", {})
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: gemini_client.get_gemini_client("modelo-a", timeout=5), range(16)))
+
+    assert all(client is clients[0] for client in clients)
+    # Os parâmetros só valem na criação
+    assert gemini_client.get_gemini_client("modelo-a", timeout=60) is clients[0]
+    assert clients[0].timeout == 5
+    assert gemini_client.get_gemini_client("modelo-b") is not clients[0]
+
+
+def test_gemini_sdk_is_imported_on_first_use():
+    # Processo novo: neste aqui o SDK já foi importado por outros testes
+    script = (
+        "import sys, django; django.setup();"
+        "from django.urls import get_resolver; get_resolver().url_patterns;"
+        "from integrations.gemini.client import get_gemini_client;"
+        "client = get_gemini_client('gemini-2.5-flash');"
+        "assert 'google.genai' not in sys.modules, 'importado no boot';"
+        "client.client;"
+        "assert 'google.genai' in sys.modules, 'não importado no uso'"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], env={**os.environ, "GEMINI_API_KEY": "test"},
+        capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def _api_error(code, message="erro", retry_delay=None):
+    from google.genai import errors
+    details = [{"retryDelay": retry_delay}] if retry_delay else []
+    return errors.ClientError(code, {"error": {"code": code, "message": message, "details": details}})
+
+
+@pytest.fixture
+def fake_gemini(gemini_key, monkeypatch):
+    """
+    `GeminiClient` com disjuntor e governador próprios sobre um `genai.Client` falso: cada
+    chamada consome o próximo item de `fake_gemini.outcomes` (exceção ou texto da resposta)
+    e anota a configuração usada em `fake_gemini.configs`.
+    """
+    monkeypatch.setattr(gemini_client, "get_context_cache", lambda model, system_instruction: None)
+    client = gemini_client.GeminiClient(
+        model="teste", breaker=CircuitBreaker("teste", failure_threshold=100),
+        governor=RateGovernor(InMemoryGovernorBackend(max_concurrency=2, qps=100, burst=100)),
+    )
+    outcomes = []
+
+    def next_outcome():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    configs = []
+
+    def generate_content(model, contents, config):
+        configs.append(config)
+        return SimpleNamespace(text=next_outcome(), usage_metadata=None)
+
+    async def agenerate_content(model, contents, config):
+        return generate_content(model, contents, config)
+
+    def generate_content_stream(model, contents, config):
+        configs.append(config)
+        text = next_outcome()
+        return iter([SimpleNamespace(text=text, usage_metadata=None)])
+
+    client.client = SimpleNamespace(
+        models=SimpleNamespace(generate_content=generate_content, generate_content_stream=generate_content_stream),
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content=agenerate_content)),
+        caches=SimpleNamespace(create=lambda model, config: SimpleNamespace(name=f"cachedContents/{len(configs)}")),
+    )
+    return SimpleNamespace(client=client, outcomes=outcomes, configs=configs)
+
+
+def _stream(client):
+    return "".join(client.stream_json_response("prompt", "sistema", {}))
+
+
+def test_blocking_and_streaming_calls_classify_errors_alike(fake_gemini):
+    client = fake_gemini.client
+    for error, expected in [
+        (httpx.ReadTimeout("lento"), "Tempo limite da API do Gemini excedido"),
+        (_api_error(400), "Erro na API do Gemini"),
+        (ValueError("?"), "Erro inesperado no cliente Gemini"),
+    ]:
+        fake_gemini.outcomes[:] = [error, error]
+        response = client.generate_json_response("prompt", "sistema", {})
+        with pytest.raises(gemini_client.GeminiStreamError) as stream_error:
+            _stream(client)
+        assert response["message"].startswith(expected)
+        assert str(stream_error.value).startswith(expected)
+        assert stream_error.value.__cause__ is error
+
+    fake_gemini.outcomes[:] = ["{não é json"]
+    assert client.generate_json_response("prompt", "sistema", {})["message"] == "Falha ao processar o JSON retornado pela LLM."
+
+
+def test_rate_limited_calls_are_retried(fake_gemini):
+    client, rate_limited = fake_gemini.client, _api_error(429, retry_delay="0.01s")
+
+    fake_gemini.outcomes[:] = [rate_limited, json.dumps(OUTPUT)]
+    assert client.generate_json_response("prompt", "sistema", {}) == OUTPUT
+    fake_gemini.outcomes[:] = [rate_limited, json.dumps(OUTPUT)]
+    assert json.loads(_stream(client)) == OUTPUT
+
+    fake_gemini.outcomes[:] = [rate_limited] * (client.RATE_LIMIT_RETRIES + 1)
+    with pytest.raises(GeminiOverloadedError):
+        _stream(client)
+
+
+CACHE_EXPIRED = "CachedContent not found (or permission denied)"
+
+
+@pytest.mark.parametrize("call", [
+    lambda client: client.generate_json_response("prompt", "sistema", {}),
+    lambda client: asyncio.run(client.agenerate_json_response("prompt", "sistema", {})),
+    lambda client: json.loads(_stream(client)),
+], ids=["sync", "async", "stream"])
+def test_expired_context_cache_is_dropped_and_call_retried(fake_gemini, monkeypatch, call):
+    context_cache = ContextCache("teste", "sistema")
+    monkeypatch.setattr(gemini_client, "get_context_cache", lambda model, system_instruction: context_cache)
+    fake_gemini.outcomes[:] = [_api_error(404, CACHE_EXPIRED), json.dumps(OUTPUT)]
+
+    assert call(fake_gemini.client) == OUTPUT
+    expired, retried = fake_gemini.configs
+    assert expired.cached_content == "cachedContents/0"
+    assert retried.cached_content is None and retried.system_instruction == "sistema"
+    # O próximo uso cria outro cache
+    assert context_cache.name(fake_gemini.client.client) == "cachedContents/2"
+
+
+def test_unrelated_permission_error_keeps_context_cache(fake_gemini, monkeypatch):
+    context_cache = ContextCache("teste", "sistema")
+    monkeypatch.setattr(gemini_client, "get_context_cache", lambda model, system_instruction: context_cache)
+    fake_gemini.outcomes[:] = [_api_error(403, "Permission denied: API key not valid"), json.dumps(OUTPUT)]
+
+    response = fake_gemini.client.generate_json_response("prompt", "sistema", {})
+    assert response["status"] == "error"
+    assert len(fake_gemini.configs) == 1
+    assert context_cache.name(fake_gemini.client.client) == "cachedContents/0"
@@ -1,3 +1,4 @@
 # integrations/tmdb/__init__.py
 
-from .service import TMDbService
\ No newline at end of file
+from .client import TMDbClient, AsyncTMDbClient, get_tmdb_client, get_async_tmdb_client
+from .service import TMDbService
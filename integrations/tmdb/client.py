@@ -1,78 +1,443 @@
 # integrations/tmdb/client.py
 
+import asyncio
+import contextlib
+import logging
 import os
+import socket
+import threading
+import time
+import weakref
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict, Any
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from integrations.circuit_breaker import CircuitOpenError, breaker_from_env
+from integrations.deadline import MIN_CALL_TIMEOUT, DeadlineExceeded, call_timeout, remaining
+from integrations.hedging import current_attempt, hedger_from_env
+from integrations.metrics import record_outbound, span
+
+logger = logging.getLogger(__name__)
+
+# Política de conexões e novas tentativas (configurável por variáveis de ambiente)
+POOL_MAXSIZE = int(os.getenv("TMDB_POOL_MAXSIZE", "20"))
+MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", "2"))
+BACKOFF_FACTOR = float(os.getenv("TMDB_BACKOFF_FACTOR", "0.3"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Timeout de cada chamada, em segundos (limitado pelo que resta do prazo da requisição)
+TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "5"))
+# Espera máxima imposta pelos cabeçalhos de rate limit antes de seguir mesmo assim
+MAX_RATE_LIMIT_WAIT = float(os.getenv("TMDB_MAX_RATE_LIMIT_WAIT", "2"))
+
+# Disjuntor do processo (TMDB_BREAKER_FAILURES/RESET): com o TMDb fora do ar, as buscas
+# retornam None na hora (filme sem pôster) em vez de esperar o timeout a cada filme.
+tmdb_breaker = breaker_from_env("tmdb", "TMDB")
+
+# Hedging das buscas (TMDB_HEDGE=false desativa): uma busca que passa do p95 recente ganha uma
+# cópia e vale a primeira resposta, para um filme lento não segurar a lista inteira. A tentativa
+# que perde tem a conexão fechada (ver `_AbortableConnection`).
+tmdb_hedger = hedger_from_env("tmdb", "TMDB", default_enabled=True)
+
+
+def _is_outage(error: BaseException) -> bool:
+    """
+    Falhas de rede, timeouts e respostas 5xx; erros 4xx não indicam indisponibilidade.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError))
+
+
+def _answered(response) -> bool:
+    """
+    Resposta que encerra a chamada (a cópia do hedging não traria nada melhor).
+    """
+    return response.status_code not in RETRY_STATUSES
+
+
+class RateLimitGate:
+    """
+    Acompanha os cabeçalhos de rate limit do TMDb (`X-RateLimit-Remaining`/`X-RateLimit-Reset`
+    e `Retry-After`) e segura as próximas chamadas do processo até a janela reabrir.
+    """
+
+    def __init__(self, max_wait: float = MAX_RATE_LIMIT_WAIT):
+        self.max_wait = max_wait
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, headers) -> None:
+        delay = None
+        retry_after = headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        elif headers.get("X-RateLimit-Remaining") == "0":
+            reset = headers.get("X-RateLimit-Reset")
+            if reset and reset.isdigit():
+                delay = max(0, int(reset) - time.time())
+
+        if delay is not None:
+            with self._lock:
+                self._not_before = max(self._not_before, time.monotonic() + delay)
+
+    def pending_delay(self) -> float:
+        with self._lock:
+            return min(max(0.0, self._not_before - time.monotonic()), self.max_wait)
+
+    def wait(self) -> None:
+        delay = self.pending_delay()
+        if delay:
+            time.sleep(delay)
+
+    async def await_slot(self) -> None:
+        delay = self.pending_delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+rate_limit_gate = RateLimitGate()
+
+
+def _attempt_cancelled() -> bool:
+    attempt = current_attempt()
+    return attempt is not None and attempt.cancelled
+
+
+class DeadlineRetry(Retry):
+    """
+    Política de novas tentativas do urllib3 que desiste quando o prazo da requisição acaba
+    (ou quando a outra tentativa do hedging já respondeu).
+    """
+
+    def is_exhausted(self) -> bool:
+        left = remaining()
+        return super().is_exhausted() or (left is not None and left < MIN_CALL_TIMEOUT) or _attempt_cancelled()
+
+
+class _AbortableConnection:
+    """
+    Conexão que a tentativa do hedging em andamento pode interromper: quando a outra tentativa
+    vence, o socket é fechado e a requisição pendente termina na hora com erro de conexão.
+    """
+    attempt = None
+    _raw_sock = None
+
+    def _new_conn(self):
+        self._raw_sock = super()._new_conn()
+        # Cancelada enquanto conectava
+        if self.attempt is not None and self.attempt.cancelled:
+            self.abort()
+        return self._raw_sock
+
+    def abort(self) -> None:
+        if self._raw_sock is not None:
+            with contextlib.suppress(OSError):
+                self._raw_sock.shutdown(socket.SHUT_RDWR)
+
+
+class _AbortableHTTPConnection(_AbortableConnection, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnection, HTTPSConnection):
+    pass
+
+
+class _AbortablePool:
+    """
+    Pool que associa cada conexão emprestada à tentativa do hedging da thread (`current_attempt`).
+    """
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        conn.attempt = current_attempt()
+        if conn.attempt is not None:
+            conn.attempt.on_cancel(conn.abort)
+        return conn
+
+    def _put_conn(self, conn) -> None:
+        if conn is not None and conn.attempt is not None:
+            conn.attempt.discard(conn.abort)
+            conn.attempt = None
+        super()._put_conn(conn)
+
+
+class _AbortableHTTPConnectionPool(_AbortablePool, HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSConnectionPool(_AbortablePool, HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+class _AbortableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _AbortableHTTPConnectionPool, "https": _AbortableHTTPSConnectionPool,
+        }
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Sessão HTTP única do processo: mantém as conexões com o TMDb abertas (keep-alive)
+    entre requisições e threads, e repete chamadas que falharem com 429/5xx.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = DeadlineRetry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = _AbortableAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
 
 class TMDbClient:
     """
     Cliente de baixo nível para interagir com a API do The Movie Database (TMDb).
     """
-    BASE_URL = "https://api.themoviedb.org/3"
+    # Pode ser trocado (ex.: pelo TMDb simulado de `devtools/fake_servers.py` nos testes de carga)
+    BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
 
     def __init__(self):
         self.api_key = os.getenv("TMDB_API_KEY")
         if not self.api_key:
             raise ValueError("TMDB_API_KEY não encontrado nas variáveis de ambiente.")
 
+    def _search_params(self, title: str, year: Optional[int] = None) -> Dict[str, Any]:
+        params = {
+            "api_key": self.api_key,
+            "query": title,
+            "language": "pt-BR",
+            "include_adult": "false"
+        }
+        if year is not None:
+            params["year"] = year
+        return params
+
+    @staticmethod
+    def _pick_best_match(data: Dict[str, Any], year: int) -> Dict[str, Any]:
+        """
+        Filtra os resultados de uma busca ampla para encontrar a melhor correspondência pelo ano
+        (`results` vazio se a busca não encontrou nada).
+        """
+        if not data.get("results"):
+            return {"results": []}
+
+        best_match = None
+        for movie in data["results"]:
+            release_date = movie.get("release_date")
+            if release_date and str(year) in release_date:
+                best_match = movie
+                break
+
+        # Se não encontrar uma correspondência exata do ano, retorna o primeiro resultado
+        if not best_match and data["results"]:
+            best_match = data["results"][0]
+
+        if best_match:
+            return {"results": [best_match]}
+
+        return {"results": []}
+
+    def _send(self, url: str, params: Dict[str, Any]) -> requests.Response:
+        # Cada tentativa (inclusive a cópia do hedging) respeita o rate limit e calcula o próprio
+        # timeout, já que a cópia sai mais tarde
+        rate_limit_gate.wait()
+        timeout = call_timeout(TIMEOUT)
+        started = time.perf_counter()
+        try:
+            response = get_http_session().get(url, params=params, timeout=timeout)
+        except requests.RequestException:
+            if _attempt_cancelled():
+                record_outbound("tmdb", "cancelled")
+            else:
+                record_outbound("tmdb", "error", time.perf_counter() - started)
+            raise
+        record_outbound("tmdb", response.status_code, time.perf_counter() - started)
+        rate_limit_gate.update(response.headers)
+        return response
+
+    def _get(self, url: str, params: Dict[str, Any]) -> requests.Response:
+        try:
+            with tmdb_breaker.guard(_is_outage):
+                response = tmdb_hedger.call(lambda: self._send(url, params), accept=_answered)
+                response.raise_for_status()
+        except CircuitOpenError:
+            record_outbound("tmdb", "circuit_open")
+            raise
+        return response
+
     def search_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
         """
         Busca por um filme específico pelo título e ano, com fallback para uma busca mais ampla.
+        Retorna None se a busca falhou (erro, circuito aberto ou prazo esgotado); se o TMDb
+        respondeu sem encontrar o filme, `results` vem vazio.
         """
+        with span("tmdb.search"):
+            return self._search_movie(title, year)
+
+    def _search_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
         search_url = f"{self.BASE_URL}/search/movie"
-        
+
         # Tentativa 1: Busca específica com título e ano
-        params_with_year = {
-            "api_key": self.api_key,
-            "query": title,
-            "language": "pt-BR",
-            "year": year,
-            "include_adult": "false"
-        }
-        
         try:
-            response = requests.get(search_url, params=params_with_year, timeout=5)
-            response.raise_for_status()
+            response = self._get(search_url, self._search_params(title, year))
             data = response.json()
             if data.get("results"):
                 return data
+        except (CircuitOpenError, DeadlineExceeded):
+            return None
         except requests.RequestException:
             # Ignora erros para tentar a busca mais ampla
             pass
 
         # Tentativa 2: Busca ampla apenas com o título, e depois filtra pelo ano
-        params_without_year = {
-            "api_key": self.api_key,
-            "query": title,
-            "language": "pt-BR",
-            "include_adult": "false"
-        }
+        try:
+            response = self._get(search_url, self._search_params(title))
+            return self._pick_best_match(response.json(), year)
+
+        except (CircuitOpenError, DeadlineExceeded):
+            return None
+        except requests.RequestException as e:
+            logger.warning("Erro ao chamar a API do TMDb para '%s': %s", title, e)
+            return None
+
+
+# Pool de conexões compartilhado por todas as instâncias assíncronas do processo.
+# Um `httpx.AsyncClient` fica preso ao event loop em que foi criado, então
+# guardamos um por loop (loops descartados liberam seu cliente automaticamente).
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    http_client = _async_http_clients.get(loop)
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=POOL_MAXSIZE),
+            # Repete apenas falhas de conexão; as respostas 429/5xx são tratadas em `AsyncTMDbClient._get`
+            transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES),
+        )
+        _async_http_clients[loop] = http_client
+    return http_client
+
+
+class AsyncTMDbClient(TMDbClient):
+    """
+    Versão assíncrona do cliente do TMDb, usando um pool de conexões httpx compartilhado.
+    """
 
+    async def _asend(self, http_client: httpx.AsyncClient, url: str, params: Dict[str, Any]) -> httpx.Response:
+        await rate_limit_gate.await_slot()
+        timeout = call_timeout(TIMEOUT)
+        started = time.perf_counter()
         try:
-            response = requests.get(search_url, params=params_without_year, timeout=5)
-            response.raise_for_status()
-            data = response.json()
+            response = await http_client.get(url, params=params, timeout=timeout)
+        except httpx.HTTPError:
+            record_outbound("tmdb", "error", time.perf_counter() - started)
+            raise
+        record_outbound("tmdb", response.status_code, time.perf_counter() - started)
+        rate_limit_gate.update(response.headers)
+        return response
 
-            if not data.get("results"):
-                return None
-
-            # Filtra os resultados para encontrar a melhor correspondência pelo ano
-            best_match = None
-            for movie in data["results"]:
-                release_date = movie.get("release_date")
-                if release_date and str(year) in release_date:
-                    best_match = movie
-                    break
-            
-            # Se não encontrar uma correspondência exata do ano, retorna o primeiro resultado
-            if not best_match and data["results"]:
-                best_match = data["results"][0]
-
-            if best_match:
-                return {"results": [best_match]}
-            
+    async def _get(self, url: str, params: Dict[str, Any]) -> httpx.Response:
+        """
+        GET com a mesma política da sessão síncrona: novas tentativas com backoff
+        exponencial em 429/5xx, respeitando `Retry-After` e os cabeçalhos de rate limit.
+        """
+        http_client = get_async_http_client()
+        try:
+            with tmdb_breaker.guard(_is_outage):
+                for attempt in range(MAX_RETRIES + 1):
+                    response = await tmdb_hedger.acall(lambda: self._asend(http_client, url, params), accept=_answered)
+                    if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        break
+                    await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                response.raise_for_status()
+        except CircuitOpenError:
+            record_outbound("tmdb", "circuit_open")
+            raise
+        return response
+
+    async def search_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
+        """
+        Mesma semântica de `TMDbClient.search_movie` (busca com ano e fallback sem ano).
+        """
+        with span("tmdb.search"):
+            return await self._search_movie(title, year)
+
+    async def _search_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
+        search_url = f"{self.BASE_URL}/search/movie"
+
+        # Tentativa 1: Busca específica com título e ano
+        try:
+            response = await self._get(search_url, self._search_params(title, year))
+            data = response.json()
+            if data.get("results"):
+                return data
+        except (CircuitOpenError, DeadlineExceeded):
             return None
+        except httpx.HTTPError:
+            # Ignora erros para tentar a busca mais ampla
+            pass
 
-        except requests.RequestException as e:
-            print(f"Erro ao chamar a API do TMDb para '{title}': {e}")
+        # Tentativa 2: Busca ampla apenas com o título, e depois filtra pelo ano
+        try:
+            response = await self._get(search_url, self._search_params(title))
+            return self._pick_best_match(response.json(), year)
+
+        except (CircuitOpenError, DeadlineExceeded):
+            return None
+        except httpx.HTTPError as e:
+            logger.warning("Erro ao chamar a API do TMDb para '%s': %s", title, e)
             return None
+
+
+_tmdb_client: Optional[TMDbClient] = None
+_async_tmdb_client: Optional[AsyncTMDbClient] = None
+_tmdb_clients_lock = threading.Lock()
+
+
+def get_tmdb_client() -> TMDbClient:
+    """
+    Cliente síncrono do processo, criado no primeiro uso.
+    """
+    global _tmdb_client
+    if _tmdb_client is None:
+        with _tmdb_clients_lock:
+            if _tmdb_client is None:
+                _tmdb_client = TMDbClient()
+    return _tmdb_client
+
+
+def get_async_tmdb_client() -> AsyncTMDbClient:
+    """
+    Cliente assíncrono do processo, criado no primeiro uso (o pool httpx continua sendo um por event loop).
+    """
+    global _async_tmdb_client
+    if _async_tmdb_client is None:
+        with _tmdb_clients_lock:
+            if _async_tmdb_client is None:
+                _async_tmdb_client = AsyncTMDbClient()
+    return _async_tmdb_client
@@ -1,7 +1,7 @@
 # integrations/tmdb/service.py
 
-from typing import Optional
-from .client import TMDbClient
+from typing import Optional, Dict, Any
+from .client import get_tmdb_client, get_async_tmdb_client
 
 class TMDbService:
     """
@@ -10,20 +10,47 @@ class TMDbService:
     IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
 
     def __init__(self):
-        self.client = TMDbClient()
+        # Clientes compartilhados pelo processo
+        self.client = get_tmdb_client()
+        self.async_client = get_async_tmdb_client()
+
+    @staticmethod
+    def _first_result(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if data is None:
+            return None
+        if data.get("results"):
+            # Pega o primeiro resultado, que geralmente é o mais relevante
+            return data["results"][0]
+        return {}
+
+    def build_poster_url(self, poster_path: Optional[str]) -> Optional[str]:
+        if poster_path:
+            return f"{self.IMAGE_BASE_URL}{poster_path}"
+        return None
+
+    def get_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
+        """
+        Busca um filme e retorna os metadados do resultado mais relevante. Retorna `{}` se o
+        TMDb não encontrou o filme e None se a busca falhou (o resultado ainda é desconhecido).
+        """
+        return self._first_result(self.client.search_movie(title=title, year=year))
+
+    async def aget_movie(self, title: str, year: int) -> Optional[Dict[str, Any]]:
+        """
+        Versão assíncrona de `get_movie`.
+        """
+        return self._first_result(await self.async_client.search_movie(title=title, year=year))
 
     def get_poster_url(self, title: str, year: int) -> Optional[str]:
         """
         Busca um filme e retorna a URL completa do seu pôster, se encontrado.
         """
-        data = self.client.search_movie(title=title, year=year)
+        movie_data = self.get_movie(title=title, year=year)
+        return self.build_poster_url(movie_data.get("poster_path")) if movie_data else None
 
-        if data and data.get("results"):
-            # Pega o primeiro resultado, que geralmente é o mais relevante
-            movie_data = data["results"][0]
-            poster_path = movie_data.get("poster_path")
-            
-            if poster_path:
-                return f"{self.IMAGE_BASE_URL}{poster_path}"
-        
-        return None
\ No newline at end of file
+    async def aget_poster_url(self, title: str, year: int) -> Optional[str]:
+        """
+        Versão assíncrona de `get_poster_url`.
+        """
+        movie_data = await self.aget_movie(title=title, year=year)
+        return self.build_poster_url(movie_data.get("poster_path")) if movie_data else None
@@ -9,7 +9,9 @@ from .models import (
     RecommendationSet, 
     RecommendationItem, 
     ShownHistory, 
-    BlacklistedMovie
+    BlacklistedMovie,
+    GenerationJob,
+    Movie
 )
 
 @admin.register(Genre)
@@ -35,8 +37,8 @@ class SubMoodAdmin(admin.ModelAdmin):
 
 @admin.register(RecommendationSet)
 class RecommendationSetAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'created_at', 'is_active')
-    list_filter = ('user__username', 'is_active')
+    list_display = ('id', 'user', 'created_at', 'is_active', 'prewarm_status')
+    list_filter = ('user__username', 'is_active', 'prewarm_status')
 
 @admin.register(RecommendationItem)
 class RecommendationItemAdmin(admin.ModelAdmin):
@@ -54,4 +56,15 @@ class ShownHistoryAdmin(admin.ModelAdmin):
 class BlacklistedMovieAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'title', 'created_at')
     list_filter = ('user__username',)
-    search_fields = ('title',)
\ No newline at end of file
+    search_fields = ('title',)
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'mood', 'status', 'is_prewarm', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'mood', 'is_prewarm')
+    readonly_fields = ('items',)
+
+@admin.register(Movie)
+class MovieAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'year', 'tmdb_id', 'fetched_at')
+    search_fields = ('title', 'normalized_title')
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class RecommendationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommendations'
+
+    def ready(self):
+        """
+        Importa os sinais (invalidação do cache dos catálogos) e as verificações do sistema
+        quando a aplicação está pronta.
+        """
+        import recommendations.checks
+        import recommendations.signals
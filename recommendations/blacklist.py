@@ -0,0 +1,164 @@
+# recommendations/blacklist.py
+
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from integrations.gemini.types import Movie as GeminiMovie
+from integrations.metrics import record_cache
+
+from .catalog import catalog_key, known_tmdb_ids, normalize_title
+from .models import BlacklistedMovie, Movie
+from .ranking import most_relevant_titles
+
+
+class BlacklistFilter:
+    """
+    Blacklist de um usuário em memória: títulos normalizados e IDs do TMDb, para checar
+    a saída do Gemini em O(1) por filme, sem depender do modelo respeitar o prompt.
+
+    `titles` mantém os títulos originais, do mais recente para o mais antigo.
+    """
+
+    def __init__(self, titles: Iterable[Tuple[str, str]] = (), tmdb_ids: Iterable[int] = ()):
+        self.titles: Dict[str, str] = dict(titles)
+        self.tmdb_ids = frozenset(tmdb_ids)
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def normalized_titles(self) -> List[str]:
+        return list(self.titles)
+
+    def extended(self, titles: Iterable[str]) -> "BlacklistFilter":
+        """
+        Novo filtro que também bloqueia `titles` (ex.: os filmes exibidos recentemente).
+        """
+        return BlacklistFilter([*self.titles.items(), *_dedupe_titles(titles)], self.tmdb_ids)
+
+    def blocks(self, title: str, tmdb_id: Optional[int] = None) -> bool:
+        return normalize_title(title) in self.titles or (tmdb_id is not None and tmdb_id in self.tmdb_ids)
+
+    def to_cache(self) -> dict:
+        return {"titles": list(self.titles.items()), "tmdb_ids": list(self.tmdb_ids)}
+
+    @classmethod
+    def from_cache(cls, data: dict) -> "BlacklistFilter":
+        return cls(data["titles"], data["tmdb_ids"])
+
+
+def _version_key(user_id) -> str:
+    return f"blacklist:{user_id}:version"
+
+
+def _cache_key(user_id, version: int) -> str:
+    return f"blacklist:{user_id}:{version}"
+
+
+def _blacklist_version(user_id) -> int:
+    """
+    Versão atual da blacklist do usuário, trocada a cada alteração. Um filtro montado a partir de
+    uma leitura anterior à troca fica na chave da versão antiga e nunca mais é servido.
+    """
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+async def _ablacklist_version(user_id) -> int:
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(_version_key(user_id), version, timeout=None):
+            version = await cache.aget(_version_key(user_id), version)
+    return version
+
+
+def _dedupe_titles(titles: Iterable[str]) -> List[Tuple[str, str]]:
+    unique = {}
+    for title in titles:
+        unique.setdefault(normalize_title(title), title)
+    return list(unique.items())
+
+
+def _catalog_tmdb_ids(normalized_titles: List[str]):
+    return Movie.objects.filter(normalized_title__in=normalized_titles, tmdb_id__isnull=False).values_list('tmdb_id', flat=True)
+
+
+def get_blacklist_filter(user) -> BlacklistFilter:
+    """
+    Blacklist do usuário, guardada no cache do Django (compartilhado entre os processos) até a
+    próxima alteração (invalidada pelos sinais de `BlacklistedMovie`).
+    """
+    key = _cache_key(user.pk, _blacklist_version(user.pk))
+    cached = cache.get(key)
+    record_cache("blacklist", hit=cached is not None)
+    if cached is not None:
+        return BlacklistFilter.from_cache(cached)
+
+    titles = _dedupe_titles(BlacklistedMovie.objects.filter(user=user).order_by('-created_at').values_list('title', flat=True))
+    # IDs do TMDb dos títulos já presentes no catálogo: pegam o mesmo filme com outro título (ex.: o original)
+    tmdb_ids = _catalog_tmdb_ids([key for key, _ in titles]) if titles else []
+    blacklist = BlacklistFilter(titles, tmdb_ids)
+    cache.set(key, blacklist.to_cache(), settings.BLACKLIST_CACHE_TIMEOUT)
+    return blacklist
+
+
+async def aget_blacklist_filter(user) -> BlacklistFilter:
+    """
+    Versão assíncrona de `get_blacklist_filter`.
+    """
+    key = _cache_key(user.pk, await _ablacklist_version(user.pk))
+    cached = await cache.aget(key)
+    record_cache("blacklist", hit=cached is not None)
+    if cached is not None:
+        return BlacklistFilter.from_cache(cached)
+
+    titles = _dedupe_titles([
+        title async for title in BlacklistedMovie.objects.filter(user=user).order_by('-created_at').values_list('title', flat=True)
+    ])
+    tmdb_ids = [tmdb_id async for tmdb_id in _catalog_tmdb_ids([key for key, _ in titles])] if titles else []
+    blacklist = BlacklistFilter(titles, tmdb_ids)
+    await cache.aset(key, blacklist.to_cache(), settings.BLACKLIST_CACHE_TIMEOUT)
+    return blacklist
+
+
+def invalidate_blacklist_filter(user_id) -> None:
+    cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def prompt_blacklist(blacklist: BlacklistFilter, profile, favorite_genres: List[str], moods) -> List[str]:
+    """
+    Subconjunto limitado (`BLACKLIST_PROMPT_LIMIT`) da blacklist enviado no prompt: os filmes que o
+    perfil e os humores pedidos mais favorecem no catálogo (os que o modelo mais provavelmente
+    sugeriria) e, depois, os mais recentes. O restante é garantido pelo pós-filtro.
+    """
+    limit = settings.BLACKLIST_PROMPT_LIMIT
+    if len(blacklist) <= limit:
+        return list(blacklist.titles.values())
+
+    selected = most_relevant_titles(profile, favorite_genres, moods, blacklist.normalized_titles, limit)
+    return [blacklist.titles[key] for key in selected]
+
+
+def split_blocked(blacklist: BlacklistFilter, movies: List[GeminiMovie]) -> Tuple[List[GeminiMovie], List[GeminiMovie]]:
+    """
+    Separa os filmes permitidos dos bloqueados pela blacklist, pelo título ou, para os filmes
+    já no catálogo, pelo ID do TMDb (uma única consulta).
+    """
+    if not len(blacklist) or not movies:
+        return list(movies), []
+
+    tmdb_ids = known_tmdb_ids(movies) if blacklist.tmdb_ids else {}
+
+    allowed, blocked = [], []
+    for movie in movies:
+        tmdb_id = tmdb_ids.get(catalog_key(movie.title, movie.year))
+        (blocked if blacklist.blocks(movie.title, tmdb_id) else allowed).append(movie)
+    return allowed, blocked
@@ -0,0 +1,177 @@
+# recommendations/catalog.py
+
+import asyncio
+import contextvars
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from integrations.gemini.types import Movie as GeminiMovie
+from integrations.metrics import record_cache
+
+from .models import Movie
+
+CatalogKey = Tuple[str, int]
+
+# Parâmetros do upsert no catálogo (dados desatualizados são sobrescritos)
+_UPSERT_OPTIONS = {
+    'update_conflicts': True,
+    'unique_fields': ['normalized_title', 'year'],
+    'update_fields': [
+        'title', 'tmdb_id', 'original_title', 'poster_path', 'release_date', 'overview', 'tmdb_metadata', 'fetched_at'
+    ],
+}
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normaliza um título para comparação: sem acentos, minúsculo, sem pontuação e com espaços simples.
+    """
+    without_accents = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    without_punctuation = re.sub(r'[^\w\s]', ' ', without_accents.lower())
+    return ' '.join(without_punctuation.split())
+
+
+def catalog_key(title: str, year: int) -> CatalogKey:
+    return normalize_title(title), year
+
+
+def _parse_release_date(value: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _build_catalog_entry(key: CatalogKey, title: str, tmdb_data: Dict[str, Any]) -> Movie:
+    return Movie(
+        normalized_title=key[0],
+        year=key[1],
+        title=title,
+        tmdb_id=tmdb_data.get('id'),
+        original_title=tmdb_data.get('original_title') or '',
+        poster_path=tmdb_data.get('poster_path'),
+        release_date=_parse_release_date(tmdb_data.get('release_date')),
+        overview=tmdb_data.get('overview') or '',
+        tmdb_metadata=tmdb_data,
+        fetched_at=timezone.now(),
+    )
+
+
+def _catalog_query(keys: List[CatalogKey]):
+    query = Q()
+    for normalized_title, year in keys:
+        query |= Q(normalized_title=normalized_title, year=year)
+    return Movie.objects.filter(query)
+
+
+def known_tmdb_ids(movies: List[GeminiMovie]) -> Dict[CatalogKey, int]:
+    """
+    IDs do TMDb dos filmes que já estão no catálogo (sem buscar os demais na API).
+    """
+    keys = [catalog_key(movie.title, movie.year) for movie in movies]
+    return {
+        (normalized_title, year): tmdb_id
+        for normalized_title, year, tmdb_id in _catalog_query(keys).filter(tmdb_id__isnull=False).values_list('normalized_title', 'year', 'tmdb_id')
+    }
+
+
+def _is_fresh(entry: Movie) -> bool:
+    # Filmes que o TMDb não encontrou são buscados de novo mais cedo (podem ter sido cadastrados)
+    if entry.tmdb_id is None:
+        return entry.fetched_at >= timezone.now() - timedelta(days=settings.TMDB_CATALOG_NOT_FOUND_REFRESH_DAYS)
+    return entry.fetched_at >= timezone.now() - timedelta(days=settings.TMDB_CATALOG_REFRESH_DAYS)
+
+
+def _found(known: Dict[CatalogKey, Movie], keys: List[CatalogKey]) -> List[Optional[Movie]]:
+    """
+    Entradas do catálogo na ordem de `keys`, com None para os filmes ausentes ou que o TMDb não encontrou.
+    """
+    entries = [known.get(key) for key in keys]
+    return [entry if entry is not None and entry.tmdb_id is not None else None for entry in entries]
+
+
+def _missing_movies(movies: List[GeminiMovie], known: Dict[CatalogKey, Movie]) -> Dict[CatalogKey, GeminiMovie]:
+    """
+    Filmes (sem repetição) que não estão no catálogo ou cujos dados já passaram da idade de atualização.
+    """
+    missing = {}
+    for movie in movies:
+        key = catalog_key(movie.title, movie.year)
+        entry = known.get(key)
+        if entry is None or not _is_fresh(entry):
+            missing[key] = movie
+    return missing
+
+
+def resolve_movies(tmdb_service, movies: List[GeminiMovie]) -> List[Optional[Movie]]:
+    """
+    Retorna a entrada do catálogo de cada filme (na mesma ordem), ou None se o TMDb não o
+    encontrou ou se a busca falhou.
+
+    O catálogo é lido em uma única consulta; só os filmes ausentes (ou desatualizados)
+    são buscados no TMDb, em paralelo, e então gravados para as próximas requisições.
+    Os não encontrados também são gravados (com `tmdb_id` vazio), para não serem buscados
+    a cada requisição; as buscas que falharam não são gravadas.
+    """
+    if not movies:
+        return []
+
+    keys = [catalog_key(movie.title, movie.year) for movie in movies]
+    known = {(entry.normalized_title, entry.year): entry for entry in _catalog_query(keys)}
+
+    missing = _missing_movies(movies, known)
+    record_cache("movie_catalog", hit=True, count=len(keys) - len(missing))
+    record_cache("movie_catalog", hit=False, count=len(missing))
+    if missing:
+        # Cada busca roda em uma cópia do contexto atual, para que seus spans entrem no Server-Timing da requisição
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            results = list(executor.map(
+                lambda movie, context: context.run(tmdb_service.get_movie, title=movie.title, year=movie.year),
+                missing.values(), [contextvars.copy_context() for _ in missing]
+            ))
+        new_entries = [
+            _build_catalog_entry(key, movie.title, tmdb_data)
+            for (key, movie), tmdb_data in zip(missing.items(), results)
+            if tmdb_data is not None
+        ]
+        if new_entries:
+            Movie.objects.bulk_create(new_entries, **_UPSERT_OPTIONS)
+            known.update({(entry.normalized_title, entry.year): entry for entry in new_entries})
+
+    return _found(known, keys)
+
+
+async def aresolve_movies(tmdb_service, movies: List[GeminiMovie]) -> List[Optional[Movie]]:
+    """
+    Versão assíncrona de `resolve_movies`.
+    """
+    if not movies:
+        return []
+
+    keys = [catalog_key(movie.title, movie.year) for movie in movies]
+    known = {(entry.normalized_title, entry.year): entry async for entry in _catalog_query(keys)}
+
+    missing = _missing_movies(movies, known)
+    record_cache("movie_catalog", hit=True, count=len(keys) - len(missing))
+    record_cache("movie_catalog", hit=False, count=len(missing))
+    if missing:
+        results = await asyncio.gather(*(
+            tmdb_service.aget_movie(title=movie.title, year=movie.year) for movie in missing.values()
+        ))
+        new_entries = [
+            _build_catalog_entry(key, movie.title, tmdb_data)
+            for (key, movie), tmdb_data in zip(missing.items(), results)
+            if tmdb_data is not None
+        ]
+        if new_entries:
+            await Movie.objects.abulk_create(new_entries, **_UPSERT_OPTIONS)
+            known.update({(entry.normalized_title, entry.year): entry for entry in new_entries})
+
+    return _found(known, keys)
@@ -0,0 +1,22 @@
+# recommendations/checks.py
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from integrations.gemini.singleflight import is_shared_cache
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    A invalidação dos catálogos e da blacklist só chega a todos os workers se o cache padrão for
+    compartilhado entre os processos.
+    """
+    if settings.DEBUG or is_shared_cache("default"):
+        return []
+    return [Warning(
+        "O cache padrão é local ao processo: com vários workers, catálogos e blacklists ficam "
+        "desatualizados até expirarem.",
+        hint="Use CACHE_BACKEND=db ou CACHE_BACKEND=redis.",
+        id="recommendations.W001",
+    )]
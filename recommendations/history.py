@@ -0,0 +1,268 @@
+# recommendations/history.py
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from integrations.metrics import record_cache
+
+from .catalog import normalize_title
+from .models import RecommendationItem, ShownHistory
+
+logger = logging.getLogger(__name__)
+
+
+class RecentHistory:
+    """
+    Janela recente de filmes já exibidos a um usuário (`SHOWN_HISTORY_DAYS`, no máximo
+    `SHOWN_HISTORY_LIMIT` filmes): `external_id`s e títulos normalizados, do mais recente
+    para o mais antigo. Não é alterada depois de criada (é compartilhada entre threads).
+    """
+
+    def __init__(self, entries: Iterable[tuple] = ()):
+        # Pares (external_id, título)
+        self.entries = list(entries)
+        self.external_ids = frozenset(external_id for external_id, _ in self.entries)
+        self._titles: Dict[str, str] = {}
+        for _, title in self.entries:
+            self._titles.setdefault(normalize_title(title), title)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def with_entries(self, entries: Iterable[tuple]) -> "RecentHistory":
+        """
+        Nova janela com `entries` (mais recentes) à frente das atuais.
+        """
+        return RecentHistory([*entries, *self.entries][:settings.SHOWN_HISTORY_LIMIT])
+
+    @property
+    def normalized_titles(self) -> List[str]:
+        return list(self._titles)
+
+    def titles(self, limit: Optional[int] = None) -> List[str]:
+        return list(self._titles.values())[:limit]
+
+
+class RecentHistoryCache:
+    """
+    Cache LRU em memória do processo com a janela recente de cada usuário, para que a
+    exclusão de filmes repetidos não consulte o banco a cada geração. O TTL limita o
+    atraso em relação ao que os outros processos gravaram.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id) -> Optional[RecentHistory]:
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            expires_at, history = entry
+            if expires_at <= time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return history
+
+    def set(self, user_id, history: RecentHistory) -> None:
+        with self._lock:
+            self._data[user_id] = (time.monotonic() + self.ttl, history)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, user_id, entries: List[tuple]) -> None:
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None:
+                expires_at, history = entry
+                self._data[user_id] = (expires_at, history.with_entries(entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class ShownHistoryWriter:
+    """
+    Grava o histórico de exibição em lotes: as linhas ficam em memória e são inseridas com um
+    único `bulk_create` quando o buffer chega a `batch_size` ou `flush_interval` segundos depois
+    da primeira linha pendente. Com `flush_interval <= 0`, grava na hora (uma consulta por resposta).
+    Se o lote falhar, as linhas são gravadas uma a uma e só as inválidas são descartadas.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[ShownHistory] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, entries: List[ShownHistory]) -> None:
+        if not entries:
+            return
+        if self.flush_interval <= 0:
+            self._write(entries)
+            return
+
+        with self._lock:
+            self._pending += entries
+            full = len(self._pending) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def pending_for(self, user_id) -> List[ShownHistory]:
+        with self._lock:
+            return [entry for entry in self._pending if entry.user_id == user_id]
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if batch:
+            self._write(batch)
+
+    def _flush_from_timer(self) -> None:
+        try:
+            self.flush()
+        finally:
+            # A thread do timer abre a própria conexão com o banco
+            connection.close()
+
+    @staticmethod
+    def _write(batch: List[ShownHistory]) -> None:
+        try:
+            # Fora de uma transação, o `bulk_create` já roda em uma só e é desfeito por inteiro se falhar
+            ShownHistory.objects.bulk_create(batch, batch_size=500)
+        except Exception as e:
+            # Uma linha inválida (ex.: item apagado nesse meio-tempo) não pode levar o lote inteiro
+            logger.warning("Erro ao gravar o histórico de exibição em lote (%s itens), gravando linha a linha: %s", len(batch), e)
+            ShownHistoryWriter._write_rows(batch)
+
+    @staticmethod
+    def _write_rows(batch: List[ShownHistory]) -> None:
+        failed = 0
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+            except Exception as e:
+                failed += 1
+                logger.error("Erro ao gravar o histórico de exibição de %s (%s): %s", entry.user_id, entry.external_id, e)
+        if failed:
+            logger.error("%s de %s linhas do histórico de exibição descartadas.", failed, len(batch))
+
+
+_recent_history_cache: Optional[RecentHistoryCache] = None
+_shown_history_writer: Optional[ShownHistoryWriter] = None
+_history_lock = threading.Lock()
+
+
+def get_recent_history_cache() -> RecentHistoryCache:
+    global _recent_history_cache
+    if _recent_history_cache is None:
+        with _history_lock:
+            if _recent_history_cache is None:
+                _recent_history_cache = RecentHistoryCache(
+                    settings.SHOWN_HISTORY_CACHE_SIZE, settings.SHOWN_HISTORY_CACHE_TTL
+                )
+    return _recent_history_cache
+
+
+def get_shown_history_writer() -> ShownHistoryWriter:
+    global _shown_history_writer
+    if _shown_history_writer is None:
+        with _history_lock:
+            if _shown_history_writer is None:
+                _shown_history_writer = ShownHistoryWriter(
+                    settings.SHOWN_HISTORY_BATCH_SIZE, settings.SHOWN_HISTORY_FLUSH_INTERVAL
+                )
+                # Não perde as linhas pendentes quando o processo termina
+                atexit.register(_shown_history_writer.flush)
+    return _shown_history_writer
+
+
+def _recent_history_query(user):
+    since = timezone.now() - timedelta(days=settings.SHOWN_HISTORY_DAYS)
+    return (
+        ShownHistory.objects
+        .filter(user=user, shown_at__gte=since)
+        .order_by('-shown_at')
+        .values_list('external_id', 'title')[:settings.SHOWN_HISTORY_LIMIT]
+    )
+
+
+def _with_pending(user, rows: List[tuple]) -> RecentHistory:
+    # Linhas ainda no buffer do writer também contam
+    pending = get_shown_history_writer().pending_for(user.pk)
+    return RecentHistory(rows).with_entries((entry.external_id, entry.title) for entry in reversed(pending))
+
+
+def get_recent_history(user) -> RecentHistory:
+    """
+    Janela recente de filmes exibidos ao usuário, do cache LRU do processo ou do banco
+    (uma consulta pelo índice `shownhistory_user_recent_idx`).
+    """
+    history = get_recent_history_cache().get(user.pk)
+    record_cache("recent_history", hit=history is not None)
+    if history is None:
+        history = _with_pending(user, list(_recent_history_query(user)))
+        get_recent_history_cache().set(user.pk, history)
+    return history
+
+
+async def aget_recent_history(user) -> RecentHistory:
+    """
+    Versão assíncrona de `get_recent_history`.
+    """
+    history = get_recent_history_cache().get(user.pk)
+    record_cache("recent_history", hit=history is not None)
+    if history is None:
+        history = _with_pending(user, [row async for row in _recent_history_query(user)])
+        get_recent_history_cache().set(user.pk, history)
+    return history
+
+
+def record_shown(user, items: List[RecommendationItem], source: str) -> None:
+    """
+    Registra no histórico os itens entregues ao usuário. Filmes que já estão na janela
+    recente não são gravados de novo (ex.: o mesmo job consultado mais de uma vez).
+    """
+    history = get_recent_history(user)
+    entries, seen = [], set(history.external_ids)
+    for item in items:
+        if item.external_id in seen:
+            continue
+        seen.add(item.external_id)
+        entries.append(ShownHistory(
+            user_id=user.pk,
+            recommendation_item_id=item.pk,
+            external_id=item.external_id,
+            title=item.title,
+            mood_id=item.mood_id,
+            context={"source": source, "recommendation_set": str(item.recommendation_set_id), "rank": item.rank},
+        ))
+    if not entries:
+        return
+
+    get_recent_history_cache().add(user.pk, [(entry.external_id, entry.title) for entry in entries])
+    get_shown_history_writer().add(entries)
@@ -0,0 +1,96 @@
+# recommendations/http_cache.py
+
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from integrations.metrics import record_cache
+
+# Catálogos quase estáticos servidos do cache. A versão de cada um muda a cada alteração
+# nos modelos (sinais em `recommendations/signals.py`). O `cache` padrão precisa ser
+# compartilhado entre os processos (CACHES em settings) para a invalidação valer em todos.
+CATALOGS = ('genres', 'moods', 'questions')
+
+
+def _version_key(name: str) -> str:
+    return f"catalog:{name}:version"
+
+
+def catalog_version(name: str) -> int:
+    """
+    Versão atual do catálogo (instante, em ns, da última alteração conhecida).
+    """
+    version = cache.get(_version_key(name))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(name), version, timeout=None):
+            version = cache.get(_version_key(name), version)
+    return version
+
+
+def bump_catalog_version(name: str) -> None:
+    """
+    Invalida as respostas em cache do catálogo: a próxima requisição gera uma nova versão.
+    """
+    cache.set(_version_key(name), time.time_ns(), timeout=None)
+
+
+def content_etag(data) -> str:
+    """
+    ETag forte a partir do conteúdo serializado.
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return '"' + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def conditional_response(request, etag: str, last_modified: Optional[datetime],
+                         build: Callable[[], Response], **cache_control) -> Response:
+    """
+    Responde 304 se o cliente já tem a versão atual (`If-None-Match` / `If-Modified-Since`);
+    caso contrário, monta a resposta com `build`. Em ambos os casos envia ETag, Last-Modified
+    e Cache-Control.
+    """
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if response is None:
+        response = build()
+
+    response['ETag'] = etag
+    if last_modified_ts is not None:
+        response['Last-Modified'] = http_date(last_modified_ts)
+    patch_cache_control(response, **cache_control)
+    return response
+
+
+class CachedCatalogMixin:
+    """
+    Para `ListAPIView`s de catálogos: a lista serializada fica no cache do Django por versão
+    do catálogo, então as requisições não consultam o banco enquanto ele não mudar.
+    """
+    catalog_name: str = ''
+
+    def list(self, request, *args, **kwargs):
+        version = catalog_version(self.catalog_name)
+        body_key = f"catalog:{self.catalog_name}:body:{version}"
+
+        cached = cache.get(body_key)
+        record_cache("catalog", hit=cached is not None)
+        if cached is None:
+            data = [dict(item) for item in self.get_serializer(self.get_queryset(), many=True).data]
+            cached = (content_etag(data), data)
+            cache.set(body_key, cached, settings.CATALOG_CACHE_TIMEOUT)
+
+        etag, data = cached
+        return conditional_response(
+            request, etag, datetime.fromtimestamp(version / 1e9),
+            lambda: Response(data),
+            private=True, max_age=settings.CATALOG_CACHE_MAX_AGE,
+        )
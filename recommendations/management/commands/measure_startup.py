@@ -0,0 +1,61 @@
+# recommendations/management/commands/measure_startup.py
+
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Linhas do `python -X importtime`: "import time: <self us> | <cumulativo us> | <módulo>"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o tempo de importação de uma inicialização a frio (em um processo novo, com `-X importtime`) '
+        'e verifica que módulos pesados, como o SDK do Gemini, não são carregados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append',
+            help='Módulo importado após o django.setup() (padrão: cinemind.urls e cinemind.wsgi). Pode ser repetido.'
+        )
+        parser.add_argument(
+            '--forbid', action='append',
+            help='Módulo que não pode ser carregado (padrão: google.genai). Pode ser repetido.'
+        )
+        parser.add_argument('--top', type=int, default=15, help='Quantidade de módulos mais lentos a exibir.')
+
+    def handle(self, *args, **options):
+        targets = options['target'] or ['cinemind.urls', 'cinemind.wsgi']
+        forbidden = options['forbid'] or ['google.genai']
+
+        code = 'import django; django.setup(); ' + '; '.join(f'import {target}' for target in targets)
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'cinemind.settings')}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            raise CommandError(f'Falha ao importar {", ".join(targets)}:\n{result.stderr[-2000:]}')
+
+        modules = {}
+        top_level_total = 0
+        for line in result.stderr.splitlines():
+            match = _IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            _, cumulative_us, indent, name = match.groups()
+            modules[name] = int(cumulative_us)
+            # Módulos sem indentação são importações de topo: a soma delas é o tempo total
+            if len(indent) == 1:
+                top_level_total += int(cumulative_us)
+
+        self.stdout.write(f'Tempo total de importação: {top_level_total / 1000:.0f} ms ({len(modules)} módulos)')
+        self.stdout.write('Módulos mais lentos (tempo cumulativo):')
+        for name, cumulative_us in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+        loaded = [name for name in forbidden if name in modules]
+        if loaded:
+            raise CommandError(f'Módulos que deveriam ser carregados sob demanda foram importados: {", ".join(loaded)}')
+        self.stdout.write(self.style.SUCCESS(f'Nenhum módulo proibido carregado ({", ".join(forbidden)}).'))
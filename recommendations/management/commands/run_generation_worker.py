@@ -0,0 +1,86 @@
+# recommendations/management/commands/run_generation_worker.py
+
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from integrations.metrics import get_metrics_exporter
+
+from recommendations.services import claim_next_job, purge_discarded_prewarm_sets, run_generation_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de jobs de geração de recomendações (sem broker externo: a fila é o próprio banco).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Número de threads processando jobs em paralelo.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Segundos de espera quando a fila está vazia.')
+        parser.add_argument('--stale-after', type=int, default=300, help='Segundos após os quais um job "em execução" volta para a fila.')
+        parser.add_argument('--once', action='store_true', help='Processa os jobs pendentes e encerra.')
+
+    def handle(self, *args, **options):
+        self._stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self._stop.set())
+
+        # As métricas das gerações feitas aqui entram na soma de `/metrics` (METRICS_MULTIPROCESS_DIR)
+        get_metrics_exporter()
+
+        stale_after = timedelta(seconds=options['stale_after'])
+        self._requeue_stale(stale_after)
+
+        workers = options['workers']
+        self.stdout.write(f'Iniciando {workers} worker(s) de geração...')
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._work_loop, options['poll_interval'], options['once'])
+                for _ in range(workers)
+            ]
+            # Enquanto os workers rodam, a thread principal recupera periodicamente jobs travados.
+            while wait(futures, timeout=stale_after.total_seconds() / 2).not_done:
+                self._requeue_stale(stale_after)
+
+        self.stdout.write(self.style.SUCCESS('Workers encerrados.'))
+
+    def _requeue_stale(self, stale_after):
+        try:
+            requeued = requeue_stale_jobs(stale_after)
+            # Sets pré-gerados descartados enquanto um job deles rodava
+            purge_discarded_prewarm_sets()
+        except Exception as e:
+            self.stderr.write(f'Erro ao reprocessar jobs travados: {e}')
+            return
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'{requeued} job(s) travado(s) foram reprocessados.'))
+
+    def _work_loop(self, poll_interval, once):
+        try:
+            while not self._stop.is_set():
+                close_old_connections()
+                try:
+                    job = claim_next_job()
+                except Exception as e:
+                    # Ex.: banco indisponível. Espera e tenta novamente.
+                    self.stderr.write(f'Erro ao buscar o próximo job: {e}')
+                    self._stop.wait(poll_interval)
+                    continue
+
+                if job is None:
+                    if once:
+                        break
+                    self._stop.wait(poll_interval)
+                    continue
+
+                try:
+                    job = run_generation_job(job)
+                    self.stdout.write(f'Job {job.id}: {job.status}')
+                except Exception as e:
+                    # O job continua "em execução" e será reprocessado por `requeue_stale_jobs`.
+                    self.stderr.write(f'Erro ao finalizar o job {job.id}: {e}')
+        finally:
+            connection.close()
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Movie',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('normalized_title', models.CharField(help_text='Título normalizado (minúsculo, sem acentos/pontuação)', max_length=255)),
+                ('year', models.IntegerField(help_text='Ano informado na recomendação')),
+                ('title', models.CharField(max_length=255)),
+                ('tmdb_id', models.IntegerField(blank=True, db_index=True, help_text='Vazio quando o TMDb não encontrou o filme', null=True)),
+                ('original_title', models.CharField(blank=True, max_length=255)),
+                ('poster_path', models.CharField(blank=True, max_length=255, null=True)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('overview', models.TextField(blank=True)),
+                ('tmdb_metadata', models.TextField(blank=True, help_text='Resultado bruto do TMDb (JSON string)')),
+                ('fetched_at', models.DateTimeField(help_text='Quando os dados foram obtidos do TMDb')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('normalized_title', 'year'), name='unique_movie_title_year')],
+            },
+        ),
+    ]
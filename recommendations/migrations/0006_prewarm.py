@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0005_movie_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='is_prewarm',
+            field=models.BooleanField(default=False, help_text='Job de pré-geração (menor prioridade, concorrência limitada)'),
+        ),
+        migrations.AddField(
+            model_name='recommendationset',
+            name='prewarm_status',
+            field=models.CharField(blank=True, choices=[('', 'Sem pré-geração'), ('ready', 'Pré-gerado, aguardando promoção'), ('promoted', 'Pré-gerado e promovido')], default='', help_text='Sets pré-gerados ficam inativos até serem promovidos por CreateRecommendationSetView', max_length=10),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:53
+
+import json
+
+import django.contrib.postgres.indexes
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+# Campos que guardavam `json.dumps(...)` em um TextField
+JSON_TEXT_FIELDS = [
+    ('Movie', 'tmdb_metadata'),
+    ('RecommendationItem', 'movie_metadata'),
+    ('RecommendationSet', 'input_snapshot'),
+    ('ShownHistory', 'context'),
+]
+
+
+def _normalize(value):
+    """
+    Garante que o texto é um JSON válido antes da conversão para jsonb
+    (vazio vira {} e textos inválidos são preservados em {"raw": ...}).
+    """
+    if not value or not value.strip():
+        return '{}'
+    try:
+        json.loads(value)
+    except ValueError:
+        return json.dumps({'raw': value})
+    return value
+
+
+def normalize_json_text(apps, schema_editor):
+    for model_name, field_name in JSON_TEXT_FIELDS:
+        model = apps.get_model('recommendations', model_name)
+        for pk, value in model.objects.values_list('pk', field_name).iterator():
+            normalized = _normalize(value)
+            if normalized != value:
+                model.objects.filter(pk=pk).update(**{field_name: normalized})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0006_prewarm'),
+    ]
+
+    operations = [
+        # Os valores existentes são convertidos pelo próprio ALTER COLUMN (texto -> jsonb);
+        # antes disso, os textos que não são JSON válido são corrigidos.
+        migrations.RunPython(normalize_json_text, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='movie',
+            name='tmdb_metadata',
+            field=models.JSONField(blank=True, default=dict, help_text='Resultado bruto do TMDb'),
+        ),
+        migrations.AlterField(
+            model_name='recommendationitem',
+            name='movie_metadata',
+            field=models.JSONField(default=dict, help_text='Metadados do filme (ano, sinopse, justificativa, tags)'),
+        ),
+        migrations.AlterField(
+            model_name='recommendationset',
+            name='input_snapshot',
+            field=models.JSONField(blank=True, default=dict, help_text='Snapshot do perfil usado na geração'),
+        ),
+        migrations.AlterField(
+            model_name='shownhistory',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, help_text='Contexto em que o filme foi exibido'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['movie_metadata'], name='recitem_metadata_gin', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationitem',
+            index=models.Index(django.db.models.functions.comparison.Cast(django.db.models.fields.json.KeyTextTransform('year', 'movie_metadata'), models.IntegerField()), name='recitem_metadata_year_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def deactivate_duplicate_active_sets(apps, schema_editor):
+    """
+    Mantém apenas o set ativo mais recente de cada usuário, para que a restrição única parcial possa ser criada.
+    """
+    RecommendationSet = apps.get_model('recommendations', 'RecommendationSet')
+    duplicated_users = (
+        RecommendationSet.objects.filter(is_active=True)
+        .values('user').annotate(total=models.Count('id')).filter(total__gt=1)
+        .values_list('user', flat=True)
+    )
+    for user_id in duplicated_users:
+        latest = RecommendationSet.objects.filter(user_id=user_id, is_active=True).order_by('-created_at').first()
+        RecommendationSet.objects.filter(user_id=user_id, is_active=True).exclude(id=latest.id).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('recommendations', '0007_jsonfield_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recommendationset',
+            options={'get_latest_by': 'created_at', 'ordering': ['created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='shownhistory',
+            options={'get_latest_by': 'shown_at', 'ordering': ['shown_at']},
+        ),
+        migrations.AddIndex(
+            model_name='blacklistedmovie',
+            index=models.Index(fields=['user'], include=('title',), name='blacklist_user_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationset',
+            index=models.Index(fields=['user', '-created_at'], name='recset_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shownhistory',
+            index=models.Index(fields=['user', '-shown_at'], name='shownhistory_user_recent_idx'),
+        ),
+        # Os índices simples dos FKs só são removidos depois que os compostos existem
+        migrations.AlterField(
+            model_name='blacklistedmovie',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='blacklist', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='profilegenre',
+            name='profile',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.profile'),
+        ),
+        migrations.RunPython(deactivate_duplicate_active_sets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recommendationset',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user',), name='unique_active_set_per_user'),
+        ),
+    ]
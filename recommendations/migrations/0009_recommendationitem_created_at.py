@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_created_at(apps, schema_editor):
+    """
+    Itens existentes recebem a data de criação do seu set.
+    """
+    RecommendationItem = apps.get_model('recommendations', 'RecommendationItem')
+    RecommendationSet = apps.get_model('recommendations', 'RecommendationSet')
+    RecommendationItem.objects.update(created_at=models.Subquery(
+        RecommendationSet.objects.filter(id=models.OuterRef('recommendation_set_id')).values('created_at')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationitem',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
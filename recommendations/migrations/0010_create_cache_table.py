@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    """
+    Cria a tabela do cache compartilhado (CACHE_BACKEND=db) antes do `post_migrate`, que já
+    invalida os catálogos no cache. Não faz nada com outros backends ou se a tabela já existe.
+    """
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0009_recommendationitem_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
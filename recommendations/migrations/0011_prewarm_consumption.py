@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0010_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='consumed_at',
+            field=models.DateTimeField(blank=True, help_text='Pré-geração: quando os itens foram entregues (ou abandonados) por um pedido', null=True),
+        ),
+        migrations.AlterField(
+            model_name='recommendationset',
+            name='prewarm_status',
+            field=models.CharField(blank=True, choices=[('', 'Sem pré-geração'), ('ready', 'Pré-gerado, aguardando promoção'), ('promoted', 'Pré-gerado e promovido'), ('discarded', 'Pré-geração descartada, aguardando o fim dos jobs em execução')], default='', help_text='Sets pré-gerados ficam inativos até serem promovidos por CreateRecommendationSetView', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0011_prewarm_consumption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='available_at',
+            field=models.DateTimeField(blank=True, help_text='Job devolvido à fila só pode ser reservado a partir deste instante (Retry-After)', null=True),
+        ),
+    ]
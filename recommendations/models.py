@@ -1,7 +1,10 @@
 # recommendations/models.py
 
 import uuid
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User
 from accounts.models import Profile # Importa o Profile da outra app
 
@@ -20,7 +23,8 @@ class ProfileGenre(models.Model):
     Tabela de junção para a relação Muitos-para-Muitos entre Profile e Genre.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    # Sem o índice simples do FK: o índice único (profile, genre) já atende `filter(profile=...)`
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, db_index=False)
     genre = models.ForeignKey(Genre, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -55,11 +59,33 @@ class RecommendationSet(models.Model):
     """
     Agrupa um lote de recomendações geradas em uma única chamada à API.
     """
+    class PrewarmStatus(models.TextChoices):
+        NONE = '', 'Sem pré-geração'
+        READY = 'ready', 'Pré-gerado, aguardando promoção'
+        PROMOTED = 'promoted', 'Pré-gerado e promovido'
+        DISCARDED = 'discarded', 'Pré-geração descartada, aguardando o fim dos jobs em execução'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendation_sets')
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
-    input_snapshot = models.TextField(help_text="Snapshot serializado do perfil (JSON string)")
+    input_snapshot = models.JSONField(default=dict, blank=True, help_text="Snapshot do perfil usado na geração")
+    prewarm_status = models.CharField(
+        max_length=10, choices=PrewarmStatus.choices, default=PrewarmStatus.NONE, blank=True,
+        help_text="Sets pré-gerados ficam inativos até serem promovidos por CreateRecommendationSetView"
+    )
+
+    class Meta:
+        ordering = ['created_at']
+        get_latest_by = 'created_at'
+        constraints = [
+            # No máximo um set ativo por usuário; o índice parcial também atende `filter(user=..., is_active=True)`
+            models.UniqueConstraint(fields=['user'], condition=models.Q(is_active=True), name='unique_active_set_per_user'),
+        ]
+        indexes = [
+            # Sets mais recentes do usuário (pré-gerados aguardando promoção, histórico por humor)
+            models.Index(fields=['user', '-created_at'], name='recset_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Conjunto de Recomendações para {self.user.username} em {self.created_at}"
@@ -76,8 +102,17 @@ class RecommendationItem(models.Model):
     rank = models.PositiveSmallIntegerField(help_text="Posição (1, 2, ou 3) do filme dentro do seu humor")
     # --- CAMPO ADICIONADO ---
     thumbnail_url = models.URLField(max_length=500, blank=True, null=True, help_text="URL do pôster do filme")
-    movie_metadata = models.TextField(help_text="Metadados serializados (JSON string)")
+    movie_metadata = models.JSONField(default=dict, help_text="Metadados do filme (ano, sinopse, justificativa, tags)")
     relevance_score = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Consultas de contenção no jsonb, ex.: movie_metadata__contains={"tags": ["Drama"]} ou {"year": 1999}
+            GinIndex(fields=['movie_metadata'], name='recitem_metadata_gin', opclasses=['jsonb_path_ops']),
+            # Faixas de ano, ex.: .alias(year=...).filter(year__gte=2000)
+            models.Index(Cast(KT('movie_metadata__year'), models.IntegerField()), name='recitem_metadata_year_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -93,7 +128,15 @@ class ShownHistory(models.Model):
     title = models.CharField(max_length=255)
     mood = models.ForeignKey(Mood, on_delete=models.SET_NULL, null=True)
     shown_at = models.DateTimeField(auto_now_add=True)
-    context = models.TextField(blank=True, help_text="Contexto serializado (JSON string)")
+    context = models.JSONField(default=dict, blank=True, help_text="Contexto em que o filme foi exibido")
+
+    class Meta:
+        ordering = ['shown_at']
+        get_latest_by = 'shown_at'
+        indexes = [
+            # Histórico recente do usuário, ex.: filter(user=..., shown_at__gte=...)
+            models.Index(fields=['user', '-shown_at'], name='shownhistory_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} viu '{self.title}'"
@@ -103,7 +146,8 @@ class BlacklistedMovie(models.Model):
     Lista de filmes que um usuário pediu para não ver novamente.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blacklist')
+    # Sem o índice simples do FK: os índices abaixo já começam por `user`
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blacklist', db_index=False)
     external_id = models.CharField(max_length=100)
     title = models.CharField(max_length=255)
     reason = models.TextField(blank=True)
@@ -111,6 +155,71 @@ class BlacklistedMovie(models.Model):
 
     class Meta:
         unique_together = ('user', 'external_id')
+        indexes = [
+            # A geração só lê os títulos da lista do usuário: o INCLUDE permite um index-only scan
+            models.Index(fields=['user'], include=['title'], name='blacklist_user_title_idx'),
+        ]
+
+    def __str__(self):
+        return f"'{self.title}' na lista negra de {self.user.username}"
+
+class GenerationJob(models.Model):
+    """
+    Pedido de geração de recomendações processado em segundo plano
+    pelo comando `run_generation_worker`.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pendente'
+        RUNNING = 'running', 'Em execução'
+        DONE = 'done', 'Concluído'
+        FAILED = 'failed', 'Falhou'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    recommendation_set = models.ForeignKey(RecommendationSet, on_delete=models.CASCADE, related_name='generation_jobs')
+    mood = models.ForeignKey(Mood, on_delete=models.PROTECT, related_name='generation_jobs')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    items = models.ManyToManyField(RecommendationItem, blank=True, related_name='generation_jobs')
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    is_prewarm = models.BooleanField(default=False, help_text="Job de pré-geração (menor prioridade, concorrência limitada)")
+    consumed_at = models.DateTimeField(null=True, blank=True, help_text="Pré-geração: quando os itens foram entregues (ou abandonados) por um pedido")
+    available_at = models.DateTimeField(null=True, blank=True, help_text="Job devolvido à fila só pode ser reservado a partir deste instante (Retry-After)")
+
+    class Meta:
+        indexes = [
+            # Usado pelos workers para buscar o próximo job pendente
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status}) para {self.user.username}"
+
+
+class Movie(models.Model):
+    """
+    Catálogo local de filmes, preenchido a partir do TMDb na primeira busca.
+    Evita repetir a busca na API para títulos que já foram recomendados antes.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    normalized_title = models.CharField(max_length=255, help_text="Título normalizado (minúsculo, sem acentos/pontuação)")
+    year = models.IntegerField(help_text="Ano informado na recomendação")
+    title = models.CharField(max_length=255)
+    tmdb_id = models.IntegerField(null=True, blank=True, db_index=True, help_text="Vazio quando o TMDb não encontrou o filme")
+    original_title = models.CharField(max_length=255, blank=True)
+    poster_path = models.CharField(max_length=255, blank=True, null=True)
+    release_date = models.DateField(null=True, blank=True)
+    overview = models.TextField(blank=True)
+    tmdb_metadata = models.JSONField(default=dict, blank=True, help_text="Resultado bruto do TMDb")
+    fetched_at = models.DateTimeField(help_text="Quando os dados foram obtidos do TMDb")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['normalized_title', 'year'], name='unique_movie_title_year'),
+        ]
 
     def __str__(self):
-        return f"'{self.title}' na lista negra de {self.user.username}"
\ No newline at end of file
+        return f"{self.title} ({self.year})"
@@ -0,0 +1,275 @@
+# recommendations/ranking.py
+
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, Max
+
+from .catalog import normalize_title
+from .models import Movie, SubMood
+
+# --- EIXOS DE GÊNERO ---
+
+# IDs de gênero do TMDb (os mesmos de `genre_ids` nos resultados de busca), na ordem das colunas da matriz.
+# Os nomes seguem o catálogo de `Genre` (migração 0002).
+TMDB_GENRE_IDS = {
+    "Ação": 28, "Aventura": 12, "Animação": 16, "Comédia": 35, "Crime": 80, "Documentário": 99,
+    "Drama": 18, "Família": 10751, "Fantasia": 14, "História": 36, "Terror": 27, "Música": 10402,
+    "Mistério": 9648, "Romance": 10749, "Ficção Científica": 878, "Cinema TV": 10770,
+    "Suspense": 53, "Guerra": 10752, "Faroeste": 37,
+}
+GENRE_NAMES = list(TMDB_GENRE_IDS)
+_GENRE_COLUMNS = {genre_id: column for column, genre_id in enumerate(TMDB_GENRE_IDS.values())}
+_GENRE_NAMES_BY_ID = {genre_id: name for name, genre_id in TMDB_GENRE_IDS.items()}
+
+PERSONALITY_TRAITS = ["openness", "conscientiousness", "extraversion", "agreeableness", "neuroticism"]
+
+# Afinidade de cada traço (score alto) com os gêneros, seguindo o guia do system instruction do Gemini.
+# Pesos negativos representam o que o polo oposto do traço prefere.
+TRAIT_GENRE_AFFINITY = {
+    "openness": {
+        "Ficção Científica": 0.8, "Documentário": 0.6, "Fantasia": 0.5, "Mistério": 0.4, "Animação": 0.3,
+        "História": 0.3, "Ação": -0.3, "Romance": -0.2, "Família": -0.2, "Cinema TV": -0.2,
+    },
+    "conscientiousness": {
+        "História": 0.5, "Drama": 0.4, "Guerra": 0.4, "Documentário": 0.3, "Crime": 0.2,
+        "Comédia": -0.3, "Aventura": -0.3, "Suspense": -0.2,
+    },
+    "extraversion": {
+        "Ação": 0.5, "Música": 0.5, "Aventura": 0.4, "Comédia": 0.3, "Fantasia": 0.2,
+        "Drama": -0.3, "Suspense": -0.3, "Mistério": -0.3,
+    },
+    "agreeableness": {
+        "Família": 0.5, "Romance": 0.4, "Animação": 0.4, "Comédia": 0.3, "Drama": 0.2,
+        "Crime": -0.4, "Terror": -0.3, "Guerra": -0.2, "Suspense": -0.2,
+    },
+    "neuroticism": {
+        "Drama": 0.3, "Terror": 0.2, "Família": 0.2, "Comédia": 0.2,
+    },
+}
+
+# Afinidade dos humores (migração 0002) com os gêneros
+MOOD_GENRE_AFFINITY = {
+    "Alegria": {
+        "Comédia": 1.0, "Família": 0.5, "Animação": 0.5, "Música": 0.4, "Romance": 0.3, "Aventura": 0.3,
+        "Terror": -1.0, "Guerra": -0.5,
+    },
+    "Tristeza": {
+        "Drama": 1.0, "Romance": 0.4, "História": 0.3, "Guerra": 0.3, "Música": 0.2, "Comédia": -0.3,
+    },
+    "Medo/Tensão": {
+        "Terror": 1.0, "Suspense": 1.0, "Mistério": 0.5, "Crime": 0.4,
+        "Família": -1.0, "Animação": -0.5, "Comédia": -0.3,
+    },
+    "Curiosidade": {
+        "Mistério": 1.0, "Ficção Científica": 1.0, "Documentário": 0.8, "Fantasia": 0.6, "História": 0.3,
+    },
+    "Relaxamento": {
+        "Comédia": 0.6, "Romance": 0.6, "Família": 0.6, "Animação": 0.5, "Aventura": 0.3, "Música": 0.3,
+        "Terror": -1.0, "Suspense": -0.6, "Guerra": -0.6,
+    },
+}
+
+# Gêneros associados a cada SubMood; o vetor de um humor soma a média dos seus submoods
+SUBMOOD_GENRES = {
+    "Comédia": ["Comédia"], "Sessão da Tarde": ["Família", "Aventura", "Comédia"], "Sátira": ["Comédia"],
+    "Humor Ácido": ["Comédia", "Crime"], "Comédia Romântica": ["Comédia", "Romance"], "Paródia": ["Comédia"],
+    "Drama": ["Drama"], "Melancolia": ["Drama", "Romance"], "Reflexão": ["Drama", "Documentário"],
+    "Emocionante": ["Drama", "Família"],
+    "Terror": ["Terror"], "Suspense": ["Suspense"], "Thriller Psicológico": ["Suspense", "Mistério"],
+    "Sobrenatural": ["Terror", "Fantasia"], "Slasher": ["Terror"],
+    "Mistério": ["Mistério"], "Ficção Científica": ["Ficção Científica"], "Fantasia": ["Fantasia"],
+    "Documentário": ["Documentário"], "Investigação": ["Crime", "Mistério"],
+    "Conforto": ["Família", "Comédia"], "Romance Leve": ["Romance", "Comédia"], "Sessão Pipoca": ["Ação", "Aventura"],
+    "Nostalgia": ["Família", "Animação"], "Feel-good": ["Comédia", "Família", "Música"],
+}
+
+# Peso de cada componente na pontuação final
+FAVORITE_GENRE_WEIGHT = 1.0
+PERSONALITY_WEIGHT = 0.5
+MOOD_WEIGHT = 1.5
+SUBMOOD_WEIGHT = 0.5
+QUALITY_WEIGHT = 0.3
+
+
+def _genre_vector(weights: Dict[str, float]) -> np.ndarray:
+    vector = np.zeros(len(GENRE_NAMES), dtype=np.float32)
+    for name, weight in weights.items():
+        vector[GENRE_NAMES.index(name)] = weight
+    return vector
+
+
+_TRAIT_MATRIX = np.stack([_genre_vector(TRAIT_GENRE_AFFINITY[trait]) for trait in PERSONALITY_TRAITS])
+
+
+@lru_cache(maxsize=1024)
+def profile_vector(traits: Tuple[float, ...], favorite_genres: Tuple[str, ...]) -> np.ndarray:
+    """
+    Vetor de preferência do usuário sobre os gêneros (gêneros favoritos + personalidade).
+
+    Os scores do Big Five são somas de respostas -1/0/1; a `tanh` os leva para (-1, 1)
+    independentemente da quantidade de perguntas. O resultado é memorizado por perfil.
+    """
+    favorites = _genre_vector({name: 1.0 for name in favorite_genres if name in TMDB_GENRE_IDS})
+    personality = np.tanh(np.asarray(traits, dtype=np.float32)) @ _TRAIT_MATRIX
+    vector = FAVORITE_GENRE_WEIGHT * favorites + PERSONALITY_WEIGHT * personality
+    vector.setflags(write=False)
+    return vector
+
+
+def profile_traits(profile) -> Tuple[float, ...]:
+    return tuple(float(getattr(profile, trait)) for trait in PERSONALITY_TRAITS)
+
+
+def mood_vectors(moods) -> np.ndarray:
+    """
+    Matriz (humores x gêneros) com a afinidade de cada humor, incluindo seus submoods.
+    """
+    submoods_by_mood: Dict[object, List[str]] = {}
+    for mood_id, name in SubMood.objects.filter(mood__in=moods).values_list('mood_id', 'name'):
+        submoods_by_mood.setdefault(mood_id, []).append(name)
+
+    rows = []
+    for mood in moods:
+        vector = MOOD_WEIGHT * _genre_vector(MOOD_GENRE_AFFINITY.get(mood.name, {}))
+        submood_rows = [
+            _genre_vector({genre: 1.0 for genre in SUBMOOD_GENRES[name]})
+            for name in submoods_by_mood.get(mood.id, []) if name in SUBMOOD_GENRES
+        ]
+        if submood_rows:
+            vector += SUBMOOD_WEIGHT * np.mean(submood_rows, axis=0)
+        rows.append(vector)
+    return np.stack(rows)
+
+
+# --- ÍNDICE DO CATÁLOGO ---
+
+class CatalogIndex:
+    """
+    Matriz de features dos filmes do catálogo local, montada a partir dos metadados do TMDb.
+
+    - `genres`: (filmes x gêneros), uma linha por filme, normalizada para norma 1.
+    - `quality`: nota média do TMDb ponderada pelo número de votos, em [0, 1].
+    """
+
+    def __init__(self, movies: List[Movie]):
+        self.movies: List[Movie] = []
+        self.genre_names: List[List[str]] = []
+        genre_rows, quality = [], []
+
+        for movie in movies:
+            metadata = movie.tmdb_metadata or {}
+            columns = [_GENRE_COLUMNS[genre_id] for genre_id in metadata.get('genre_ids', []) if genre_id in _GENRE_COLUMNS]
+            if not columns:
+                continue
+
+            row = np.zeros(len(GENRE_NAMES), dtype=np.float32)
+            row[columns] = 1.0
+            genre_rows.append(row / math.sqrt(len(columns)))
+
+            # Poucos votos puxam a nota para o meio da escala
+            votes = metadata.get('vote_count') or 0
+            rating = (metadata.get('vote_average') or 0.0) / 10
+            quality.append((rating * votes + 0.5 * 50) / (votes + 50))
+
+            self.movies.append(movie)
+            self.genre_names.append([_GENRE_NAMES_BY_ID[genre_id] for genre_id in metadata['genre_ids'] if genre_id in _GENRE_NAMES_BY_ID])
+
+        self.genres = np.array(genre_rows, dtype=np.float32).reshape(len(self.movies), len(GENRE_NAMES))
+        self.quality = np.array(quality, dtype=np.float32)
+        self.keys = [movie.normalized_title for movie in self.movies]
+
+    def __len__(self):
+        return len(self.movies)
+
+    def mask_titles(self, titles: Iterable[str]) -> np.ndarray:
+        """
+        Máscara booleana dos filmes cujo título (normalizado) está em `titles`.
+        """
+        excluded = {normalize_title(title) for title in titles}
+        return np.fromiter((key in excluded for key in self.keys), dtype=bool, count=len(self.keys))
+
+
+_index: Optional[CatalogIndex] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_catalog_index() -> CatalogIndex:
+    """
+    Retorna o índice do catálogo, reconstruído apenas quando o catálogo muda
+    (verificado com uma única agregação: total de filmes e última atualização).
+    """
+    global _index, _index_version
+
+    version = tuple(Movie.objects.filter(tmdb_id__isnull=False).aggregate(Count('id'), Max('fetched_at')).values())
+    with _index_lock:
+        if _index is None or _index_version != version:
+            movies = Movie.objects.filter(tmdb_id__isnull=False).only(
+                'id', 'normalized_title', 'year', 'title', 'poster_path', 'overview', 'tmdb_metadata'
+            )
+            _index = CatalogIndex(list(movies))
+            _index_version = version
+        return _index
+
+
+# --- RANQUEAMENTO ---
+
+class Candidate(NamedTuple):
+    movie: Movie
+    score: float
+    genres: List[str]
+
+
+def rank_candidates(profile, favorite_genres: List[str], blacklist_titles: List[str], moods, k: int,
+                    exclude_titles: Iterable[str] = ()) -> Dict[object, List[Candidate]]:
+    """
+    Ranqueia os filmes do catálogo local para cada humor e retorna os `k` melhores de cada um.
+
+    A pontuação é `genres @ (perfil + humor)` mais a qualidade do filme, calculada de uma vez
+    para todos os humores. Filmes da blacklist (e de `exclude_titles`) são descartados e um
+    mesmo filme não é repetido entre humores.
+    """
+    index = get_catalog_index()
+    if not len(index) or not moods:
+        return {mood: [] for mood in moods}
+
+    preferences = profile_vector(profile_traits(profile), tuple(sorted(favorite_genres))) + mood_vectors(moods)
+    scores = index.genres @ preferences.T + QUALITY_WEIGHT * index.quality[:, None]
+    scores[index.mask_titles([*blacklist_titles, *exclude_titles])] = -np.inf
+
+    ranked = {}
+    for column, mood in enumerate(moods):
+        mood_scores = scores[:, column]
+        available = int(np.isfinite(mood_scores).sum())
+        top_k = min(k, available)
+        if top_k == 0:
+            ranked[mood] = []
+            continue
+
+        top = np.argpartition(-mood_scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-mood_scores[top])]
+        ranked[mood] = [Candidate(index.movies[i], float(mood_scores[i]), index.genre_names[i]) for i in top]
+        # Não repete o filme nos próximos humores
+        scores[top, :] = -np.inf
+    return ranked
+
+
+def most_relevant_titles(profile, favorite_genres: List[str], moods, titles: List[str], limit: int) -> List[str]:
+    """
+    Os `limit` títulos (normalizados) de `titles` que o perfil e os humores mais favorecem no
+    catálogo. Títulos fora do catálogo vêm depois, na ordem em que foram recebidos.
+    """
+    index = get_catalog_index()
+    scores: Dict[str, float] = {}
+    if len(index) and moods:
+        preferences = profile_vector(profile_traits(profile), tuple(sorted(favorite_genres))) + mood_vectors(moods)
+        rows = np.flatnonzero(index.mask_titles(titles))
+        best = (index.genres[rows] @ preferences.T).max(axis=1) if len(rows) else []
+        scores = {index.keys[row]: float(score) for row, score in zip(rows, best)}
+
+    ordered = sorted(titles, key=lambda title: (title not in scores, -scores.get(title, 0.0)))
+    return ordered[:limit]
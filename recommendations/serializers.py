@@ -1,7 +1,7 @@
 # recommendations/serializers.py
 
 from rest_framework import serializers
-from .models import Genre, RecommendationSet, RecommendationItem, Mood, ProfileGenre
+from .models import Genre, RecommendationSet, RecommendationItem, Mood, ProfileGenre, GenerationJob
 
 class GenreSerializer(serializers.ModelSerializer):
     class Meta:
@@ -51,3 +51,24 @@ class GenerateMoodRecommendationsSerializer(serializers.Serializer):
     Espera o ID do humor que o usuário selecionou.
     """
     mood_id = serializers.UUIDField(help_text="O ID do Mood para o qual gerar recomendações.")
+
+class GenerateBatchRecommendationsSerializer(serializers.Serializer):
+    """
+    Serializer para a geração em lote: vários humores em uma única chamada à IA.
+    """
+    mood_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        help_text="Lista de IDs dos Moods para os quais gerar recomendações."
+    )
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    """
+    Estado de um job de geração em segundo plano. `items` só é preenchido quando o job termina.
+    """
+    mood = MoodSerializer(read_only=True)
+    items = RecommendationItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'status', 'mood', 'items', 'error', 'created_at', 'started_at', 'finished_at']
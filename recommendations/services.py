@@ -0,0 +1,928 @@
+# recommendations/services.py
+
+import logging
+import math
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from rest_framework import status
+
+from accounts.models import Answer, Profile
+from integrations.circuit_breaker import CircuitOpenError
+from integrations.gemini.client import GeminiStreamError
+from integrations.gemini.governor import GeminiOverloadedError
+from integrations.gemini.service import GeminiService
+from integrations.gemini.singleflight import SingleFlight
+from integrations.gemini.types import Input as GeminiInput, BlacklistedMovieInput, Movie as GeminiMovie, MoodRecommendations
+from integrations.metrics import span
+from integrations.tmdb import TMDbService
+
+from .blacklist import BlacklistFilter, aget_blacklist_filter, get_blacklist_filter, prompt_blacklist, split_blocked
+from .catalog import normalize_title, resolve_movies, aresolve_movies
+from .history import RecentHistory, aget_recent_history, get_recent_history
+from .models import GenerationJob, Mood, ProfileGenre, RecommendationItem, RecommendationSet
+from .ranking import rank_candidates
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de filmes por humor (a mesma pedida ao Gemini)
+ITEMS_PER_MOOD = 3
+
+# Mensagem devolvida quando o governador do Gemini não consegue atender a tempo
+OVERLOADED_MESSAGE = "O serviço de IA está sobrecarregado no momento. Tente novamente em instantes."
+
+# Mensagem devolvida quando o Gemini está fora do ar e não há recomendações de reserva
+UNAVAILABLE_MESSAGE = "O serviço de IA está indisponível no momento. Tente novamente mais tarde."
+
+# Pedidos simultâneos para o mesmo set e humor (ex.: clique duplo em "gerar")
+# reaproveitam a geração em andamento em vez de criar itens duplicados.
+_generation_singleflight = SingleFlight()
+
+
+class GenerationError(Exception):
+    """
+    Falha em uma etapa da geração. Carrega a mensagem e o status HTTP que a view deve devolver.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        # Indica ao cliente quando vale tentar de novo (ex.: serviço de IA sobrecarregado)
+        return {"Retry-After": str(math.ceil(self.retry_after))} if self.retry_after else {}
+
+
+def _make_gemini_input(profile, favorite_genres: List[str], blacklist_titles: List[str], mood_names: List[str],
+                       candidates: Optional[List[str]] = None, recently_shown: Optional[List[str]] = None) -> GeminiInput:
+    personality_scores = {
+        "openness": profile.openness, "conscientiousness": profile.conscientiousness,
+        "extraversion": profile.extraversion, "agreeableness": profile.agreeableness,
+        "neuroticism": profile.neuroticism,
+    }
+    return GeminiInput(
+        preferences=favorite_genres,
+        score=personality_scores,
+        blacklist=[BlacklistedMovieInput(title=title) for title in blacklist_titles],
+        # Um único humor mantém o prompt original; vários humores usam a geração em lote
+        target_mood=mood_names[0] if len(mood_names) == 1 else None,
+        target_moods=mood_names if len(mood_names) > 1 else [],
+        candidates=candidates or [],
+        recently_shown=recently_shown or [],
+    )
+
+
+class ProfileData(NamedTuple):
+    profile: Profile
+    favorite_genres: List[str]
+    blacklist: BlacklistFilter
+    recent: RecentHistory
+
+    @property
+    def exclusions(self) -> BlacklistFilter:
+        """
+        Filmes que não podem ser recomendados: a blacklist e os exibidos recentemente.
+        """
+        return self.blacklist.extended(self.recent.titles())
+
+
+def load_profile_data(user) -> ProfileData:
+    """
+    Perfil, nomes dos gêneros favoritos, blacklist e histórico recente (ambos em cache) do usuário.
+    """
+    profile = user.profile
+    favorite_genres = list(ProfileGenre.objects.filter(profile=profile).values_list('genre__name', flat=True))
+    return ProfileData(profile, favorite_genres, get_blacklist_filter(user), get_recent_history(user))
+
+
+async def aload_profile_data(user) -> ProfileData:
+    """
+    Versão assíncrona de `load_profile_data`, usando a API async do ORM.
+    """
+    profile = await Profile.objects.aget(user=user)
+    favorite_genres = [
+        name async for name in ProfileGenre.objects.filter(profile=profile).values_list('genre__name', flat=True)
+    ]
+    return ProfileData(profile, favorite_genres, await aget_blacklist_filter(user), await aget_recent_history(user))
+
+
+def build_shortlist(profile, favorite_genres: List[str], blacklist_titles: List[str], moods) -> List[str]:
+    """
+    Pré-seleção do ranqueamento local enviada ao Gemini ("Título (Ano)"), quando
+    `LOCAL_RANKING_MODE` é "shortlist". Vazia se o catálogo ainda não tem filmes suficientes.
+    """
+    if settings.LOCAL_RANKING_MODE != 'shortlist':
+        return []
+
+    ranked = rank_candidates(profile, favorite_genres, blacklist_titles, moods, k=settings.LOCAL_RANKING_SHORTLIST_SIZE)
+    if any(len(candidates) < ITEMS_PER_MOOD for candidates in ranked.values()):
+        return []
+    return [f"{c.movie.title} ({c.movie.year})" for candidates in ranked.values() for c in candidates]
+
+
+def build_gemini_input(profile_data: ProfileData, moods) -> Optional[GeminiInput]:
+    """
+    Monta a entrada do Gemini a partir do perfil do usuário, para um ou mais humores.
+    O prompt leva só um subconjunto limitado da blacklist (ver `prompt_blacklist`) e dos
+    filmes exibidos recentemente. Retorna None se o usuário ainda não definiu gêneros favoritos.
+    """
+    profile, favorite_genres, blacklist, recent = profile_data
+    if not favorite_genres:
+        return None
+
+    candidates = build_shortlist(profile, favorite_genres, profile_data.exclusions.normalized_titles, moods)
+    blacklist_titles = prompt_blacklist(blacklist, profile, favorite_genres, moods)
+    return _make_gemini_input(
+        profile, favorite_genres, blacklist_titles, [mood.name for mood in moods], candidates,
+        recently_shown=recent.titles(settings.SHOWN_HISTORY_PROMPT_LIMIT),
+    )
+
+
+def build_local_items(user, recommendation_set, moods) -> Optional[List[RecommendationItem]]:
+    """
+    Caminho rápido (`LOCAL_RANKING_MODE` = "fast"): cria os itens direto do ranqueamento
+    local do catálogo, sem chamar o Gemini. Retorna None se algum humor não tiver
+    candidatos suficientes, para que a geração siga pelo Gemini.
+    """
+    profile_data = load_profile_data(user)
+    profile, favorite_genres = profile_data.profile, profile_data.favorite_genres
+    if not favorite_genres:
+        return None
+
+    already_in_set = RecommendationItem.objects.filter(recommendation_set=recommendation_set).values_list('title', flat=True)
+    ranked = rank_candidates(profile, favorite_genres, profile_data.exclusions.normalized_titles, moods, k=ITEMS_PER_MOOD, exclude_titles=already_in_set)
+    if any(len(candidates) < ITEMS_PER_MOOD for candidates in ranked.values()):
+        return None
+
+    tmdb_service = TMDbService()
+    items_to_create = []
+    for mood, candidates in ranked.items():
+        movies = [_catalog_movie(c, mood, favorite_genres, rank) for rank, c in enumerate(candidates, start=1)]
+        poster_urls = [tmdb_service.build_poster_url(c.movie.poster_path) for c in candidates]
+        items = build_recommendation_items(recommendation_set, mood, movies, poster_urls)
+        for item, candidate in zip(items, candidates):
+            item.relevance_score = candidate.score
+        items_to_create += items
+    return RecommendationItem.objects.bulk_create(items_to_create)
+
+
+def _catalog_movie(candidate, mood, favorite_genres: List[str], rank: int) -> GeminiMovie:
+    """
+    Filme do ranqueamento local no formato da resposta do Gemini.
+    """
+    return GeminiMovie(
+        rank=rank,
+        title=candidate.movie.title,
+        year=candidate.movie.year,
+        synopsis=candidate.movie.overview,
+        reason_for_recommendation=f"Combina com o humor '{mood.name}' e com seus gêneros favoritos ({', '.join(favorite_genres)}).",
+        tags=candidate.genres,
+    )
+
+
+# --- PÓS-FILTRO DA BLACKLIST E DO HISTÓRICO RECENTE ---
+
+MoodMovies = List[Tuple[Mood, List[GeminiMovie]]]
+
+
+def _titles(mood_movies: MoodMovies) -> List[str]:
+    return [movie.title for _, movies in mood_movies for movie in movies]
+
+
+def _short_moods(mood_movies: MoodMovies) -> List[Mood]:
+    return [mood for mood, movies in mood_movies if len(movies) < ITEMS_PER_MOOD]
+
+
+def remove_excluded(exclusions: BlacklistFilter, mood_movies: MoodMovies) -> Tuple[MoodMovies, List[GeminiMovie]]:
+    """
+    Tira da resposta do Gemini os filmes da blacklist do usuário e os exibidos recentemente
+    (o prompt só leva parte deles). Retorna os humores com os filmes permitidos e a lista
+    dos filmes rejeitados.
+    """
+    _, rejected = split_blocked(exclusions, [movie for _, movies in mood_movies for movie in movies])
+    rejected_ids = {id(movie) for movie in rejected}
+    if rejected:
+        logger.info("%s filme(s) bloqueado(s) ou repetido(s) removido(s) da resposta do Gemini.", len(rejected))
+    return [(mood, [movie for movie in movies if id(movie) not in rejected_ids]) for mood, movies in mood_movies], rejected
+
+
+def refill_from_catalog(profile_data: ProfileData, recommendation_set, mood_movies: MoodMovies,
+                        rejected: List[GeminiMovie]) -> MoodMovies:
+    """
+    Completa os humores que ficaram com menos de `ITEMS_PER_MOOD` filmes com os melhores
+    candidatos do catálogo local (sem nova chamada à IA), sem repetir filmes.
+    """
+    short_moods = _short_moods(mood_movies)
+    if not short_moods:
+        return mood_movies
+
+    already_in_set = RecommendationItem.objects.filter(recommendation_set=recommendation_set).values_list('title', flat=True)
+    ranked = rank_candidates(
+        profile_data.profile, profile_data.favorite_genres, profile_data.exclusions.normalized_titles, short_moods, k=ITEMS_PER_MOOD,
+        exclude_titles=[*_titles(mood_movies), *(movie.title for movie in rejected), *already_in_set],
+    )
+    return [
+        (mood, movies + [
+            _catalog_movie(c, mood, profile_data.favorite_genres, ITEMS_PER_MOOD) for c in ranked.get(mood, [])[:ITEMS_PER_MOOD - len(movies)]
+        ])
+        for mood, movies in mood_movies
+    ]
+
+
+def _followup_input(gemini_input: GeminiInput, mood_movies: MoodMovies, rejected: List[GeminiMovie]) -> GeminiInput:
+    """
+    Entrada da chamada complementar ao Gemini: só os humores incompletos, evitando também
+    os filmes rejeitados e os já escolhidos.
+    """
+    mood_names = [mood.name for mood in _short_moods(mood_movies)]
+    avoid = [movie.title for movie in gemini_input.blacklist] + [movie.title for movie in rejected] + _titles(mood_movies)
+    return gemini_input.model_copy(update={
+        "target_mood": mood_names[0] if len(mood_names) == 1 else None,
+        "target_moods": mood_names if len(mood_names) > 1 else [],
+        "blacklist": [BlacklistedMovieInput(title=title) for title in dict.fromkeys(avoid)],
+        "candidates": [],
+    })
+
+
+def merge_followup(exclusions: BlacklistFilter, mood_movies: MoodMovies, followup_output) -> MoodMovies:
+    """
+    Preenche os humores incompletos com os filmes da chamada complementar que passarem no filtro.
+    """
+    if not followup_output or not followup_output.recommendations:
+        return mood_movies
+
+    extra, _ = remove_excluded(exclusions, assign_moods(followup_output.recommendations, _short_moods(mood_movies)))
+    extra_by_mood = dict(extra)
+    taken = {normalize_title(title) for title in _titles(mood_movies)}
+    merged = []
+    for mood, movies in mood_movies:
+        movies = list(movies)
+        for movie in extra_by_mood.get(mood, []):
+            if len(movies) >= ITEMS_PER_MOOD:
+                break
+            if normalize_title(movie.title) not in taken:
+                taken.add(normalize_title(movie.title))
+                movies.append(movie)
+        merged.append((mood, movies))
+    return merged
+
+
+def rerank(mood_movies: MoodMovies) -> MoodMovies:
+    return [
+        (mood, [movie.model_copy(update={"rank": rank}) for rank, movie in enumerate(movies, start=1)])
+        for mood, movies in mood_movies
+    ]
+
+
+def enforce_exclusions(profile_data: ProfileData, gemini_input: GeminiInput, recommendation_set, mood_movies: MoodMovies) -> MoodMovies:
+    """
+    Pós-filtro: remove os filmes da blacklist e os exibidos recentemente e repõe as vagas,
+    primeiro pelo catálogo local e, se ainda faltar, com uma única chamada complementar ao Gemini.
+    """
+    exclusions = profile_data.exclusions
+    mood_movies, rejected = remove_excluded(exclusions, mood_movies)
+    if not rejected:
+        return mood_movies
+
+    mood_movies = refill_from_catalog(profile_data, recommendation_set, mood_movies, rejected)
+    if _short_moods(mood_movies):
+        try:
+            followup = GeminiService().get_recommendations(_followup_input(gemini_input, mood_movies, rejected), exclusions.blocks)
+        except Exception as e:
+            logger.warning("Erro na chamada complementar ao Gemini: %s", e)
+            followup = None
+        mood_movies = merge_followup(exclusions, mood_movies, followup)
+    return rerank(mood_movies)
+
+
+async def aenforce_exclusions(profile_data: ProfileData, gemini_input: GeminiInput, recommendation_set, mood_movies: MoodMovies) -> MoodMovies:
+    """
+    Versão assíncrona de `enforce_exclusions`.
+    """
+    exclusions = profile_data.exclusions
+    mood_movies, rejected = await sync_to_async(remove_excluded)(exclusions, mood_movies)
+    if not rejected:
+        return mood_movies
+
+    mood_movies = await sync_to_async(refill_from_catalog)(profile_data, recommendation_set, mood_movies, rejected)
+    if _short_moods(mood_movies):
+        try:
+            followup = await GeminiService().aget_recommendations(_followup_input(gemini_input, mood_movies, rejected), exclusions.blocks)
+        except Exception as e:
+            logger.warning("Erro na chamada complementar ao Gemini: %s", e)
+            followup = None
+        mood_movies = await sync_to_async(merge_followup)(exclusions, mood_movies, followup)
+    return rerank(mood_movies)
+
+
+def fetch_poster_urls(tmdb_service, movies: List[GeminiMovie]) -> List[Optional[str]]:
+    """
+    Resolve os pôsteres pelo catálogo local (`Movie`); só os filmes ainda
+    desconhecidos são buscados no TMDb, em paralelo. Mantém a ordem de `movies`.
+    """
+    entries = resolve_movies(tmdb_service, movies)
+    return [tmdb_service.build_poster_url(entry.poster_path) if entry else None for entry in entries]
+
+
+async def afetch_poster_urls(tmdb_service, movies: List[GeminiMovie]) -> List[Optional[str]]:
+    """
+    Versão assíncrona de `fetch_poster_urls`.
+    """
+    entries = await aresolve_movies(tmdb_service, movies)
+    return [tmdb_service.build_poster_url(entry.poster_path) if entry else None for entry in entries]
+
+
+def build_recommendation_items(recommendation_set, mood, movies: List[GeminiMovie], poster_urls: List[Optional[str]]) -> List[RecommendationItem]:
+    """
+    Monta (sem salvar) os RecommendationItems de um humor.
+    """
+    return [
+        RecommendationItem(
+            recommendation_set=recommendation_set,
+            mood=mood,
+            external_id=f"tmdb:{movie.title}-{movie.year}",
+            title=movie.title,
+            rank=movie.rank,
+            thumbnail_url=poster_url,
+            movie_metadata=movie.model_dump()
+        )
+        for movie, poster_url in zip(movies, poster_urls)
+    ]
+
+
+def assign_moods(recommendations: List[MoodRecommendations], moods: List[Mood]) -> List[Tuple[Mood, List[GeminiMovie]]]:
+    """
+    Associa cada bloco de recomendações do Gemini ao `Mood` correspondente, pelo nome.
+    Blocos com nome inesperado são atribuídos, em ordem, aos humores que sobraram.
+    """
+    moods_by_name = {mood.name.strip().lower(): mood for mood in moods}
+    assigned: Dict[Mood, List[GeminiMovie]] = {}
+    unmatched = []
+    for mood_rec in recommendations:
+        mood = moods_by_name.get(mood_rec.mood.strip().lower())
+        if mood is not None and mood not in assigned:
+            assigned[mood] = mood_rec.movies
+        else:
+            unmatched.append(mood_rec)
+
+    remaining = [mood for mood in moods if mood not in assigned]
+    for mood, mood_rec in zip(remaining, unmatched):
+        assigned[mood] = mood_rec.movies
+
+    return [(mood, assigned[mood]) for mood in moods if mood in assigned]
+
+
+def _build_items_for_moods(recommendation_set, mood_movies, poster_urls: List[Optional[str]]) -> List[RecommendationItem]:
+    items_to_create = []
+    offset = 0
+    for mood, movies in mood_movies:
+        items_to_create += build_recommendation_items(
+            recommendation_set, mood, movies, poster_urls[offset:offset + len(movies)]
+        )
+        offset += len(movies)
+    return items_to_create
+
+
+def _generation_key(recommendation_set, moods) -> str:
+    return f"{recommendation_set.id}:" + ",".join(sorted(str(mood.id) for mood in moods))
+
+
+def generate_mood_items(user, recommendation_set, mood) -> List[RecommendationItem]:
+    """
+    Executa o fluxo completo de geração para um humor (Gemini -> pôsteres do TMDb -> banco)
+    e retorna os itens criados. Lança `GenerationError` em caso de falha.
+
+    Em sets pré-gerados, devolve os itens já prontos para o humor, sem gerar de novo.
+    """
+    prewarmed_items = take_prewarmed_items(recommendation_set, mood)
+    if prewarmed_items is not None:
+        return prewarmed_items
+    return generate_batch_items(user, recommendation_set, [mood])
+
+
+async def agenerate_mood_items(user, recommendation_set, mood) -> List[RecommendationItem]:
+    """
+    Versão assíncrona de `generate_mood_items`.
+    """
+    prewarmed_items = await sync_to_async(take_prewarmed_items)(recommendation_set, mood)
+    if prewarmed_items is not None:
+        return prewarmed_items
+    return await agenerate_batch_items(user, recommendation_set, [mood])
+
+
+def generate_batch_items(user, recommendation_set, moods) -> List[RecommendationItem]:
+    """
+    Gera recomendações para vários humores com uma única chamada ao Gemini e uma única
+    passada de pôsteres no TMDb, criando todos os itens de uma vez.
+    """
+    return _generation_singleflight.do(
+        _generation_key(recommendation_set, moods),
+        lambda: _generate_items(user, recommendation_set, moods)
+    )
+
+
+async def agenerate_batch_items(user, recommendation_set, moods) -> List[RecommendationItem]:
+    """
+    Versão assíncrona de `generate_batch_items`.
+    """
+    return await _generation_singleflight.ado(
+        _generation_key(recommendation_set, moods),
+        lambda: _agenerate_items(user, recommendation_set, moods)
+    )
+
+
+def _generate_items(user, recommendation_set, moods) -> List[RecommendationItem]:
+    if settings.LOCAL_RANKING_MODE == 'fast':
+        with span("local-ranking"):
+            local_items = build_local_items(user, recommendation_set, moods)
+        if local_items is not None:
+            return local_items
+
+    with span("profile"):
+        profile_data = load_profile_data(user)
+    with span("prompt"):
+        gemini_input = build_gemini_input(profile_data, moods)
+    if gemini_input is None:
+        raise GenerationError("Gêneros favoritos não definidos.", status.HTTP_400_BAD_REQUEST)
+
+    try:
+        gemini_service = GeminiService()
+        with span("gemini"):
+            recommendations_output = gemini_service.get_recommendations(gemini_input, profile_data.exclusions.blocks)
+    except CircuitOpenError as e:
+        logger.warning("Gemini indisponível, usando recomendações de reserva: %s", e)
+        return fallback_items(user, recommendation_set, moods, e.retry_after)
+    except GeminiOverloadedError as e:
+        logger.warning("Gemini sobrecarregado: %s", e.message)
+        raise GenerationError(OVERLOADED_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE, retry_after=e.retry_after)
+    except Exception as e:
+        logger.error("Erro ao chamar o serviço Gemini: %s", e)
+        raise GenerationError("Falha na comunicação com o serviço de IA.", status.HTTP_503_SERVICE_UNAVAILABLE)
+    if not recommendations_output or not recommendations_output.recommendations:
+        raise GenerationError("Não foi possível gerar recomendações no momento.", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    try:
+        mood_movies = assign_moods(recommendations_output.recommendations, moods)
+        with span("exclusions"):
+            mood_movies = enforce_exclusions(profile_data, gemini_input, recommendation_set, mood_movies)
+        all_movies = [movie for _, movies in mood_movies for movie in movies]
+        with span("tmdb"):
+            poster_urls = fetch_poster_urls(TMDbService(), all_movies)
+        items_to_create = _build_items_for_moods(recommendation_set, mood_movies, poster_urls)
+        with span("save"):
+            return RecommendationItem.objects.bulk_create(items_to_create)
+    except (IndexError, KeyError) as e:
+        logger.exception("Erro de parsing na resposta do Gemini: %s", e)
+        raise GenerationError("A resposta do serviço de IA foi malformada.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        logger.exception("Erro ao processar e salvar recomendações: %s", e)
+        raise GenerationError("Ocorreu um erro ao salvar as recomendações.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def _agenerate_items(user, recommendation_set, moods) -> List[RecommendationItem]:
+    if settings.LOCAL_RANKING_MODE == 'fast':
+        with span("local-ranking"):
+            local_items = await sync_to_async(build_local_items)(user, recommendation_set, moods)
+        if local_items is not None:
+            return local_items
+
+    with span("profile"):
+        profile_data = await aload_profile_data(user)
+    with span("prompt"):
+        gemini_input = await sync_to_async(build_gemini_input)(profile_data, moods)
+    if gemini_input is None:
+        raise GenerationError("Gêneros favoritos não definidos.", status.HTTP_400_BAD_REQUEST)
+
+    try:
+        gemini_service = GeminiService()
+        with span("gemini"):
+            recommendations_output = await gemini_service.aget_recommendations(gemini_input, profile_data.exclusions.blocks)
+    except CircuitOpenError as e:
+        logger.warning("Gemini indisponível, usando recomendações de reserva: %s", e)
+        return await sync_to_async(fallback_items)(user, recommendation_set, moods, e.retry_after)
+    except GeminiOverloadedError as e:
+        logger.warning("Gemini sobrecarregado: %s", e.message)
+        raise GenerationError(OVERLOADED_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE, retry_after=e.retry_after)
+    except Exception as e:
+        logger.error("Erro ao chamar o serviço Gemini: %s", e)
+        raise GenerationError("Falha na comunicação com o serviço de IA.", status.HTTP_503_SERVICE_UNAVAILABLE)
+    if not recommendations_output or not recommendations_output.recommendations:
+        raise GenerationError("Não foi possível gerar recomendações no momento.", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    try:
+        mood_movies = assign_moods(recommendations_output.recommendations, moods)
+        with span("exclusions"):
+            mood_movies = await aenforce_exclusions(profile_data, gemini_input, recommendation_set, mood_movies)
+        all_movies = [movie for _, movies in mood_movies for movie in movies]
+        with span("tmdb"):
+            poster_urls = await afetch_poster_urls(TMDbService(), all_movies)
+        items_to_create = _build_items_for_moods(recommendation_set, mood_movies, poster_urls)
+        with span("save"):
+            return await RecommendationItem.objects.abulk_create(items_to_create)
+    except (IndexError, KeyError) as e:
+        logger.exception("Erro de parsing na resposta do Gemini: %s", e)
+        raise GenerationError("A resposta do serviço de IA foi malformada.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        logger.exception("Erro ao processar e salvar recomendações: %s", e)
+        raise GenerationError("Ocorreu um erro ao salvar as recomendações.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def stream_mood_items(user, recommendation_set, mood) -> Iterator[RecommendationItem]:
+    """
+    Versão em streaming de `generate_mood_items`: cada filme é resolvido no TMDb e salvo
+    assim que o Gemini termina de enviá-lo, e o item é entregue em seguida.
+
+    A validação do perfil acontece já na chamada (lança `GenerationError`); falhas
+    durante o streaming são lançadas, também como `GenerationError`, pelo gerador.
+    """
+    prewarmed_items = take_prewarmed_items(recommendation_set, mood)
+    if prewarmed_items is not None:
+        return iter(prewarmed_items)
+
+    with span("profile"):
+        profile_data = load_profile_data(user)
+    with span("prompt"):
+        gemini_input = build_gemini_input(profile_data, [mood])
+    if gemini_input is None:
+        raise GenerationError("Gêneros favoritos não definidos.", status.HTTP_400_BAD_REQUEST)
+
+    return _stream_items(user, profile_data, gemini_input, recommendation_set, mood)
+
+
+def _stream_items(user, profile_data, gemini_input, recommendation_set, mood) -> Iterator[RecommendationItem]:
+    tmdb_service = TMDbService()
+    # Filmes já entregues e rejeitados (blacklist ou exibidos recentemente), para repor as vagas pelo catálogo no fim
+    exclusions = profile_data.exclusions
+    movies = GeminiService().stream_recommendations(gemini_input, exclusions.blocks)
+    streamed, rejected = [], []
+
+    while True:
+        try:
+            _, movie = next(movies)
+        except StopIteration:
+            break
+        except CircuitOpenError as e:
+            # O circuito só recusa a chamada antes do streaming começar
+            logger.warning("Gemini indisponível, usando recomendações de reserva: %s", e)
+            yield from fallback_items(user, recommendation_set, [mood], e.retry_after)
+            return
+        except GeminiOverloadedError as e:
+            logger.warning("Gemini sobrecarregado: %s", e.message)
+            raise GenerationError(OVERLOADED_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE, retry_after=e.retry_after)
+        except GeminiStreamError as e:
+            logger.error("Erro ao chamar o serviço Gemini: %s", e)
+            raise GenerationError("Falha na comunicação com o serviço de IA.", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        allowed, blocked = split_blocked(exclusions, [movie])
+        rejected += blocked
+        for movie in allowed:
+            # Posição contínua mesmo depois de um filme rejeitado
+            movie = movie.model_copy(update={"rank": len(streamed) + 1})
+            streamed.append(movie)
+            yield _save_streamed_item(tmdb_service, recommendation_set, mood, movie)
+
+    if rejected:
+        logger.info("%s filme(s) bloqueado(s) ou repetido(s) removido(s) da resposta do Gemini.", len(rejected))
+        (_, refilled), = refill_from_catalog(profile_data, recommendation_set, [(mood, streamed)], rejected)
+        for rank, movie in enumerate(refilled[len(streamed):], start=len(streamed) + 1):
+            yield _save_streamed_item(tmdb_service, recommendation_set, mood, movie.model_copy(update={"rank": rank}))
+
+
+def _save_streamed_item(tmdb_service, recommendation_set, mood, movie: GeminiMovie) -> RecommendationItem:
+    try:
+        with span("tmdb"):
+            poster_urls = fetch_poster_urls(tmdb_service, [movie])
+        item, = build_recommendation_items(recommendation_set, mood, [movie], poster_urls)
+        with span("save"):
+            item.save()
+    except Exception as e:
+        logger.exception("Erro ao processar e salvar recomendações: %s", e)
+        raise GenerationError("Ocorreu um erro ao salvar as recomendações.", status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return item
+
+
+# --- RESERVA PARA QUANDO O GEMINI ESTÁ FORA DO AR ---
+
+def _history_fallback(user, recommendation_set, mood, blacklist: BlacklistFilter) -> List[RecommendationItem]:
+    """
+    Cópias (não salvas) dos itens mais recentes do usuário para o humor, vindos de sets anteriores.
+    """
+    past_items = (
+        RecommendationItem.objects
+        .filter(recommendation_set__user=user, mood=mood)
+        .exclude(recommendation_set=recommendation_set)
+        .order_by('-recommendation_set__created_at', 'rank')[:ITEMS_PER_MOOD * 3]
+    )
+    copies, seen_titles = [], set()
+    for item in past_items:
+        if item.title in seen_titles or blacklist.blocks(item.title):
+            continue
+        seen_titles.add(item.title)
+        copies.append(RecommendationItem(
+            recommendation_set=recommendation_set,
+            mood=mood,
+            external_id=item.external_id,
+            title=item.title,
+            rank=len(copies) + 1,
+            thumbnail_url=item.thumbnail_url,
+            movie_metadata=item.movie_metadata,
+            relevance_score=item.relevance_score,
+        ))
+        if len(copies) == ITEMS_PER_MOOD:
+            break
+    return copies
+
+
+def fallback_items(user, recommendation_set, moods, retry_after: Optional[float] = None) -> List[RecommendationItem]:
+    """
+    Recomendações servidas enquanto o circuito do Gemini está aberto, sem esperar pela rede:
+    primeiro os itens mais recentes do usuário para cada humor (de sets anteriores) e, para os
+    humores sem histórico, os melhores filmes do catálogo local pelo ranqueamento.
+    Lança `GenerationError` (503) se não houver reserva para todos os humores.
+    """
+    blacklist = get_blacklist_filter(user)
+
+    history_items, missing_moods = [], []
+    for mood in moods:
+        copies = _history_fallback(user, recommendation_set, mood, blacklist)
+        if copies:
+            history_items += copies
+        else:
+            missing_moods.append(mood)
+
+    catalog_items = []
+    if missing_moods:
+        catalog_items = build_local_items(user, recommendation_set, missing_moods)
+        if catalog_items is None:
+            raise GenerationError(UNAVAILABLE_MESSAGE, status.HTTP_503_SERVICE_UNAVAILABLE, retry_after=retry_after)
+
+    return RecommendationItem.objects.bulk_create(history_items) + catalog_items
+
+
+# --- FILA DE GERAÇÃO EM SEGUNDO PLANO ---
+
+# Tentativas de um job antes de ser marcado como falho
+MAX_JOB_ATTEMPTS = 3
+# Chave da trava (pg_advisory_xact_lock) que serializa a reserva de jobs de pré-geração
+PREWARM_CLAIM_LOCK = 0x63696e65
+
+
+def _lock_prewarm_claims() -> None:
+    """
+    Serializa, entre os workers, a contagem e a reserva de jobs de pré-geração até o fim da
+    transação; sem ela, dois workers podem ver a mesma contagem e passar juntos do limite.
+    No SQLite as escritas já são serializadas pelo próprio banco.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PREWARM_CLAIM_LOCK])
+
+
+def claim_next_job() -> Optional[GenerationJob]:
+    """
+    Reserva o job pendente mais antigo. O `skip_locked` permite que vários workers
+    consultem a fila ao mesmo tempo sem pegar o mesmo job.
+    """
+    with transaction.atomic():
+        # Jobs devolvidos à fila por sobrecarga do Gemini só voltam depois do Retry-After
+        pending = GenerationJob.objects.select_for_update(skip_locked=True).filter(
+            Q(available_at__isnull=True) | Q(available_at__lte=timezone.now()),
+            status=GenerationJob.Status.PENDING,
+        )
+        job = pending.filter(is_prewarm=False).order_by('created_at').first()
+        if job is None:
+            # Jobs de pré-geração só rodam depois dos pedidos dos usuários e até o limite global de concorrência
+            _lock_prewarm_claims()
+            running_prewarm = GenerationJob.objects.filter(status=GenerationJob.Status.RUNNING, is_prewarm=True).count()
+            if running_prewarm >= settings.PREWARM_MAX_CONCURRENCY:
+                return None
+            job = pending.filter(is_prewarm=True).order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = GenerationJob.Status.RUNNING
+        job.started_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts'])
+    return job
+
+
+def _discard_previous_attempts(job: GenerationJob) -> None:
+    """
+    Apaga os itens de tentativas anteriores de um job devolvido à fila (ex.: o worker morreu
+    depois de gravar os itens, mas antes de concluir o job), para a nova tentativa não duplicá-los.
+    """
+    RecommendationItem.objects.filter(
+        recommendation_set=job.recommendation_set_id, mood=job.mood_id,
+        created_at__gte=job.created_at, generation_jobs__isnull=True,
+    ).delete()
+
+
+def run_generation_job(job: GenerationJob) -> GenerationJob:
+    """
+    Executa um job já reservado e grava o resultado (itens ou erro).
+
+    O resultado só é gravado se o job ainda estiver nesta tentativa: se ele foi devolvido à fila
+    e reservado de novo enquanto esta execução demorava, os itens criados aqui são descartados.
+    Também são descartados os itens de uma pré-geração que o pedido desistiu de esperar.
+    """
+    if job.attempts > 1:
+        _discard_previous_attempts(job)
+
+    created_items = []
+    try:
+        created_items = generate_batch_items(job.user, job.recommendation_set, [job.mood])
+    except GenerationError as e:
+        # Sobrecarga do Gemini é passageira: o job volta para a fila enquanto houver tentativas
+        retry = e.retry_after is not None and job.attempts < MAX_JOB_ATTEMPTS
+        job.status = GenerationJob.Status.PENDING if retry else GenerationJob.Status.FAILED
+        job.error = e.message
+        if retry:
+            job.available_at = timezone.now() + timedelta(seconds=e.retry_after)
+    except Exception as e:
+        logger.exception("Erro inesperado ao executar o job %s: %s", job.id, e)
+        job.status = GenerationJob.Status.FAILED
+        job.error = "Erro inesperado ao gerar as recomendações."
+    else:
+        job.status = GenerationJob.Status.DONE
+        job.error = ""
+
+    job.finished_at = None if job.status == GenerationJob.Status.PENDING else timezone.now()
+    with transaction.atomic():
+        # A trava da linha ordena esta gravação com `take_prewarmed_items`, que pode abandonar o job
+        current = GenerationJob.objects.select_for_update().filter(
+            pk=job.pk, status=GenerationJob.Status.RUNNING, attempts=job.attempts,
+        ).values('consumed_at').first()
+        if current is None:
+            logger.warning("Job %s foi reservado por outra tentativa; resultado descartado.", job.id)
+            RecommendationItem.objects.filter(pk__in=[item.pk for item in created_items]).delete()
+            job.refresh_from_db(fields=['status', 'error', 'attempts', 'started_at', 'finished_at'])
+            return job
+
+        GenerationJob.objects.filter(pk=job.pk).update(
+            status=job.status, error=job.error, finished_at=job.finished_at, available_at=job.available_at,
+        )
+        if current['consumed_at'] is not None:
+            RecommendationItem.objects.filter(pk__in=[item.pk for item in created_items]).delete()
+        elif job.status == GenerationJob.Status.DONE:
+            job.items.set(created_items)
+    return job
+
+
+def requeue_stale_jobs(stale_after: timedelta, max_attempts: int = MAX_JOB_ATTEMPTS) -> int:
+    """
+    Devolve para a fila os jobs que ficaram "em execução" por tempo demais
+    (ex.: o worker morreu no meio). Após `max_attempts`, o job é marcado como falho.
+    """
+    cutoff = timezone.now() - stale_after
+    stale = GenerationJob.objects.filter(status=GenerationJob.Status.RUNNING, started_at__lt=cutoff)
+
+    # Pré-gerações abandonadas pelo pedido não valem uma nova tentativa
+    abandoned = stale.filter(consumed_at__isnull=False).update(
+        status=GenerationJob.Status.FAILED,
+        error="Pré-geração abandonada.",
+        finished_at=timezone.now(),
+    )
+    stale = stale.filter(consumed_at__isnull=True)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=GenerationJob.Status.FAILED,
+        error="O job excedeu o número máximo de tentativas.",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=GenerationJob.Status.PENDING)
+    return requeued + failed + abandoned
+
+
+# --- PRÉ-GERAÇÃO ---
+
+def profile_snapshot(user) -> Dict[str, Any]:
+    """
+    Snapshot dos dados do perfil que influenciam a geração. Um set pré-gerado
+    só é promovido se o snapshot ainda for o mesmo de quando foi agendado.
+    """
+    profile, favorite_genres, blacklist, _ = load_profile_data(user)
+    return {
+        "scores": {
+            "openness": profile.openness, "conscientiousness": profile.conscientiousness,
+            "extraversion": profile.extraversion, "agreeableness": profile.agreeableness,
+            "neuroticism": profile.neuroticism,
+        },
+        "genres": sorted(favorite_genres),
+        "blacklist": sorted(blacklist.titles.values()),
+    }
+
+
+def _waiting_prewarm_sets(user):
+    return RecommendationSet.objects.filter(user=user, is_active=False, prewarm_status=RecommendationSet.PrewarmStatus.READY)
+
+
+def _running_jobs():
+    return GenerationJob.objects.filter(recommendation_set=OuterRef('pk'), status=GenerationJob.Status.RUNNING)
+
+
+def _discard_prewarm_sets(sets) -> None:
+    """
+    Descarta sets pré-gerados: os jobs pendentes saem da fila e os sets sem job em execução são
+    apagados. Os que têm um job rodando no worker ficam marcados como descartados e são apagados
+    por `purge_discarded_prewarm_sets` quando ele terminar.
+    """
+    GenerationJob.objects.filter(recommendation_set__in=sets, status=GenerationJob.Status.PENDING).delete()
+    sets.filter(~Exists(_running_jobs())).delete()
+    sets.update(prewarm_status=RecommendationSet.PrewarmStatus.DISCARDED)
+
+
+def purge_discarded_prewarm_sets() -> int:
+    """
+    Apaga os sets pré-gerados descartados que não têm mais job em execução.
+    """
+    deleted, _ = RecommendationSet.objects.filter(
+        prewarm_status=RecommendationSet.PrewarmStatus.DISCARDED,
+    ).filter(~Exists(_running_jobs())).delete()
+    return deleted
+
+
+def schedule_prewarm(user) -> Optional[RecommendationSet]:
+    """
+    Quando o perfil está completo (questionário respondido e gêneros definidos), cria um set
+    inativo e enfileira um job de pré-geração para cada `Mood`. Pré-gerações anteriores
+    ainda não promovidas são descartadas. Não faz nada se `PREWARM_RECOMMENDATIONS` estiver desligado.
+    """
+    if not settings.PREWARM_RECOMMENDATIONS:
+        return None
+
+    profile = user.profile
+    if not Answer.objects.filter(profile=profile).exists() or not ProfileGenre.objects.filter(profile=profile).exists():
+        return None
+
+    with transaction.atomic():
+        _discard_prewarm_sets(_waiting_prewarm_sets(user))
+        recommendation_set = RecommendationSet.objects.create(
+            user=user,
+            is_active=False,
+            input_snapshot=profile_snapshot(user),
+            prewarm_status=RecommendationSet.PrewarmStatus.READY,
+        )
+        GenerationJob.objects.bulk_create([
+            GenerationJob(user=user, recommendation_set=recommendation_set, mood=mood, is_prewarm=True)
+            for mood in Mood.objects.all()
+        ])
+    return recommendation_set
+
+
+def promote_prewarmed_set(user) -> Optional[RecommendationSet]:
+    """
+    Ativa o set pré-gerado mais recente do usuário, se ele ainda corresponder ao perfil atual.
+    Deve ser chamado depois de desativar o set ativo anterior.
+    """
+    recommendation_set = _waiting_prewarm_sets(user).order_by('-created_at').first()
+    if recommendation_set is None:
+        return None
+
+    _discard_prewarm_sets(_waiting_prewarm_sets(user).exclude(id=recommendation_set.id))
+    if recommendation_set.input_snapshot != profile_snapshot(user):
+        _discard_prewarm_sets(_waiting_prewarm_sets(user))
+        return None
+
+    recommendation_set.is_active = True
+    recommendation_set.prewarm_status = RecommendationSet.PrewarmStatus.PROMOTED
+    recommendation_set.save(update_fields=['is_active', 'prewarm_status'])
+    return recommendation_set
+
+
+def take_prewarmed_items(recommendation_set, mood) -> Optional[List[RecommendationItem]]:
+    """
+    Itens pré-gerados de um humor em um set promovido, entregues uma única vez: depois disso,
+    novas gerações para o humor seguem o fluxo normal. Se o job do humor ainda não terminou
+    (na fila ou rodando no worker), a pré-geração é abandonada na hora: o pedido não executa
+    o job nem espera por ele, e o worker descarta os itens que vier a gerar.
+    Retorna None quando não há pré-geração utilizável (a geração segue pelo fluxo normal).
+    """
+    if recommendation_set.prewarm_status != RecommendationSet.PrewarmStatus.PROMOTED:
+        return None
+
+    job = GenerationJob.objects.filter(
+        recommendation_set=recommendation_set, mood=mood, is_prewarm=True, consumed_at__isnull=True,
+    ).first()
+    if job is None:
+        return None
+
+    jobs = GenerationJob.objects.filter(id=job.id, consumed_at__isnull=True)
+    if job.status != GenerationJob.Status.DONE:
+        # Abandona a pré-geração, a não ser que ela tenha acabado de terminar
+        if jobs.exclude(status=GenerationJob.Status.DONE).update(consumed_at=timezone.now()):
+            GenerationJob.objects.filter(id=job.id, status=GenerationJob.Status.PENDING).update(
+                status=GenerationJob.Status.FAILED, error="Pré-geração abandonada.", finished_at=timezone.now()
+            )
+            return None
+    if not jobs.filter(status=GenerationJob.Status.DONE).update(consumed_at=timezone.now()):
+        # Outro pedido já levou os itens
+        return None
+    return list(job.items.select_related('mood')) or None
@@ -0,0 +1,40 @@
+# recommendations/signals.py
+
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from accounts.models import Question
+
+from .blacklist import invalidate_blacklist_filter
+from .http_cache import CATALOGS, bump_catalog_version
+from .models import BlacklistedMovie, Genre, Mood
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_genre_catalog(sender, **kwargs):
+    bump_catalog_version('genres')
+
+
+@receiver([post_save, post_delete], sender=Mood)
+def invalidate_mood_catalog(sender, **kwargs):
+    bump_catalog_version('moods')
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_catalog(sender, **kwargs):
+    bump_catalog_version('questions')
+
+
+@receiver([post_save, post_delete], sender=BlacklistedMovie)
+def invalidate_user_blacklist(sender, instance, **kwargs):
+    invalidate_blacklist_filter(instance.user_id)
+
+
+@receiver(post_migrate)
+def invalidate_catalogs_after_migrate(sender, **kwargs):
+    """
+    Migrações de dados (ex.: 0002_populate_initial_catalog) usam modelos históricos, que não
+    disparam os sinais acima: depois de um `migrate`, todos os catálogos são invalidados.
+    """
+    for name in CATALOGS:
+        bump_catalog_version(name)
@@ -1,3 +1,912 @@
-from django.test import TestCase
+# recommendations/tests.py
 
-# Create your tests here.
+import importlib
+import itertools
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from django.conf import settings as django_settings
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.db.models import F
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import Answer, Question
+from accounts.views import SCORE_FIELDS
+from integrations.circuit_breaker import CircuitOpenError
+from integrations.gemini.service import GeminiService
+from integrations.gemini.types import MoodRecommendations, Movie as GeminiMovie, Output
+from integrations.tmdb import TMDbService
+from recommendations import history
+from recommendations.blacklist import BlacklistFilter, _blacklist_version, _cache_key, get_blacklist_filter
+from recommendations.checks import check_shared_cache
+from recommendations.http_cache import catalog_version
+from recommendations import ranking, services, views
+from recommendations.catalog import normalize_title, resolve_movies
+from recommendations.services import GenerationError
+from recommendations.models import (
+    BlacklistedMovie, Genre, GenerationJob, Mood, Movie, ProfileGenre, RecommendationItem, RecommendationSet, ShownHistory,
+    SubMood,
+)
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(username="ana", password="senha-segura")
+
+
+@pytest.fixture
+def mood():
+    """
+    Humor criado pelo próprio teste: os testes com `transaction=True` apagam o catálogo
+    inicial (migração 0002) ao terminar.
+    """
+    mood, _ = Mood.objects.get_or_create(name="Teste")
+    SubMood.objects.get_or_create(mood=mood, name="Teste - Sub")
+    return mood
+
+
+@pytest.fixture
+def genre():
+    genre, _ = Genre.objects.get_or_create(name="Teste")
+    return genre
+
+
+def _create_question():
+    return Question.objects.create(
+        description="Gosto de filmes com finais abertos.",
+        attribute=Question.PersonalityAttribute.OPENNESS,
+        first_alternative="Discordo", first_alternative_value=-1,
+        second_alternative="Neutro", second_alternative_value=0,
+        third_alternative="Concordo", third_alternative_value=1,
+    )
+
+
+def _fake_generation(created):
+    """
+    `generate_batch_items` simulado: cria dois itens para o humor e os anota em `created`.
+    """
+    def generate(user, recommendation_set, moods):
+        items = RecommendationItem.objects.bulk_create([
+            RecommendationItem(recommendation_set=recommendation_set, mood=moods[0], external_id=str(rank),
+                               title=f"Filme {rank}", rank=rank)
+            for rank in (1, 2)
+        ])
+        created.append(items)
+        return items
+    return generate
+
+
+def _claim(job):
+    GenerationJob.objects.filter(pk=job.pk).update(status=GenerationJob.Status.RUNNING, attempts=F('attempts') + 1)
+    job.refresh_from_db()
+    return job
+
+
+@pytest.mark.django_db
+def test_question_change_bumps_catalog_version():
+    """
+    Alterar uma pergunta invalida a lista de perguntas em cache (sinal em `recommendations.signals`).
+    """
+    before = catalog_version('questions')
+    _create_question()
+    assert catalog_version('questions') != before
+
+
+@pytest.mark.django_db
+def test_blacklist_change_invalidates_cached_filter(user):
+    assert len(get_blacklist_filter(user)) == 0
+
+    # Leitura antiga gravada depois da invalidação (outro processo atrasado): não pode ser servida
+    stale_key = _cache_key(user.pk, _blacklist_version(user.pk))
+    BlacklistedMovie.objects.create(user=user, title="Titanic")
+    cache.set(stale_key, BlacklistFilter().to_cache())
+
+    assert get_blacklist_filter(user).blocks("titanic")
+
+
+@override_settings(DEBUG=False, CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_process_local_cache_warns_outside_debug():
+    assert [warning.id for warning in check_shared_cache(None)] == ["recommendations.W001"]
+
+
+@pytest.mark.django_db
+def test_requeued_job_does_not_duplicate_items(user, mood, monkeypatch):
+    created = []
+    monkeypatch.setattr(services, "generate_batch_items", _fake_generation(created))
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    job = GenerationJob.objects.create(user=user, recommendation_set=recommendation_set, mood=mood)
+
+    # Primeira tentativa gravou os itens, mas o worker morreu antes de concluir o job
+    _fake_generation([])(user, recommendation_set, [mood])
+    GenerationJob.objects.filter(pk=job.pk).update(attempts=1)
+
+    job = services.run_generation_job(_claim(job))
+    assert job.status == GenerationJob.Status.DONE
+    assert recommendation_set.items.count() == 2
+    assert set(job.items.all()) == set(created[0])
+
+
+@pytest.mark.django_db
+def test_stale_attempt_result_is_discarded(user, mood, monkeypatch):
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    job = _claim(GenerationJob.objects.create(user=user, recommendation_set=recommendation_set, mood=mood))
+
+    def generate_while_requeued(*args):
+        # Enquanto esta tentativa demora, o job volta à fila e outro worker o reserva
+        GenerationJob.objects.filter(pk=job.pk).update(attempts=F('attempts') + 1)
+        return _fake_generation([])(*args)
+
+    monkeypatch.setattr(services, "generate_batch_items", generate_while_requeued)
+    services.run_generation_job(job)
+    assert not recommendation_set.items.exists()
+    assert GenerationJob.objects.get(pk=job.pk).status == GenerationJob.Status.RUNNING
+
+
+def _promoted_set(user, mood):
+    recommendation_set = RecommendationSet.objects.create(user=user, prewarm_status=RecommendationSet.PrewarmStatus.PROMOTED)
+    job = GenerationJob.objects.create(user=user, recommendation_set=recommendation_set, mood=mood, is_prewarm=True)
+    return recommendation_set, job
+
+
+@pytest.mark.django_db
+def test_prewarmed_items_are_taken_once(user, mood, monkeypatch):
+    created = []
+    monkeypatch.setattr(services, "generate_batch_items", _fake_generation(created))
+    recommendation_set, job = _promoted_set(user, mood)
+    services.run_generation_job(_claim(job))
+
+    assert set(services.take_prewarmed_items(recommendation_set, mood)) == set(created[0])
+    assert services.take_prewarmed_items(recommendation_set, mood) is None
+    assert GenerationJob.objects.get(pk=job.pk).consumed_at is not None
+
+
+@pytest.mark.django_db
+def test_abandoned_prewarm_discards_worker_items(user, mood, monkeypatch):
+    monkeypatch.setattr(services, "generate_batch_items", _fake_generation([]))
+    recommendation_set, job = _promoted_set(user, mood)
+    job = _claim(job)  # rodando no worker
+
+    assert services.take_prewarmed_items(recommendation_set, mood) is None
+    services.run_generation_job(job)
+    assert not recommendation_set.items.exists()
+    assert GenerationJob.objects.get(pk=job.pk).status == GenerationJob.Status.DONE
+
+
+@pytest.mark.django_db
+def test_queued_prewarm_is_abandoned_without_running_inline(user, mood, monkeypatch):
+    created = []
+    monkeypatch.setattr(services, "generate_batch_items", _fake_generation(created))
+    recommendation_set, job = _promoted_set(user, mood)
+
+    assert services.take_prewarmed_items(recommendation_set, mood) is None
+    assert created == []
+    job.refresh_from_db()
+    assert job.status == GenerationJob.Status.FAILED
+    assert job.consumed_at is not None
+
+
+@pytest.mark.django_db
+def test_schedule_prewarm_keeps_sets_with_running_jobs(user, mood, genre, settings):
+    settings.PREWARM_RECOMMENDATIONS = True
+    Answer.objects.create(profile=user.profile, question=_create_question(), selected_value=1)
+    ProfileGenre.objects.create(profile=user.profile, genre=genre)
+
+    first = services.schedule_prewarm(user)
+    running = _claim(first.generation_jobs.get(mood=mood))
+    second = services.schedule_prewarm(user)
+
+    first.refresh_from_db()
+    assert first.prewarm_status == RecommendationSet.PrewarmStatus.DISCARDED
+    assert list(first.generation_jobs.all()) == [running]
+    assert second.prewarm_status == RecommendationSet.PrewarmStatus.READY
+
+    GenerationJob.objects.filter(pk=running.pk).update(status=GenerationJob.Status.DONE)
+    assert services.purge_discarded_prewarm_sets() > 0
+    assert not RecommendationSet.objects.filter(pk=first.pk).exists()
+
+
+@pytest.mark.django_db
+def test_claim_respects_prewarm_concurrency(user, mood, settings):
+    settings.PREWARM_MAX_CONCURRENCY = 1
+    recommendation_set = RecommendationSet.objects.create(user=user, is_active=False)
+    GenerationJob.objects.bulk_create([
+        GenerationJob(user=user, recommendation_set=recommendation_set, mood=mood, is_prewarm=True) for _ in range(2)
+    ])
+
+    assert services.claim_next_job() is not None
+    assert services.claim_next_job() is None
+
+
+@pytest.mark.django_db
+def test_requeued_job_waits_for_retry_after(user, mood, monkeypatch):
+    def overloaded(*args):
+        raise GenerationError("Sobrecarga.", 503, retry_after=30)
+
+    monkeypatch.setattr(services, "generate_batch_items", overloaded)
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    GenerationJob.objects.create(user=user, recommendation_set=recommendation_set, mood=mood)
+
+    job = services.run_generation_job(services.claim_next_job())
+    assert job.status == GenerationJob.Status.PENDING
+    assert services.claim_next_job() is None
+
+    GenerationJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+    assert services.claim_next_job() == job
+
+
+@pytest.mark.django_db(transaction=True)
+def test_history_writer_keeps_good_rows_when_one_fails(user, mood):
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    item = RecommendationItem.objects.create(recommendation_set=recommendation_set, mood=mood, external_id="1", title="Filme", rank=1)
+    missing = RecommendationItem(recommendation_set=recommendation_set, mood=mood, external_id="2", title="Apagado", rank=2)
+
+    batch = [
+        ShownHistory(user_id=user.pk, recommendation_item_id=entry.pk, external_id=entry.external_id, title=entry.title)
+        for entry in (item, missing, item)
+    ]
+    history.ShownHistoryWriter(batch_size=10, flush_interval=0).add(batch)
+    assert ShownHistory.objects.filter(user=user).count() == 2
+
+
+# --- PLANOS DE CONSULTA ---
+
+postgres_only = pytest.mark.skipif(connection.vendor != 'postgresql', reason="EXPLAIN e FOR UPDATE só no PostgreSQL")
+
+# Dados sintéticos (PostgreSQL): `%(rows)s` linhas por tabela, distribuídas entre `%(users)s` usuários.
+# Os FKs do Django são DEFERRABLE INITIALLY DEFERRED e o teste é desfeito no fim, então os
+# usuários, perfis e itens referenciados não precisam existir.
+#
+# Por padrão são 50 mil linhas por tabela, para o teste caber na suíte (segundos). Nesse volume
+# o planejador já prefere os índices a um Seq Scan, mas custos, estatísticas e a escolha entre
+# Index Scan e Bitmap Scan podem mudar com tabelas grandes: para conferir os planos no volume de
+# produção, rode com QUERY_PLAN_ROWS=10000000 (minutos e alguns GB no PostgreSQL).
+SEED_ROWS = int(os.getenv("QUERY_PLAN_ROWS", "50000"))
+ROWS_PER_USER = 10
+SEED_SQL = {
+    RecommendationSet: """
+        INSERT INTO {table} (id, user_id, created_at, is_active, input_snapshot, prewarm_status)
+        SELECT gen_random_uuid(), %(base_user)s + g %% %(users)s, now() - g * interval '1 second',
+               g < %(users)s, '{{}}'::jsonb, CASE WHEN g %% 7 = 0 THEN 'ready' ELSE '' END
+        FROM generate_series(0, %(rows)s - 1) AS g
+    """,
+    BlacklistedMovie: """
+        INSERT INTO {table} (id, user_id, external_id, title, reason, created_at)
+        SELECT gen_random_uuid(), %(base_user)s + g %% %(users)s, g::text, 'Filme ' || g, '', now()
+        FROM generate_series(0, %(rows)s - 1) AS g
+    """,
+    ShownHistory: """
+        INSERT INTO {table} (id, user_id, recommendation_item_id, external_id, title, mood_id, shown_at, context)
+        SELECT gen_random_uuid(), %(base_user)s + g %% %(users)s, gen_random_uuid(), g::text, 'Filme ' || g,
+               NULL, now() - g * interval '1 second', '{{}}'::jsonb
+        FROM generate_series(0, %(rows)s - 1) AS g
+    """,
+    ProfileGenre: """
+        INSERT INTO {table} (id, profile_id, genre_id, created_at)
+        SELECT gen_random_uuid(), md5('profile' || g %% %(users)s)::uuid, md5('genre' || g / %(users)s)::uuid, now()
+        FROM generate_series(0, %(rows)s - 1) AS g
+    """,
+}
+
+
+def hot_queries(user_id, profile_id):
+    """
+    As consultas por usuário dos caminhos mais usados, no formato em que a aplicação as executa.
+    """
+    return {
+        "active-set": RecommendationSet.objects.filter(user_id=user_id, is_active=True).reverse()[:1],
+        "prewarm-set": RecommendationSet.objects.filter(
+            user_id=user_id, is_active=False, prewarm_status=RecommendationSet.PrewarmStatus.READY
+        ).order_by('-created_at')[:1],
+        "blacklist": BlacklistedMovie.objects.filter(user_id=user_id).order_by('-created_at').values_list('title', flat=True),
+        "favorite-genres": ProfileGenre.objects.filter(profile_id=profile_id).values_list('genre__name', flat=True),
+        "shown-history": (
+            ShownHistory.objects
+            .filter(user_id=user_id, shown_at__gte=timezone.now() - timedelta(days=django_settings.SHOWN_HISTORY_DAYS))
+            .order_by('-shown_at').values_list('external_id', 'title')[:django_settings.SHOWN_HISTORY_LIMIT]
+        ),
+    }
+
+
+@pytest.fixture
+def seeded_tables(db):
+    """
+    Popula as tabelas com SEED_ROWS linhas sintéticas e retorna o usuário e o perfil das consultas.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM auth_user')
+        base_user = cursor.fetchone()[0]
+        params = {'rows': SEED_ROWS, 'users': SEED_ROWS // ROWS_PER_USER, 'base_user': base_user}
+        for model, sql in SEED_SQL.items():
+            cursor.execute(sql.format(table=model._meta.db_table), params)
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+        cursor.execute("SELECT md5('profile0')::uuid")
+        return base_user, cursor.fetchone()[0]
+
+
+@postgres_only
+@pytest.mark.parametrize("name", ["active-set", "prewarm-set", "blacklist", "favorite-genres", "shown-history"])
+def test_hot_query_uses_index(seeded_tables, name):
+    queryset = hot_queries(*seeded_tables)[name]
+    plan = queryset.explain()
+    assert f"Seq Scan on {queryset.model._meta.db_table}" not in plan, plan
+
+
+@postgres_only
+def test_active_set_query_uses_partial_unique_index(seeded_tables):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, RecommendationSet._meta.db_table)
+    assert constraints['unique_active_set_per_user']['unique']
+    assert 'unique_active_set_per_user' in hot_queries(*seeded_tables)["active-set"].explain()
+
+
+@pytest.mark.django_db
+def test_second_active_set_violates_unique_constraint(user):
+    RecommendationSet.objects.create(user=user, is_active=True)
+    RecommendationSet.objects.create(user=user, is_active=False)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        RecommendationSet.objects.create(user=user, is_active=True)
+
+
+@pytest.mark.django_db
+def test_create_set_replaces_active_set(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    first = client.post(reverse('create-recommendation-set'))
+    with CaptureQueriesContext(connection) as queries:
+        second = client.post(reverse('create-recommendation-set'))
+
+    assert first.status_code == second.status_code == 201
+    active = RecommendationSet.objects.filter(user=user, is_active=True)
+    assert [str(recommendation_set.id) for recommendation_set in active] == [second.data['id']]
+    if connection.vendor == 'postgresql':
+        # O usuário é travado antes de desativar o set anterior (criações simultâneas em série)
+        user_table = user._meta.db_table
+        assert any(user_table in query['sql'] and 'FOR UPDATE' in query['sql'] for query in queries.captured_queries)
+
+
+@postgres_only
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_set_creation_keeps_one_active_set(user):
+    def create(_):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            return client.post(reverse('create-recommendation-set')).status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        statuses = list(executor.map(create, range(8)))
+
+    assert statuses == [201] * 8
+    assert RecommendationSet.objects.filter(user=user, is_active=True).count() == 1
+
+
+# --- ORÇAMENTO DE CONSULTAS ---
+
+# Máximo de consultas SQL por endpoint (sem contar a autenticação, incluindo os savepoints dos
+# blocos atômicos). Os valores não dependem da quantidade de itens, humores ou gêneros: um N+1
+# novo estoura o orçamento. A exceção é o streaming, que salva cada item assim que ele chega. Os endpoints
+# que entregam itens incluem a leitura do histórico recente e a gravação de `ShownHistory`.
+QUERY_BUDGETS = {
+    'genre-list': 1,
+    'mood-list': 1,
+    'question-list': 1,
+    'submit-answers': 6,
+    'check-answers': 1,
+    'check-favorite-genres': 1,
+    'set-favorite-genres': 7,
+    'create-recommendation-set': 7,
+    'generate-mood-recommendations': 10,
+    'generate-batch-recommendations': 10,
+    'generate-mood-recommendations-stream': 15,
+    'create-generation-job': 5,
+    'generation-job-detail': 4,
+    'active-recommendation-set': 2,
+}
+
+_fake_titles = itertools.count(1)
+
+
+def _fake_movies(mood_name):
+    # Títulos sempre novos: filmes repetidos seriam descartados pelo histórico de exibição
+    return [
+        GeminiMovie(
+            rank=rank, title=f"{mood_name} {next(_fake_titles)}", year=2000 + rank, synopsis="Sinopse.",
+            reason_for_recommendation="Motivo.", tags=["Drama"],
+        )
+        for rank in (1, 2, 3)
+    ]
+
+
+def _fake_recommendations(self, user_data, blocks=None):
+    moods = user_data.target_moods or [user_data.target_mood]
+    return Output(recommendations=[MoodRecommendations(mood=name, movies=_fake_movies(name)) for name in moods])
+
+
+def _fake_stream(self, user_data, blocks=None):
+    for movie in _fake_movies(user_data.target_mood):
+        yield user_data.target_mood, movie
+
+
+def _fake_tmdb_movie(self, title, year):
+    return {'id': hash((title, year)) % 100000, 'poster_path': '/poster.jpg', 'genre_ids': [18]}
+
+
+@pytest.fixture
+def budget_env(settings, monkeypatch):
+    """
+    Gemini e TMDb simulados, cache local (as consultas do cache em banco não entram no orçamento)
+    e histórico gravado na própria requisição, para entrar na contagem.
+    """
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    monkeypatch.setenv('TMDB_API_KEY', 'test')
+    monkeypatch.setattr(GeminiService, 'get_recommendations', _fake_recommendations)
+    monkeypatch.setattr(GeminiService, 'stream_recommendations', _fake_stream)
+    monkeypatch.setattr(TMDbService, 'get_movie', _fake_tmdb_movie)
+    monkeypatch.setattr(history, '_shown_history_writer', history.ShownHistoryWriter(1, 0))
+    monkeypatch.setattr(history, '_recent_history_cache', history.RecentHistoryCache(1, 3600))
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "query-budgets"}}
+    settings.LOCAL_RANKING_MODE = 'off'
+    settings.PREWARM_RECOMMENDATIONS = False
+
+
+@pytest.mark.django_db
+def test_endpoints_stay_within_query_budgets(user, budget_env):
+    """
+    Chama os endpoints na ordem de uso do app e compara as consultas de cada um com QUERY_BUDGETS.
+    """
+    genres = [Genre.objects.get_or_create(name=name)[0] for name in ('Drama', 'Comédia', 'Terror')]
+    moods = list(Mood.objects.all()[:3])
+    moods += [Mood.objects.create(name=f'Humor de teste {index}') for index in range(3 - len(moods))]
+    questions = Question.objects.bulk_create([
+        Question(
+            description=f'Questão de teste {index}', attribute=attribute,
+            first_alternative='Sim', first_alternative_value=1,
+            second_alternative='Não', second_alternative_value=-1,
+            third_alternative='Talvez', third_alternative_value=0,
+        )
+        for index, attribute in enumerate(SCORE_FIELDS * 2)
+    ])
+    over_budget = {}
+
+    def call(name, method, kwargs=None, data=None):
+        client = APIClient()
+        # Usuário novo a cada chamada, para que o cache do perfil não esconda consultas
+        client.force_authenticate(type(user).objects.get(pk=user.pk))
+        history.get_recent_history_cache().clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(reverse(name, kwargs=kwargs), data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        assert response.status_code < 400, (name, response.content[:500])
+        if len(context) > QUERY_BUDGETS[name]:
+            over_budget[name] = [query['sql'] for query in context.captured_queries]
+        return response
+
+    call('genre-list', 'get')
+    call('mood-list', 'get')
+    call('question-list', 'get')
+    call('submit-answers', 'post', data={
+        'answers': [{'question_id': str(question.id), 'selected_value': 1} for question in questions]
+    })
+    call('check-answers', 'get')
+    call('set-favorite-genres', 'post', data={'genre_ids': [str(genre.id) for genre in genres]})
+    call('check-favorite-genres', 'get')
+    call('create-recommendation-set', 'post')
+
+    set_id = RecommendationSet.objects.get(user=user, is_active=True).id
+    call('generate-mood-recommendations', 'post', {'set_id': set_id}, {'mood_id': str(moods[0].id)})
+    call('generate-batch-recommendations', 'post', {'set_id': set_id}, {'mood_ids': [str(mood.id) for mood in moods]})
+    call('generate-mood-recommendations-stream', 'post', {'set_id': set_id}, {'mood_id': str(moods[-1].id)})
+
+    response = call('create-generation-job', 'post', {'set_id': set_id}, {'mood_id': str(moods[0].id)})
+    # O job é processado aqui mesmo (sem passar pela fila), para que o detalhe traga os itens
+    job = services.run_generation_job(_claim(GenerationJob.objects.get(id=response.data['id'])))
+    assert job.status == GenerationJob.Status.DONE
+
+    call('generation-job-detail', 'get', {'job_id': job.id})
+    call('active-recommendation-set', 'get')
+
+    assert over_budget == {}
+
+
+# --- VIEWS ---
+
+def _events_of(generator):
+    return [chunk.split("\n")[0].removeprefix("event: ") for chunk in generator]
+
+
+@pytest.mark.django_db
+def test_stream_events_report_items_errors_and_done(user, mood, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(views, 'record_shown', lambda user, items, source: recorded.append(list(items)))
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    items = RecommendationItem.objects.bulk_create([
+        RecommendationItem(recommendation_set=recommendation_set, mood=mood, external_id=str(rank), title=f"Filme {rank}", rank=rank)
+        for rank in (1, 2)
+    ])
+
+    def failing():
+        yield items[0]
+        raise GenerationError("O Gemini falhou.", 502)
+
+    view = views.StreamMoodRecommendationsView()
+    assert _events_of(view._events(user, iter(items))) == ["item", "item", "done"]
+    assert _events_of(view._events(user, failing())) == ["item", "error"]
+    assert recorded == [items, items[:1]]
+
+
+@pytest.mark.django_db
+def test_stream_records_items_sent_before_disconnect(user, mood, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(views, 'record_shown', lambda user, items, source: recorded.append(list(items)))
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    items = RecommendationItem.objects.bulk_create([
+        RecommendationItem(recommendation_set=recommendation_set, mood=mood, external_id=str(rank), title=f"Filme {rank}", rank=rank)
+        for rank in (1, 2, 3)
+    ])
+
+    events = views.StreamMoodRecommendationsView()._events(user, iter(items))
+    next(events)
+    # O cliente desconectou: o servidor fecha o gerador da resposta
+    events.close()
+    assert recorded == [items[:1]]
+
+
+@pytest.mark.django_db
+def test_batch_generation_deduplicates_mood_ids(user, mood, api_client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(views, 'record_shown', lambda user, items, source: None)
+    monkeypatch.setattr(views, 'generate_batch_items', lambda user, recommendation_set, moods: calls.append(moods) or [])
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    other = Mood.objects.get_or_create(name="Outro")[0]
+
+    response = api_client.post(
+        reverse('generate-batch-recommendations', kwargs={'set_id': recommendation_set.id}),
+        {'mood_ids': [mood.id, other.id, mood.id]}, format='json',
+    )
+    assert response.status_code == 201
+    assert calls == [[mood, other]]
+
+
+@pytest.mark.django_db
+def test_batch_generation_rejects_unknown_mood_ids(user, mood, api_client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(views, 'generate_batch_items', lambda *args: calls.append(args) or [])
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    unknown = str(uuid.uuid4())
+
+    response = api_client.post(
+        reverse('generate-batch-recommendations', kwargs={'set_id': recommendation_set.id}),
+        {'mood_ids': [str(mood.id), unknown, unknown]}, format='json',
+    )
+    assert response.status_code == 404
+    assert calls == []
+
+
+def _async_generate(recommendation_set, mood, body=None, token=None):
+    client = Client()
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+    if body is None:
+        body = json.dumps({'mood_id': str(mood.id)})
+    return client.post(
+        reverse('generate-mood-recommendations-async', kwargs={'set_id': recommendation_set.id}),
+        body, content_type='application/json', **headers,
+    )
+
+
+@pytest.mark.django_db
+def test_async_generation_requires_valid_token(user, mood, monkeypatch):
+    monkeypatch.setattr(views, 'agenerate_mood_items', pytest.fail)
+    recommendation_set = RecommendationSet.objects.create(user=user)
+
+    assert _async_generate(recommendation_set, mood).status_code == 401
+    assert _async_generate(recommendation_set, mood, token="invalido").status_code == 401
+
+
+@pytest.mark.django_db
+def test_async_generation_validates_body_and_lookups(user, mood, monkeypatch):
+    monkeypatch.setattr(views, 'record_shown', lambda user, items, source: None)
+
+    async def generate(user, recommendation_set, mood):
+        return []
+    monkeypatch.setattr(views, 'agenerate_mood_items', generate)
+    token = str(RefreshToken.for_user(user).access_token)
+    recommendation_set = RecommendationSet.objects.create(user=user)
+
+    assert _async_generate(recommendation_set, mood, body="{", token=token).status_code == 400
+    assert _async_generate(recommendation_set, mood, body="{}", token=token).status_code == 400
+
+    unknown_mood = Mood(id=uuid.uuid4())
+    assert _async_generate(recommendation_set, unknown_mood, token=token).status_code == 404
+    other_set = RecommendationSet.objects.create(user=User.objects.create_user(username="bia"))
+    assert _async_generate(other_set, mood, token=token).status_code == 404
+
+    assert _async_generate(recommendation_set, mood, token=token).status_code == 201
+
+
+# --- RESERVA COM O GEMINI FORA DO AR ---
+
+def _past_items(user, mood, titles):
+    """
+    Set anterior (inativo) do usuário com um item por título.
+    """
+    previous = RecommendationSet.objects.create(user=user, is_active=False)
+    return RecommendationItem.objects.bulk_create([
+        RecommendationItem(recommendation_set=previous, mood=mood, external_id=str(rank), title=title, rank=rank)
+        for rank, title in enumerate(titles, start=1)
+    ])
+
+
+@pytest.mark.django_db
+def test_fallback_reuses_history_without_blacklisted_titles(user, mood):
+    _past_items(user, mood, ["Antigo 1", "Bloqueado", "Antigo 2", "Antigo 1", "Antigo 3", "Antigo 4"])
+    BlacklistedMovie.objects.create(user=user, external_id="2", title="Bloqueado")
+    recommendation_set = RecommendationSet.objects.create(user=user)
+
+    items = services.fallback_items(user, recommendation_set, [mood])
+
+    assert [(item.title, item.rank) for item in items] == [("Antigo 1", 1), ("Antigo 2", 2), ("Antigo 3", 3)]
+    assert recommendation_set.items.count() == 3
+
+
+@pytest.mark.django_db
+def test_fallback_without_history_or_catalog_is_unavailable(user, mood):
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    with pytest.raises(GenerationError) as error:
+        services.fallback_items(user, recommendation_set, [mood], retry_after=12)
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "12"
+
+
+@pytest.mark.django_db
+def test_generation_serves_fallback_while_gemini_circuit_is_open(user, mood, genre, budget_env, monkeypatch):
+    def circuit_open(self, user_data, blocks=None):
+        raise CircuitOpenError("gemini", 30)
+
+    monkeypatch.setattr(GeminiService, 'get_recommendations', circuit_open)
+    ProfileGenre.objects.create(profile=user.profile, genre=genre)
+    _past_items(user, mood, ["Antigo 1", "Antigo 2", "Antigo 3"])
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    client = APIClient()
+    client.force_authenticate(user)
+
+    response = client.post(
+        reverse('generate-mood-recommendations', kwargs={'set_id': recommendation_set.id}),
+        {'mood_id': str(mood.id)}, format='json',
+    )
+
+    assert response.status_code == 201, response.content
+    assert [item['title'] for item in response.data] == ["Antigo 1", "Antigo 2", "Antigo 3"]
+
+
+# --- CACHE HTTP ---
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def catalog_cache(settings):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "http-cache"}}
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_catalog_repeat_get_is_not_modified(api_client, catalog_cache):
+    first = api_client.get(reverse('genre-list'))
+    assert first.status_code == 200
+
+    by_etag = api_client.get(reverse('genre-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+    by_date = api_client.get(reverse('genre-list'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+    assert by_etag.status_code == by_date.status_code == 304
+    assert by_etag['ETag'] == first['ETag']
+
+
+@pytest.mark.django_db
+def test_catalog_change_invalidates_cached_body(api_client, catalog_cache):
+    first = api_client.get(reverse('genre-list'))
+    Genre.objects.create(name="Gênero novo")
+
+    second = api_client.get(reverse('genre-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+    assert second.status_code == 200
+    assert second['ETag'] != first['ETag']
+    assert "Gênero novo" in [genre['name'] for genre in second.json()]
+
+
+@pytest.mark.django_db
+def test_active_set_repeat_get_is_not_modified(user, mood, api_client):
+    recommendation_set = RecommendationSet.objects.create(user=user)
+    first = api_client.get(reverse('active-recommendation-set'))
+    assert first.status_code == 200
+    assert api_client.get(reverse('active-recommendation-set'), HTTP_IF_NONE_MATCH=first['ETag']).status_code == 304
+    assert api_client.get(reverse('active-recommendation-set'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code == 304
+
+    RecommendationItem.objects.create(recommendation_set=recommendation_set, mood=mood, external_id="1", title="Novo", rank=1)
+    changed = api_client.get(reverse('active-recommendation-set'), HTTP_IF_NONE_MATCH=first['ETag'])
+    assert changed.status_code == 200
+    assert [item['title'] for item in changed.json()['items']] == ["Novo"]
+
+
+# --- CATÁLOGO DE FILMES ---
+
+class _CountingTMDb:
+    """
+    TMDb simulado: encontra "Achado", não encontra "Inexistente" e falha nos demais títulos.
+    """
+    def __init__(self):
+        self.searched = []
+
+    def get_movie(self, title, year):
+        self.searched.append(title)
+        if title == "Achado":
+            return {'id': 1, 'poster_path': '/achado.jpg'}
+        if title == "Inexistente":
+            return {}
+        return None
+
+
+def _gemini_movies(*titles):
+    return [
+        GeminiMovie(rank=rank, title=title, year=2000, synopsis="Sinopse.", reason_for_recommendation="Motivo.", tags=[])
+        for rank, title in enumerate(titles, start=1)
+    ]
+
+
+@pytest.mark.django_db
+def test_catalog_stores_not_found_movies_but_not_failed_searches():
+    tmdb, movies = _CountingTMDb(), _gemini_movies("Achado", "Inexistente", "Falhou")
+
+    found, not_found, failed = resolve_movies(tmdb, movies)
+    assert found.tmdb_id == 1 and not_found is None and failed is None
+    assert Movie.objects.get(normalized_title="inexistente").tmdb_id is None
+    assert not Movie.objects.filter(normalized_title="falhou").exists()
+
+    # Só a busca que falhou é refeita
+    tmdb.searched.clear()
+    resolve_movies(tmdb, movies)
+    assert tmdb.searched == ["Falhou"]
+
+
+@pytest.mark.django_db
+def test_catalog_searches_not_found_movies_again_sooner(settings):
+    settings.TMDB_CATALOG_NOT_FOUND_REFRESH_DAYS, settings.TMDB_CATALOG_REFRESH_DAYS = 1, 30
+    tmdb, movies = _CountingTMDb(), _gemini_movies("Achado", "Inexistente")
+    resolve_movies(tmdb, movies)
+    Movie.objects.update(fetched_at=timezone.now() - timedelta(days=2))
+
+    tmdb.searched.clear()
+    resolve_movies(tmdb, movies)
+    assert tmdb.searched == ["Inexistente"]
+
+
+# --- RANQUEAMENTO LOCAL ---
+
+COMEDY, DRAMA, HORROR = 35, 18, 27
+_tmdb_ids = itertools.count(1)
+
+
+def _catalog_movie(title, genre_ids, vote_average=7.0):
+    return Movie.objects.create(
+        normalized_title=normalize_title(title), year=2000, title=title, tmdb_id=next(_tmdb_ids),
+        tmdb_metadata={'genre_ids': genre_ids, 'vote_average': vote_average, 'vote_count': 1000},
+        fetched_at=timezone.now(),
+    )
+
+
+@pytest.fixture
+def catalog(db, monkeypatch):
+    """
+    Catálogo pequeno: duas comédias, um drama e um terror. O índice em memória começa vazio.
+    """
+    monkeypatch.setattr(ranking, '_index', None)
+    return {
+        'comedy': _catalog_movie("Comédia Boa", [COMEDY], 8.0),
+        'comedy2': _catalog_movie("Comédia Ok", [COMEDY], 6.0),
+        'drama': _catalog_movie("Drama", [DRAMA]),
+        'horror': _catalog_movie("Terror", [HORROR]),
+    }
+
+
+def _titles(candidates):
+    return [candidate.movie.title for candidate in candidates]
+
+
+def test_ranking_orders_by_mood_and_masks_blacklist(user, catalog):
+    joy = Mood.objects.get_or_create(name="Alegria")[0]
+    fear = Mood.objects.get_or_create(name="Medo/Tensão")[0]
+
+    ranked = ranking.rank_candidates(user.profile, [], [], [joy, fear], k=1)
+    assert _titles(ranked[joy]) == ["Comédia Boa"]
+    assert _titles(ranked[fear]) == ["Terror"]
+
+    ranked = ranking.rank_candidates(user.profile, [], ["comedia boa"], [joy], k=1, exclude_titles=["Comédia Ok"])
+    assert "Comédia" not in " ".join(_titles(ranked[joy]))
+
+
+def test_ranking_does_not_repeat_movies_and_caps_top_k(user, catalog):
+    joy = Mood.objects.get_or_create(name="Alegria")[0]
+    relax = Mood.objects.get_or_create(name="Relaxamento")[0]
+
+    ranked = ranking.rank_candidates(user.profile, ["Comédia"], [], [joy, relax], k=3)
+    assert len(ranked[joy]) == 3
+    # Só sobra um filme para o segundo humor, menos que `k`
+    assert len(ranked[relax]) == 1
+    assert not set(_titles(ranked[joy])) & set(_titles(ranked[relax]))
+
+
+def test_most_relevant_titles_puts_unknown_titles_last(user, catalog):
+    joy = Mood.objects.get_or_create(name="Alegria")[0]
+    titles = ["desconhecido", "terror", "comedia boa"]
+    assert ranking.most_relevant_titles(user.profile, [], [joy], titles, limit=3) == ["comedia boa", "terror", "desconhecido"]
+    assert ranking.most_relevant_titles(user.profile, [], [joy], titles, limit=1) == ["comedia boa"]
+
+
+def test_catalog_index_rebuilds_when_catalog_changes(catalog):
+    index = ranking.get_catalog_index()
+    assert len(index) == 4
+    assert ranking.get_catalog_index() is index
+
+    _catalog_movie("Sem gênero conhecido", [])
+    _catalog_movie("Outro Drama", [DRAMA])
+    rebuilt = ranking.get_catalog_index()
+    assert rebuilt is not index
+    # Filmes sem gênero conhecido ficam fora da matriz
+    assert len(rebuilt) == 5
+    assert rebuilt.genres.shape == (5, len(ranking.GENRE_NAMES))
+
+
+# --- MIGRAÇÕES ---
+
+json_metadata_migration = importlib.import_module('recommendations.migrations.0007_jsonfield_metadata')
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('', {}),
+    ('   ', {}),
+    (None, {}),
+    ('{"genre_ids": [18]}', {'genre_ids': [18]}),
+    ('[1, 2]', [1, 2]),
+    ('não é json', {'raw': 'não é json'}),
+])
+def test_json_text_is_normalized_before_jsonb_conversion(value, expected):
+    assert json.loads(json_metadata_migration._normalize(value)) == expected
+
+
+@postgres_only
+@pytest.mark.django_db(transaction=True)
+def test_json_metadata_migration_converts_existing_text():
+    before, after = [('recommendations', '0006_prewarm')], [('recommendations', '0007_jsonfield_metadata')]
+    executor = MigrationExecutor(connection)
+    executor.migrate(before)
+    OldMovie = executor.loader.project_state(before).apps.get_model('recommendations', 'Movie')
+    for year, metadata in enumerate(['', 'não é json', '{"genre_ids": [18]}']):
+        OldMovie.objects.create(normalized_title="filme", year=year, title="Filme", tmdb_metadata=metadata, fetched_at=timezone.now())
+
+    try:
+        executor = MigrationExecutor(connection)
+        executor.migrate(after)
+        NewMovie = executor.loader.project_state(after).apps.get_model('recommendations', 'Movie')
+        assert list(NewMovie.objects.order_by('year').values_list('tmdb_metadata', flat=True)) == [
+            {}, {'raw': 'não é json'}, {'genre_ids': [18]},
+        ]
+    finally:
+        # Volta ao estado mais recente para os demais testes
+        MigrationExecutor(connection).migrate(executor.loader.graph.leaf_nodes())
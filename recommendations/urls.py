@@ -8,6 +8,11 @@ from .views import (
     # --- NOVAS VIEWS ---
     CreateRecommendationSetView,
     GenerateMoodRecommendationsView,
+    AsyncGenerateMoodRecommendationsView,
+    StreamMoodRecommendationsView,
+    GenerateBatchRecommendationsView,
+    CreateGenerationJobView,
+    GenerationJobDetailView,
     CheckFavoriteGenresView,
     MoodListView,
 )
@@ -29,4 +34,17 @@ urlpatterns = [
 
     # 2. Gera 3 filmes para um humor específico e os adiciona a um set existente
     path('sets/<uuid:set_id>/generate-for-mood/', GenerateMoodRecommendationsView.as_view(), name='generate-mood-recommendations'),
+
+    # 2b. Mesma geração, em versão assíncrona (para deploy via ASGI)
+    path('sets/<uuid:set_id>/generate-for-mood/async/', AsyncGenerateMoodRecommendationsView.as_view(), name='generate-mood-recommendations-async'),
+
+    # 2c. Mesma geração, com os itens enviados um a um via Server-Sent Events
+    path('sets/<uuid:set_id>/generate-for-mood/stream/', StreamMoodRecommendationsView.as_view(), name='generate-mood-recommendations-stream'),
+
+    # 2d. Mesma geração, em segundo plano: retorna 202 com o job, que pode ser consultado depois
+    path('sets/<uuid:set_id>/generation-jobs/', CreateGenerationJobView.as_view(), name='create-generation-job'),
+    path('generation-jobs/<uuid:job_id>/', GenerationJobDetailView.as_view(), name='generation-job-detail'),
+
+    # 3. Gera recomendações para vários humores de uma vez (uma única chamada à IA)
+    path('sets/<uuid:set_id>/generate-batch/', GenerateBatchRecommendationsView.as_view(), name='generate-batch-recommendations'),
 ]
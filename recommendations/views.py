@@ -1,51 +1,101 @@
 # recommendations/views.py
 
 import json
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from drf_spectacular.utils import extend_schema
-from rest_framework import generics, permissions, status, views
+from rest_framework import exceptions, generics, permissions, status, views
 from rest_framework.response import Response
 # --- IMPORTAÇÃO ADICIONADA ---
 from rest_framework.views import APIView
-from concurrent.futures import ThreadPoolExecutor
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .serializers import SetFavoriteGenresSerializer, GenerateMoodRecommendationsSerializer, RecommendationItemSerializer, MoodSerializer
+from integrations.metrics import span
+
+from .serializers import SetFavoriteGenresSerializer, GenerateMoodRecommendationsSerializer, GenerateBatchRecommendationsSerializer, RecommendationItemSerializer, MoodSerializer, GenerationJobSerializer
 
 # Modelos
 from .models import (
-    Genre, RecommendationSet, ProfileGenre, Mood, RecommendationItem, BlacklistedMovie
+    Genre, RecommendationSet, ProfileGenre, Mood, RecommendationItem, BlacklistedMovie, GenerationJob
 )
 # Serializers
 from .serializers import (
     GenreSerializer, RecommendationSetSerializer, ProfileGenreSerializer
 )
-# Integrações
-from integrations.gemini.service import GeminiService
-from integrations.gemini.types import Input as GeminiInput, BlacklistedMovieInput
-from integrations.tmdb import TMDbService
+from .history import record_shown
+from .http_cache import CachedCatalogMixin, conditional_response, content_etag
+from .services import (
+    GenerationError, generate_mood_items, agenerate_mood_items, generate_batch_items, stream_mood_items,
+    schedule_prewarm, promote_prewarmed_set,
+)
 
+logger = logging.getLogger(__name__)
 
-class GenreListView(generics.ListAPIView):
+
+class GenreListView(CachedCatalogMixin, generics.ListAPIView):
+    catalog_name = 'genres'
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class MoodListView(generics.ListAPIView):
+class MoodListView(CachedCatalogMixin, generics.ListAPIView):
     """
     Endpoint para listar todos os moods (humores) disponíveis.
     """
+    catalog_name = 'moods'
     queryset = Mood.objects.all()
     serializer_class = MoodSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
+def items_with_mood() -> Prefetch:
+    """
+    Itens (de um set ou job) já com o humor, que `RecommendationItemSerializer` aninha em cada item.
+    """
+    return Prefetch('items', queryset=RecommendationItem.objects.select_related('mood'))
+
+
 class ActiveRecommendationSetView(generics.RetrieveAPIView):
     serializer_class = RecommendationSetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return RecommendationSet.objects.prefetch_related('items').filter(user=self.request.user, is_active=True).last()
+        return RecommendationSet.objects.prefetch_related(items_with_mood()).filter(user=self.request.user, is_active=True).last()
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        GET condicional: o ETag e o Last-Modified vêm do set e da última mudança nos seus
+        itens, consultados sem carregá-los; se o cliente já tem essa versão, responde 304.
+        """
+        recommendation_set = (
+            RecommendationSet.objects.filter(user=request.user, is_active=True)
+            .annotate(item_count=Count('items'), items_changed_at=Max('items__created_at'))
+            .last()
+        )
+        if recommendation_set is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        last_modified = recommendation_set.items_changed_at or recommendation_set.created_at
+        etag = content_etag([str(recommendation_set.id), recommendation_set.item_count, last_modified.isoformat()])
+
+        def build():
+            prefetch_related_objects([recommendation_set], items_with_mood())
+            return Response(self.get_serializer(recommendation_set).data)
+
+        response = conditional_response(request, etag, last_modified, build, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
 
 
 class SetFavoriteGenresView(views.APIView):
@@ -72,9 +122,15 @@ class SetFavoriteGenresView(views.APIView):
                 ]
                 ProfileGenre.objects.bulk_create(profile_genres_to_create)
         except Exception as e:
-            print(f"Erro ao salvar gêneros favoritos: {e}")
+            logger.exception("Erro ao salvar gêneros favoritos: %s", e)
             return Response({"error": "Ocorreu um erro ao salvar suas preferências."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        try:
+            schedule_prewarm(request.user)
+        except Exception as e:
+            # A pré-geração é só uma otimização: a falha não afeta a resposta
+            logger.warning("Erro ao agendar a pré-geração de recomendações: %s", e)
+
         response_serializer = ProfileGenreSerializer(ProfileGenre.objects.filter(profile=profile), many=True)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -89,7 +145,7 @@ class CheckFavoriteGenresView(APIView):
         Retorna `{"has_genres": true}` se o usuário tiver gêneros cadastrados,
         e `{"has_genres": false}` caso contrário.
         """
-        has_genres = ProfileGenre.objects.filter(profile=request.user.profile).exists()
+        has_genres = ProfileGenre.objects.filter(profile__user=request.user).exists()
         return Response({"has_genres": has_genres}, status=status.HTTP_200_OK)
         
 class CreateRecommendationSetView(generics.CreateAPIView):
@@ -98,8 +154,17 @@ class CreateRecommendationSetView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         user = self.request.user
-        RecommendationSet.objects.filter(user=user, is_active=True).update(is_active=False)
-        serializer.save(user=user, is_active=True)
+        with transaction.atomic():
+            # Serializa criações simultâneas do mesmo usuário (só pode haver um set ativo por usuário)
+            User.objects.select_for_update().get(pk=user.pk)
+            RecommendationSet.objects.filter(user=user, is_active=True).update(is_active=False)
+            # Se houver um set pré-gerado para o perfil atual, ele é promovido no lugar de um set vazio
+            prewarmed_set = promote_prewarmed_set(user)
+            if prewarmed_set is not None:
+                prefetch_related_objects([prewarmed_set], items_with_mood())
+                serializer.instance = prewarmed_set
+            else:
+                serializer.save(user=user, is_active=True)
 
 
 class GenerateMoodRecommendationsView(views.APIView):
@@ -119,84 +184,244 @@ class GenerateMoodRecommendationsView(views.APIView):
         mood_id = serializer.validated_data['mood_id']
         user = request.user
 
+        try:
+            with span("lookup"):
+                recommendation_set = RecommendationSet.objects.get(id=set_id, user=user, is_active=True)
+                mood = Mood.objects.get(id=mood_id)
+        except RecommendationSet.DoesNotExist:
+            return Response({"error": "Conjunto de recomendações inválido ou inativo."}, status=status.HTTP_404_NOT_FOUND)
+        except Mood.DoesNotExist:
+            return Response({"error": "Mood inválido."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            created_items = generate_mood_items(user, recommendation_set, mood)
+        except GenerationError as e:
+            return Response({"error": e.message}, status=e.status_code, headers=e.headers)
+
+        with span("history"):
+            record_shown(user, created_items, source='generate')
+
+        response_serializer = RecommendationItemSerializer(created_items, many=True)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+class StreamMoodRecommendationsView(views.APIView):
+    """
+    Mesma geração de `GenerateMoodRecommendationsView`, mas entregue via Server-Sent Events:
+    cada item é enviado (evento `item`) assim que o filme é recebido do Gemini e salvo,
+    seguido de um evento `done` com o total, ou `error` se a geração falhar no meio.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @staticmethod
+    def _event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def _events(self, user, items):
+        streamed = []
+        try:
+            for item in items:
+                streamed.append(item)
+                yield self._event("item", RecommendationItemSerializer(item).data)
+        except GenerationError as e:
+            yield self._event("error", {"error": e.message})
+            return
+        finally:
+            # Inclusive os itens entregues antes de um erro ou de o cliente desconectar
+            record_shown(user, streamed, source='stream')
+        yield self._event("done", {"count": len(streamed)})
+
+    @extend_schema(
+        request=GenerateMoodRecommendationsSerializer,
+        responses={(200, 'text/event-stream'): str},
+        description="Gera recomendações para o humor fornecido e as envia por Server-Sent Events, uma a uma."
+    )
+    def post(self, request, set_id, *args, **kwargs):
+        serializer = GenerateMoodRecommendationsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            recommendation_set = RecommendationSet.objects.get(id=set_id, user=request.user, is_active=True)
+            mood = Mood.objects.get(id=serializer.validated_data['mood_id'])
+        except RecommendationSet.DoesNotExist:
+            return Response({"error": "Conjunto de recomendações inválido ou inativo."}, status=status.HTTP_404_NOT_FOUND)
+        except Mood.DoesNotExist:
+            return Response({"error": "Mood inválido."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            items = stream_mood_items(request.user, recommendation_set, mood)
+        except GenerationError as e:
+            return Response({"error": e.message}, status=e.status_code, headers=e.headers)
+
+        response = StreamingHttpResponse(self._events(request.user, items), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Impede que proxies (ex.: nginx) acumulem a resposta antes de repassá-la
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class GenerateBatchRecommendationsView(views.APIView):
+    """
+    Gera as recomendações de vários humores de uma vez: uma única chamada ao Gemini,
+    uma única passada de pôsteres no TMDb e um único `bulk_create`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        request=GenerateBatchRecommendationsSerializer,
+        responses={201: RecommendationItemSerializer(many=True)},
+        description="Gera 3 recomendações para cada humor fornecido e as anexa ao set de recomendação especificado."
+    )
+    def post(self, request, set_id, *args, **kwargs):
+        serializer = GenerateBatchRecommendationsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Remove IDs repetidos mantendo a ordem enviada
+        mood_ids = list(dict.fromkeys(serializer.validated_data['mood_ids']))
+        user = request.user
+
+        try:
+            recommendation_set = RecommendationSet.objects.get(id=set_id, user=user, is_active=True)
+        except RecommendationSet.DoesNotExist:
+            return Response({"error": "Conjunto de recomendações inválido ou inativo."}, status=status.HTTP_404_NOT_FOUND)
+
+        moods_by_id = Mood.objects.in_bulk(mood_ids)
+        if len(moods_by_id) != len(mood_ids):
+            return Response({"error": "Um ou mais moods são inválidos."}, status=status.HTTP_404_NOT_FOUND)
+        moods = [moods_by_id[mood_id] for mood_id in mood_ids]
+
+        try:
+            created_items = generate_batch_items(user, recommendation_set, moods)
+        except GenerationError as e:
+            return Response({"error": e.message}, status=e.status_code, headers=e.headers)
+
+        record_shown(user, created_items, source='batch')
+
+        response_serializer = RecommendationItemSerializer(created_items, many=True)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+class CreateGenerationJobView(views.APIView):
+    """
+    Enfileira a geração de recomendações para um humor e retorna imediatamente (202).
+    O processamento é feito pelo comando `run_generation_worker`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        request=GenerateMoodRecommendationsSerializer,
+        responses={202: GenerationJobSerializer},
+        description="Enfileira a geração de 3 recomendações para o humor fornecido. Consulte o job em `generation-jobs/<job_id>/`."
+    )
+    def post(self, request, set_id, *args, **kwargs):
+        serializer = GenerateMoodRecommendationsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+
         try:
             recommendation_set = RecommendationSet.objects.get(id=set_id, user=user, is_active=True)
-            mood = Mood.objects.get(id=mood_id)
+            mood = Mood.objects.get(id=serializer.validated_data['mood_id'])
         except RecommendationSet.DoesNotExist:
             return Response({"error": "Conjunto de recomendações inválido ou inativo."}, status=status.HTTP_404_NOT_FOUND)
         except Mood.DoesNotExist:
             return Response({"error": "Mood inválido."}, status=status.HTTP_404_NOT_FOUND)
 
-        profile = user.profile
-        favorite_genres = [pg.genre.name for pg in ProfileGenre.objects.filter(profile=profile)]
-        if not favorite_genres:
+        # Valida já na requisição, para não enfileirar um job que certamente falharia
+        if not ProfileGenre.objects.filter(profile__user=user).exists():
             return Response({"error": "Gêneros favoritos não definidos."}, status=status.HTTP_400_BAD_REQUEST)
 
-        personality_scores = {
-            "openness": profile.openness, "conscientiousness": profile.conscientiousness,
-            "extraversion": profile.extraversion, "agreeableness": profile.agreeableness,
-            "neuroticism": profile.neuroticism,
-        }
-        
-        blacklist_movies = BlacklistedMovie.objects.filter(user=user)
-        blacklist_input = [BlacklistedMovieInput(title=movie.title) for movie in blacklist_movies]
-
-        gemini_input = GeminiInput(
-            preferences=favorite_genres,
-            score=personality_scores,
-            blacklist=blacklist_input,
-            target_mood=mood.name
-        )
+        job = GenerationJob.objects.create(user=user, recommendation_set=recommendation_set, mood=mood)
+        return Response(GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class GenerationJobDetailView(generics.RetrieveAPIView):
+    """
+    Consulta o estado de um job de geração.
+    Aceita `?wait=<segundos>` (long-poll, até 5s): a resposta só volta antes disso se o job terminar.
+    A espera ocupa um worker síncrono, por isso é curta; para esperar mais, o cliente repete a consulta.
+    """
+    serializer_class = GenerationJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    MAX_WAIT_SECONDS = 5
+    POLL_INTERVAL_SECONDS = 0.5
+
+    def get_object(self):
+        job = get_object_or_404(GenerationJob.objects.select_related('mood'), id=self.kwargs['job_id'], user=self.request.user)
 
         try:
-            gemini_service = GeminiService()
-            recommendations_output = gemini_service.get_recommendations(gemini_input)
-            if not recommendations_output or not recommendations_output.recommendations:
-                return Response({"error": "Não foi possível gerar recomendações no momento."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        except Exception as e:
-            print(f"Erro ao chamar o serviço Gemini: {e}")
-            return Response({"error": "Falha na comunicação com o serviço de IA."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            wait = min(float(self.request.query_params.get('wait', 0)), self.MAX_WAIT_SECONDS)
+        except ValueError:
+            wait = 0
+
+        deadline = time.monotonic() + wait
+        pending_statuses = (GenerationJob.Status.PENDING, GenerationJob.Status.RUNNING)
+        while job.status in pending_statuses and time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL_SECONDS)
+            job.refresh_from_db(fields=['status', 'error', 'started_at', 'finished_at'])
+
+        # Carregados só depois da espera, quando o job pode ter terminado
+        prefetch_related_objects([job], items_with_mood())
+        if job.status == GenerationJob.Status.DONE:
+            # Consultas repetidas ao mesmo job não duplicam o histórico
+            record_shown(self.request.user, job.items.all(), source='job')
+        return job
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncGenerateMoodRecommendationsView(View):
+    """
+    Versão assíncrona de `GenerateMoodRecommendationsView`, pensada para rodar via ASGI
+    (`cinemind/asgi.py`). Enquanto espera o Gemini e o TMDb, o worker fica livre para
+    atender outras requisições.
+
+    Por ser uma view nativa do Django (o DRF não suporta views async), a autenticação
+    JWT e as respostas são tratadas manualmente, com o mesmo contrato da versão síncrona.
+    """
 
-        items_to_create = []
+    async def _authenticate(self, request):
         try:
-            mood_rec = recommendations_output.recommendations[0]
-            tmdb_service = TMDbService()
-            movies_from_gemini = mood_rec.movies
-
-            # --- LÓGICA DE OTIMIZAÇÃO APLICADA AQUI ---
-            
-            # 1. Usamos um ThreadPoolExecutor para fazer as chamadas de rede em paralelo
-            with ThreadPoolExecutor(max_workers=len(movies_from_gemini)) as executor:
-                # 2. Submetemos todas as buscas de pôster ao mesmo tempo.
-                #    O `executor.map` mantém a ordem dos resultados.
-                poster_urls = list(executor.map(
-                    lambda movie: tmdb_service.get_poster_url(title=movie.title, year=movie.year),
-                    movies_from_gemini
-                ))
-
-            # 3. Agora que temos todas as URLs, montamos os objetos para salvar no banco
-            for i, movie in enumerate(movies_from_gemini):
-                items_to_create.append(
-                    RecommendationItem(
-                        recommendation_set=recommendation_set,
-                        mood=mood,
-                        external_id=f"tmdb:{movie.title}-{movie.year}",
-                        title=movie.title,
-                        rank=movie.rank,
-                        thumbnail_url=poster_urls[i], # Pegamos a URL da lista de resultados
-                        movie_metadata=json.dumps(movie.model_dump())
-                    )
-                )
-            
-            if items_to_create:
-                created_items = RecommendationItem.objects.bulk_create(items_to_create)
-
-        except (IndexError, KeyError) as e:
-            print(f"Erro de parsing na resposta do Gemini: {e}")
-            return Response({"error": "A resposta do serviço de IA foi malformada."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception as e:
-            print(f"Erro ao processar e salvar recomendações: {e}")
-            return Response({"error": "Ocorreu um erro ao salvar as recomendações."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except exceptions.APIException:
+            return None
+        return result[0] if result else None
+
+    async def post(self, request, set_id, *args, **kwargs):
+        user = await self._authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "As credenciais de autenticação não foram fornecidas ou são inválidas."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "JSON inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = GenerateMoodRecommendationsSerializer(data=payload)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        mood_id = serializer.validated_data['mood_id']
+
+        try:
+            with span("lookup"):
+                recommendation_set = await RecommendationSet.objects.aget(id=set_id, user=user, is_active=True)
+                mood = await Mood.objects.aget(id=mood_id)
+        except RecommendationSet.DoesNotExist:
+            return JsonResponse({"error": "Conjunto de recomendações inválido ou inativo."}, status=status.HTTP_404_NOT_FOUND)
+        except Mood.DoesNotExist:
+            return JsonResponse({"error": "Mood inválido."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            created_items = await agenerate_mood_items(user, recommendation_set, mood)
+        except GenerationError as e:
+            return JsonResponse({"error": e.message}, status=e.status_code, headers=e.headers)
+
+        with span("history"):
+            await sync_to_async(record_shown)(user, created_items, source='generate')
 
         response_serializer = RecommendationItemSerializer(created_items, many=True)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return JsonResponse(response_serializer.data, safe=False, status=status.HTTP_201_CREATED)